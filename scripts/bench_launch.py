@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""End-to-end sandbox launch latency benchmark.
+
+Runs the ``doc/example.py`` flow (unshare, fork, private propagation, bind,
+pivot_root, proc mount, exec) against a tiny rootfs fixture, with 1..N
+concurrent launchers, and reports p50/p95/p99 per phase and in total.
+
+The installed (or ``PYTHONPATH``) tmsyscall is benchmarked, so results of
+different library versions can be compared. Must be run as root:
+
+    sudo python scripts/bench_launch.py --max-concurrency 8 -o new.json
+    python scripts/bench_launch.py --compare old.json new.json
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import tmsyscall
+from tmsyscall.mount import mount, mount_procfs, unmount
+from tmsyscall.mount import MS_BIND, MS_PRIVATE, MS_REC, MNT_DETACH
+from tmsyscall.pivot_root import pivot_root
+from tmsyscall.unshare import unshare
+from tmsyscall.unshare import (
+    CLONE_NEWIPC, CLONE_NEWNET, CLONE_NEWNS, CLONE_NEWPID, CLONE_NEWUTS
+)
+
+#: Phases, in order, as reported.
+PHASES = (
+    'unshare_pid',
+    'fork',
+    'unshare',
+    'make_private',
+    'bind',
+    'pivot_root',
+    'mount_proc',
+    'exec',
+    'total',
+)
+
+#: Program executed inside the sandbox.
+_EXEC = '/bin/true'
+
+_LDD_RE = re.compile(r'(/\S+) \(0x')
+
+
+def version():
+    """Return the version of the tmsyscall under test.
+    """
+    version_file = os.path.join(os.path.dirname(tmsyscall.__file__), 'version')
+    try:
+        with open(version_file) as vfile:
+            return vfile.readline().strip()
+    except EnvironmentError:
+        return 'unknown'
+
+
+def make_rootfs(path):
+    """Build a minimal rootfs able to run :data:`_EXEC`.
+    """
+    for name in ('proc', '.old_root', 'bin'):
+        os.makedirs(os.path.join(path, name))
+
+    binary = os.path.realpath(shutil.which('true'))
+    shutil.copy2(binary, os.path.join(path, _EXEC.lstrip('/')))
+
+    ldd = subprocess.check_output(['ldd', binary]).decode()
+    for lib in _LDD_RE.findall(ldd):
+        dest = os.path.join(path, lib.lstrip('/'))
+        if not os.path.isdir(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        shutil.copy2(lib, dest)
+
+
+def _sandbox(rootfs, timings, report_w):
+    """Child side of a launch: the doc/example.py isolation steps.
+    """
+    timings.append(time.monotonic())
+    unshare(CLONE_NEWNS | CLONE_NEWUTS | CLONE_NEWIPC | CLONE_NEWNET)
+    timings.append(time.monotonic())
+    mount('none', '/', None, MS_REC | MS_PRIVATE)
+    timings.append(time.monotonic())
+    mount(rootfs, rootfs, None, MS_BIND | MS_REC)
+    timings.append(time.monotonic())
+    pivot_root(rootfs, os.path.join(rootfs, '.old_root'))
+    unmount('/.old_root', MNT_DETACH)
+    os.chdir('/')
+    timings.append(time.monotonic())
+    mount_procfs('/')
+    timings.append(time.monotonic())
+
+    # The report pipe is close-on-exec: its EOF marks the end of exec.
+    os.write(report_w, json.dumps(timings).encode())
+    os.execv(_EXEC, [_EXEC])
+
+
+def _launch(rootfs):
+    """Launch one sandbox, return the duration of each phase.
+    """
+    report_r, report_w = os.pipe2(os.O_CLOEXEC)
+    start = time.monotonic()
+    launcher = os.fork()
+    if launcher == 0:
+        code = 1
+        try:
+            os.close(report_r)
+            timings = [time.monotonic()]
+            unshare(CLONE_NEWPID)
+            timings.append(time.monotonic())
+            child = os.fork()
+            if child == 0:
+                _sandbox(rootfs, timings, report_w)
+            os.close(report_w)
+            _, status = os.waitpid(child, 0)
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+
+    os.close(report_w)
+    data = b''
+    while True:
+        chunk = os.read(report_r, 65536)
+        if not chunk:
+            break
+        data += chunk
+    exec_end = time.monotonic()
+    os.close(report_r)
+    _, status = os.waitpid(launcher, 0)
+    end = time.monotonic()
+    if status != 0 or not data:
+        raise RuntimeError('Sandbox launch failed: status %r' % status)
+
+    timings = json.loads(data.decode()) + [exec_end]
+    res = dict(
+        (phase, timings[idx + 1] - timings[idx])
+        for idx, phase in enumerate(PHASES[:-1])
+    )
+    res['total'] = end - start
+    return res
+
+
+def _worker(rootfs, iterations, out_w):
+    """Run ``iterations`` launches, write their timings to ``out_w``.
+    """
+    code = 1
+    try:
+        samples = [_launch(rootfs) for _ in range(iterations)]
+        data = json.dumps(samples).encode()
+        while data:
+            data = data[os.write(out_w, data):]
+        code = 0
+    finally:
+        os._exit(code)  # pylint: disable=protected-access
+
+
+def run_level(rootfs, concurrency, iterations):
+    """Run ``concurrency`` parallel workers, return all their samples.
+    """
+    workers = []
+    for _ in range(concurrency):
+        out_r, out_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(out_r)
+            _worker(rootfs, iterations, out_w)
+        os.close(out_w)
+        workers.append((pid, out_r))
+
+    samples = []
+    for pid, out_r in workers:
+        with os.fdopen(out_r, 'rb') as out:
+            data = out.read()
+        _, status = os.waitpid(pid, 0)
+        if status != 0:
+            raise RuntimeError('Benchmark worker failed: status %r' % status)
+        samples.extend(json.loads(data.decode()))
+    return samples
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``.
+    """
+    values = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(samples):
+    """Compute p50/p95/p99 (in milliseconds) of each phase.
+    """
+    res = {}
+    for phase in PHASES:
+        values = [sample[phase] * 1000.0 for sample in samples]
+        res[phase] = {
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'mean': sum(values) / len(values),
+            'count': len(values),
+        }
+    return res
+
+
+def run(max_concurrency, iterations, rootfs=None):
+    """Run the whole concurrency sweep.
+    """
+    tmp_dir = None
+    if rootfs is None:
+        tmp_dir = tempfile.mkdtemp(prefix='bench-rootfs-')
+        rootfs = os.path.join(tmp_dir, 'rootfs')
+        make_rootfs(rootfs)
+
+    try:
+        levels = {}
+        for concurrency in range(1, max_concurrency + 1):
+            samples = run_level(rootfs, concurrency, iterations)
+            levels[str(concurrency)] = summarize(samples)
+            print_level(concurrency, levels[str(concurrency)])
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    return {
+        'version': version(),
+        'kernel': platform.release(),
+        'python': platform.python_version(),
+        'iterations': iterations,
+        'levels': levels,
+    }
+
+
+def print_level(concurrency, summary):
+    print('concurrency %d' % concurrency)
+    print('  %-14s %10s %10s %10s' % ('phase (ms)', 'p50', 'p95', 'p99'))
+    for phase in PHASES:
+        stats = summary[phase]
+        print('  %-14s %10.3f %10.3f %10.3f' % (
+            phase, stats['p50'], stats['p95'], stats['p99']
+        ))
+
+
+def compare(old, new):
+    """Print the p50/p99 change of every phase between two result files.
+    """
+    print('%s (%s) -> %s (%s)' % (
+        old['version'], old['kernel'], new['version'], new['kernel']
+    ))
+    levels = sorted(set(old['levels']) & set(new['levels']), key=int)
+    for level in levels:
+        print('concurrency %s' % level)
+        print('  %-14s %21s %21s' % ('phase (ms)', 'p50', 'p99'))
+        for phase in PHASES:
+            before = old['levels'][level][phase]
+            after = new['levels'][level][phase]
+            cells = []
+            for key in ('p50', 'p99'):
+                delta = (after[key] - before[key]) / before[key] * 100.0 \
+                    if before[key] else 0.0
+                cells.append('%8.3f %+7.1f%%' % (after[key], delta))
+            print('  %-14s %21s %21s' % (phase, cells[0], cells[1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--max-concurrency', type=int, default=4)
+    parser.add_argument('-n', '--iterations', type=int, default=50,
+                        help='launches per worker and concurrency level')
+    parser.add_argument('--rootfs', help='use this rootfs instead of the '
+                        'built-in fixture, it must contain %s' % _EXEC)
+    parser.add_argument('-o', '--output', help='write results as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare(json.load(old), json.load(new))
+        return 0
+
+    results = run(args.max_concurrency, args.iterations, args.rootfs)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+from tmsyscall import capacity
+from tmsyscall.capacity import CapacityCollector
+from tmsyscall.mount import MountEntry, list_mounts
+import os
+import threading
+import time
+
+
+def test_capacity_collector():
+    with CapacityCollector(workers=2) as collector:
+        res = collector.collect()
+    assert res
+    assert not [x for x in res if x.entry.fs_type in ('proc', 'sysfs')]
+    root = [x for x in res if x.entry.target == '/'][-1]
+    assert root.status == capacity.STATUS_OK
+    assert root.total >= root.used >= 0
+    assert root.files is not None
+
+
+def test_capacity_quarantine(monkeypatch):
+    statvfs = os.statvfs
+    release = threading.Event()
+
+    def _statvfs(path):
+        if path == '/hung':
+            release.wait()
+        return statvfs('/')
+
+    monkeypatch.setattr(capacity.os, 'statvfs', _statvfs)
+    hung = MountEntry('srv:/', '/hung', 'nfs4', set(), 100, 1)
+    good = [x for x in list_mounts() if x.target == '/'][-1]
+
+    collector = CapacityCollector(workers=1, timeout=0.2)
+    start = time.time()
+    res = collector.collect([hung, good])
+    assert time.time() - start < 2
+    assert [x.status for x in res] == ['timeout', 'ok']
+    assert collector.quarantined == set([('srv:/', '/hung')])
+
+    res = collector.collect([hung, good])
+    assert [x.status for x in res] == ['quarantined', 'ok']
+
+    release.set()
+    for _ in range(100):
+        if not collector.quarantined:
+            break
+        time.sleep(0.01)
+    assert not collector.quarantined
+    collector.close()
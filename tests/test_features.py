@@ -0,0 +1,46 @@
+from tmsyscall import features
+import errno
+import os
+import pytest
+
+
+def test_probe_all():
+    probed = features.probe_all()
+    assert sorted(probed) == sorted(features.FEATURES)
+    assert all(isinstance(x, bool) for x in probed.values())
+    # openat2(2) predates most other probed calls.
+    if probed[features.STATMOUNT]:
+        assert probed[features.OPENAT2]
+
+
+def test_overrides():
+    probed = features.supported(features.OPENAT2)
+    with features.overridden(features.OPENAT2, not probed):
+        assert features.supported(features.OPENAT2) == (not probed)
+        with features.overridden(features.OPENAT2, probed):
+            assert features.supported(features.OPENAT2) == probed
+        assert features.supported(features.OPENAT2) == (not probed)
+    assert features.supported(features.OPENAT2) == probed
+
+    with pytest.raises(ValueError):
+        features.set_supported('nonexistent', True)
+    with pytest.raises(ValueError):
+        features.mark_unsupported('nonexistent')
+
+
+def test_mark_unsupported():
+    features.mark_unsupported(features.LISTMOUNT)
+    assert not features.supported(features.LISTMOUNT)
+    features.reset()
+    assert features.probe_all() == features.probe_all()
+
+
+def test_statx_mnt_id_denied(monkeypatch):
+    def _denied(*_args):
+        raise OSError(errno.EPERM, os.strerror(errno.EPERM))
+    monkeypatch.setattr(features.statx, 'statx', _denied)
+    features.reset()
+    try:
+        assert not features.supported(features.STATX_MNT_ID)
+    finally:
+        features.reset()
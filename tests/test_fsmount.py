@@ -0,0 +1,31 @@
+from tmsyscall.fsmount import idmapped_bind
+from tmsyscall.mount import list_mounts, mount_tmpfs, unmount
+from tmsyscall.unshare import userns_fd
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+
+
+def test_idmapped_bind():
+    tmp_dir = mkdtemp()
+    source = os.path.join(tmp_dir, 'source')
+    target = os.path.join(tmp_dir, 'target')
+    os.mkdir(source)
+    os.mkdir(target)
+    mount_tmpfs(source, '/')
+    open(os.path.join(source, 'file'), 'w').close()
+
+    nsfd = userns_fd([(0, 100000, 65536)])
+    try:
+        idmapped_bind(source, target, nsfd)
+    finally:
+        os.close(nsfd)
+
+    assert 'idmapped' in [x for x in list_mounts() if x.target == target][0] \
+        .mnt_opts
+    assert os.stat(os.path.join(source, 'file')).st_uid == 0
+    assert os.stat(os.path.join(target, 'file')).st_uid == 100000
+
+    unmount(target)
+    unmount(source)
+    rmtree(tmp_dir)
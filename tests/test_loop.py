@@ -0,0 +1,61 @@
+from tmsyscall.loop import SharedLoopDevices, attach, mount_image
+from tmsyscall.mount import list_mounts, unmount
+import errno
+import os
+import pytest
+import subprocess
+from tempfile import mkdtemp
+from shutil import rmtree
+
+
+def _make_image(tmp_dir):
+    image = os.path.join(tmp_dir, 'image.ext4')
+    with open(image, 'wb') as image_file:
+        image_file.truncate(8 << 20)
+    subprocess.check_call(['mkfs.ext4', '-q', '-F', image])
+    return image
+
+
+def _backing(device):
+    with open('/sys/block/loop%d/loop/backing_file' % device.number) as bfile:
+        return bfile.read().strip()
+
+
+def test_loop_device():
+    tmp_dir = mkdtemp()
+    image = _make_image(tmp_dir)
+
+    with attach(image, direct_io=True) as device:
+        assert _backing(device) == image
+        assert device.status().lo_flags & 1
+
+    target = os.path.join(tmp_dir, 'target')
+    os.mkdir(target)
+    path = mount_image(image, target, 'ext4')
+    mount_info = [x for x in list_mounts() if x.target == target]
+    assert mount_info[0].source == path
+    assert 'ro' in mount_info[0].mnt_opts
+    unmount(target)
+
+    shared = SharedLoopDevices()
+    targets = [os.path.join(tmp_dir, 'shared%d' % idx) for idx in range(3)]
+    devices = []
+    for target in targets:
+        os.mkdir(target)
+        devices.append(shared.mount(image, target, 'ext4'))
+    assert len(set(x.path for x in devices)) == 1
+    assert len(shared) == 1
+    for target in targets:
+        shared.unmount(target)
+    assert not len(shared)
+
+    rmtree(tmp_dir)
+
+
+def test_loop_bad_block_size():
+    tmp_dir = mkdtemp()
+    image = _make_image(tmp_dir)
+    with pytest.raises(OSError) as err:
+        attach(image, block_size=1000)
+    assert err.value.errno == errno.EINVAL
+    rmtree(tmp_dir)
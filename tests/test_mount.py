@@ -1,4 +1,7 @@
-from tmsyscall.mount import mount, unmount, list_mounts
+from tmsyscall import features
+from tmsyscall.mount import mount, unmount, list_mounts, MountSpec
+from tmsyscall.mount import is_mountpoint, mount_of
+import os
 from tempfile import mkdtemp
 from shutil import rmtree
 
@@ -27,3 +30,61 @@ def test_mount():
     mount_record = [x for x in list_mounts() if x.target == tmp_dir]
     assert not mount_record
     rmtree(tmp_dir)
+
+
+def test_mount_spec():
+    tmp_dir = mkdtemp()
+    spec = MountSpec("/proc", "/proc", "proc").rebase(tmp_dir)
+    assert spec.target == tmp_dir.encode() + b'/proc'
+    assert spec.rebase('/') == MountSpec("/proc", "/proc", "proc")
+
+    os.mkdir(os.path.join(tmp_dir, 'proc'))
+    spec.apply()
+
+    mount_info = [x for x in list_mounts()
+                  if x.target == os.path.join(tmp_dir, 'proc')]
+    assert len(mount_info) == 1
+    assert mount_info[0].fs_type == 'proc'
+
+    unmount(os.path.join(tmp_dir, 'proc'))
+    rmtree(tmp_dir)
+
+
+def test_mount_of():
+    tmp_dir = mkdtemp()
+    assert not is_mountpoint(tmp_dir)
+    mount("tmpfs", tmp_dir, "tmpfs", 0, "size=1m")
+    assert is_mountpoint(tmp_dir)
+
+    entry = mount_of(os.path.join(tmp_dir, '.'))
+    mount_info = [x for x in list_mounts() if x.target == tmp_dir][0]
+    assert entry.mount_id == mount_info.mount_id
+    assert entry.parent_id == mount_info.parent_id
+    assert entry.target == tmp_dir
+    assert entry.source == 'tmpfs'
+    assert entry.fs_type == 'tmpfs'
+    assert entry.dev == mount_info.dev
+    assert entry.mnt_opts == mount_info.mnt_opts
+    with features.overridden(features.STATMOUNT, False):
+        assert mount_of(tmp_dir) == entry
+    with features.overridden(features.STATX_MNT_ID, False):
+        assert mount_of(os.path.join(tmp_dir, '.')) == entry
+        assert mount_of('/proc/self').target == '/proc'
+
+    unmount(tmp_dir)
+    rmtree(tmp_dir)
+
+
+def test_mount_of_reused_id():
+    first_dir = mkdtemp()
+    second_dir = mkdtemp()
+    with features.overridden(features.STATMOUNT, False):
+        mount("tmpfs", first_dir, "tmpfs", 0, "size=1m")
+        assert mount_of(first_dir).target == first_dir
+        unmount(first_dir)
+        # The mount ID of the first mount is free to be reused.
+        mount("tmpfs", second_dir, "tmpfs", 0, "size=1m")
+        assert mount_of(second_dir).target == second_dir
+    unmount(second_dir)
+    rmtree(first_dir)
+    rmtree(second_dir)
@@ -0,0 +1,48 @@
+from tmsyscall.mount import MountEntry, mount, unmount, MS_BIND
+from tmsyscall.mount_index import MountIndex
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+
+_MOUNTINFO = [
+    '20 1 8:1 / / rw - ext4 /dev/sda1 rw',
+    '21 20 0:5 / /proc rw - proc proc rw',
+    '22 20 8:1 /srv/data /mnt/data rw - ext4 /dev/sda1 rw',
+    '23 22 0:30 / /mnt/data/tmp rw - tmpfs tmpfs rw',
+    '24 23 0:31 / /mnt/data/tmp rw - tmpfs tmpfs rw',
+]
+
+
+def test_mount_index():
+    index = MountIndex(
+        [MountEntry.mount_entry_parse(line) for line in _MOUNTINFO]
+    )
+    assert index.containing('/etc/passwd').mount_id == 20
+    assert index.containing('/mnt/data/x/y').mount_id == 22
+    assert index.containing('/mnt/data/tmp/f').mount_id == 24
+    assert index.resolve('/mnt/data/x') == (index.get(22), '/srv/data/x')
+    assert index.get(22).dev == os.makedev(8, 1)
+
+    assert index.is_mountpoint('/proc')
+    assert not index.is_mountpoint('/proc/1')
+    assert not index.is_mountpoint('/mnt')
+    assert [x.mount_id for x in index.submounts('/mnt')] == [22, 23, 24]
+
+    added, removed = index.update(
+        [MountEntry.mount_entry_parse(line) for line in _MOUNTINFO[:3]]
+    )
+    assert not added
+    assert sorted(x.mount_id for x in removed) == [23, 24]
+    assert not index.is_mountpoint('/mnt/data/tmp')
+    assert index.containing('/mnt/data/tmp/f').mount_id == 22
+
+
+def test_mount_index_live():
+    tmp_dir = mkdtemp()
+    index = MountIndex()
+    mount('/proc', tmp_dir, None, MS_BIND)
+    added, _ = index.update()
+    assert [x.target for x in added] == [tmp_dir]
+    assert index.resolve(os.path.join(tmp_dir, 'self'))[1] == '/self'
+    unmount(tmp_dir)
+    rmtree(tmp_dir)
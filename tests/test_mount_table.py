@@ -0,0 +1,39 @@
+from tmsyscall.mount import list_mounts, mount_tmpfs, unmount
+from tmsyscall.mount_table import MountTable, MountTablePublisher
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+
+
+def test_mount_table():
+    tmp_dir = mkdtemp()
+    path = os.path.join(tmp_dir, 'mounts')
+    publisher = MountTablePublisher(path)
+    assert publisher.publish()
+    assert not publisher.publish()
+
+    table = MountTable(path)
+    assert table.generation == 1
+    assert sorted(table) == sorted(list_mounts())
+    assert not table.refresh()
+
+    scratch = os.path.join(tmp_dir, 'scratch')
+    os.mkdir(scratch)
+    mount_tmpfs(scratch, '/', size='1m')
+    assert publisher.wait(0)
+    assert publisher.publish()
+    publisher.close()
+
+    views = table.entries()
+    assert table.refresh()
+    assert table.generation == 2
+    entry = [x for x in table if x.target == scratch][0]
+    assert entry.fs_type == 'tmpfs'
+    assert 'size=1024k' in entry.mnt_opts
+    assert entry.copy() == entry
+    # Views of the previous generation stay readable.
+    assert scratch not in [x.target for x in views]
+
+    unmount(scratch)
+    assert MountTablePublisher(path).generation == 2
+    rmtree(tmp_dir)
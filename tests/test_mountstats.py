@@ -0,0 +1,58 @@
+from tmsyscall.mount import MountEntry
+from tmsyscall.mountstats import Sample, diff, iter_mountstats, join, sample
+
+MOUNTSTATS = '''\
+device proc mounted on /proc with fstype proc
+device srv:/export mounted on /mnt/nfs with fstype nfs4 statvers=1.1
+\topts:\trw,vers=4.2,rsize=1048576,hard
+\tage:\t{age}
+\tevents:\t1 2 3
+\tbytes:\t{read} 2048 0 0 {read} 2048 1 1
+\tRPC iostats version: 1.1  p/v: 100003/4 (nfs)
+\txprt:\ttcp 0 1 1 0 0 10 10 0 10 0 2 0 0
+\tper-op statistics
+\t        NULL: 0 0 0 0 0 0 0 0 0
+\t        READ: {ops} {ops} 0 1000 {read} 0 {rtt} {rtt} 0
+\t       WRITE: 2 2 0 2400 200 0 8 9 1
+
+'''
+
+
+def _stats(age, ops, read, rtt):
+    text = MOUNTSTATS.format(age=age, ops=ops, read=read, rtt=rtt)
+    return list(iter_mountstats(stream=text.splitlines(True)))
+
+
+def test_iter_mountstats():
+    proc, nfs = _stats(10, 4, 4096, 20)
+    assert proc.statvers is None and not proc.ops
+    assert nfs.key == ('srv:/export', '/mnt/nfs')
+    assert nfs.opts['vers'] == '4.2' and nfs.opts['hard'] is None
+    assert nfs.age == 10
+    assert nfs.bytes['normal_read'] == 4096
+    assert list(nfs.ops) == ['NULL', 'READ', 'WRITE']
+    assert nfs.ops['READ'].rtt_ms == 20
+    assert nfs.ops['WRITE'].errors == 1
+
+    entry = MountEntry('srv:/export', '/mnt/nfs', 'nfs4', set(), 40, 1)
+    join([proc, nfs], [entry])
+    assert nfs.entry is entry and proc.entry is None
+
+    before = Sample(100.0, {nfs.key: nfs})
+    after = Sample(102.0, {nfs.key: _stats(12, 14, 14096, 120)[1]})
+    rates = diff(before, after)[nfs.key]
+    assert rates.bytes['normal_read'] == 5000
+    assert list(rates.ops) == ['READ']
+    assert rates.ops['READ'].ops == 5
+    assert rates.ops['READ'].rtt_ms == 10
+
+    # Remounted between the samples.
+    after = Sample(102.0, {nfs.key: _stats(1, 14, 14096, 120)[1]})
+    assert not diff(before, after)
+
+
+def test_sample():
+    stats = sample(only_stats=False)
+    assert stats.mounts
+    assert all(x.entry is not None for x in stats.mounts.values()
+               if x.mount_point == '/proc')
@@ -0,0 +1,81 @@
+from tmsyscall import features
+from tmsyscall.mount import MountEntry, list_mounts, mount, mount_tmpfs
+from tmsyscall.mount import unmount, MS_BIND
+from tmsyscall.propagation import (
+    peer_groups, propagation_targets, set_propagation
+)
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+
+
+def test_mount_entry_propagation():
+    entry = MountEntry.mount_entry_parse(
+        '36 35 98:0 /mnt1 /mnt2 rw,noatime shared:2 master:1 '
+        'propagate_from:3 - ext3 /dev/root rw,errors=continue'
+    )
+    assert (entry.shared_id, entry.master_id, entry.propagate_from) == \
+        (2, 1, 3)
+    assert entry.propagation == 'shared,slave'
+    assert entry != MountEntry.mount_entry_parse(
+        '36 35 98:0 /mnt1 /mnt2 rw,noatime shared:2 master:1 '
+        '- ext3 /dev/root rw,errors=continue'
+    )
+    entry = MountEntry.mount_entry_parse(
+        '36 35 98:0 /mnt1 /mnt2 rw unbindable - ext3 /dev/root rw'
+    )
+    assert entry.propagation == 'unbindable'
+    assert entry.shared_id is None
+
+
+def test_propagation_targets():
+    def _entry(mount_id, **kwargs):
+        return MountEntry('none', '/%d' % mount_id, 'tmpfs', set(),
+                          mount_id, 1, **kwargs)
+
+    entries = [
+        _entry(10, shared_id=1),
+        _entry(11, shared_id=1),
+        _entry(12, master_id=1, shared_id=2),
+        _entry(13, master_id=2),
+        _entry(14, master_id=3),
+        _entry(15),
+    ]
+    assert [x.mount_id for x in peer_groups(entries)[1]] == [10, 11]
+    targets = propagation_targets(entries[0], entries)
+    assert [x.mount_id for x in targets] == [11, 12, 13]
+    assert not propagation_targets(entries[-1], entries)
+
+
+def _set_propagation(setattr_supported):
+    tmp_dir = mkdtemp()
+    mount_tmpfs(tmp_dir, '/')
+    os.mkdir(os.path.join(tmp_dir, 'sub'))
+    mount_tmpfs(tmp_dir, '/sub')
+    with features.overridden(features.MOUNT_SETATTR, setattr_supported):
+        set_propagation(tmp_dir, 'shared')
+    peers = os.path.join(tmp_dir, 'sub', 'peer')
+    os.mkdir(peers)
+    mount(os.path.join(tmp_dir, 'sub'), peers, None, MS_BIND)
+
+    mounts = dict((x.target, x) for x in list_mounts())
+    assert mounts[tmp_dir].propagation == 'shared'
+    sub = mounts[os.path.join(tmp_dir, 'sub')]
+    assert sub.propagation == 'shared'
+    assert mounts[peers].shared_id == sub.shared_id
+    assert mounts[peers] in propagation_targets(sub)
+
+    with features.overridden(features.MOUNT_SETATTR, setattr_supported):
+        set_propagation(tmp_dir, 'private')
+    assert not [x for x in list_mounts()
+                if x.target.startswith(tmp_dir) and x.shared_id]
+
+    unmount(peers)
+    unmount(os.path.join(tmp_dir, 'sub'))
+    unmount(tmp_dir)
+    rmtree(tmp_dir)
+
+
+def test_set_propagation():
+    _set_propagation(True)
+    _set_propagation(False)
@@ -0,0 +1,25 @@
+from tmsyscall.mount import list_mounts, mount
+from tmsyscall.reaper import MountReaper
+import os
+from tempfile import mkdtemp
+
+
+def test_reaper():
+    tmp_dir = mkdtemp()
+    os.makedirs(os.path.join(tmp_dir, 'a', 'b'))
+    mount('tmpfs', os.path.join(tmp_dir, 'a'), 'tmpfs')
+    os.makedirs(os.path.join(tmp_dir, 'a', 'c'))
+    mount('tmpfs', os.path.join(tmp_dir, 'a', 'c'), 'tmpfs')
+    open(os.path.join(tmp_dir, 'a', 'c', 'busy'), 'w').close()
+
+    with MountReaper(max_backlog=1) as reaper:
+        reaper.reap(tmp_dir)
+        assert not [x for x in list_mounts() if x.target.startswith(tmp_dir)]
+        reaper.join()
+        metrics = reaper.metrics()
+
+    assert not os.path.exists(tmp_dir)
+    assert metrics['detached'] == 1
+    assert metrics['removed'] == 1
+    assert metrics['backlog'] == 0
+    assert metrics['failed'] == 0
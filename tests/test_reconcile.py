@@ -0,0 +1,69 @@
+from tmsyscall.mount import MountSpec, list_mounts, unmount, MS_BIND, MS_RDONLY
+from tmsyscall.mount import MS_NOSUID, MS_REMOUNT
+from tmsyscall.reconcile import plan_mounts, reconcile
+import os
+from tempfile import mkdtemp
+from shutil import rmtree
+
+
+def _targets(root):
+    return sorted(x.target for x in list_mounts() if x.target.startswith(root))
+
+
+def test_reconcile():
+    tmp_dir = mkdtemp()
+    for name in ('a', 'b', 'c'):
+        os.mkdir(os.path.join(tmp_dir, name))
+    desired = [
+        MountSpec('tmpfs', '/a', 'tmpfs', 0, size='1m').rebase(tmp_dir),
+        MountSpec('tmpfs', '/b', 'tmpfs').rebase(tmp_dir),
+    ]
+
+    plan = reconcile(desired, root=tmp_dir)
+    assert len(plan.mounts) == 2
+    assert _targets(tmp_dir) == [os.path.join(tmp_dir, 'a'),
+                                 os.path.join(tmp_dir, 'b')]
+
+    # Applying the same state again is a no-op.
+    assert not plan_mounts(desired, root=tmp_dir)
+
+    # Drift: a flag which was not asked for.
+    MountSpec('tmpfs', '/a', 'tmpfs', MS_REMOUNT | MS_NOSUID,
+              size='1m').rebase(tmp_dir).apply()
+    plan = reconcile(desired, root=tmp_dir)
+    assert len(plan.remounts) == 1 and not plan.mounts
+    assert not plan_mounts(desired, root=tmp_dir)
+
+    # Drift: an extra mount, and changed options.
+    MountSpec('tmpfs', '/c', 'tmpfs').rebase(tmp_dir).apply()
+    desired[1] = MountSpec('tmpfs', '/b', 'tmpfs', MS_RDONLY).rebase(tmp_dir)
+    plan = reconcile(desired, root=tmp_dir)
+    assert [x.target for x in plan.unmounts] == [os.path.join(tmp_dir, 'c')]
+    assert len(plan.remounts) == 1
+    assert not plan.mounts
+    assert not plan_mounts(desired, root=tmp_dir)
+
+    for target in _targets(tmp_dir):
+        unmount(target)
+    rmtree(tmp_dir)
+
+
+def test_reconcile_bind():
+    tmp_dir = mkdtemp()
+    os.mkdir(os.path.join(tmp_dir, 'proc'))
+    desired = [
+        MountSpec('/proc/sys', '/proc', None, MS_BIND).rebase(tmp_dir),
+    ]
+    reconcile(desired, root=tmp_dir)
+    assert not plan_mounts(desired, root=tmp_dir)
+
+    # Same target, different bind source: replaced.
+    desired = [
+        MountSpec('/proc/tty', '/proc', None, MS_BIND).rebase(tmp_dir),
+    ]
+    plan = plan_mounts(desired, root=tmp_dir)
+    assert len(plan.unmounts) == 1 and len(plan.mounts) == 1
+
+    for target in _targets(tmp_dir):
+        unmount(target)
+    rmtree(tmp_dir)
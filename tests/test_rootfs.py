@@ -0,0 +1,81 @@
+from tmsyscall import features
+from tmsyscall.mount import list_mounts, mount_bind, unmount
+from tmsyscall.rootfs import RootfsBuilder
+from tmsyscall.utils import mkfile_safe
+import os
+import pytest
+from tempfile import mkdtemp
+from shutil import rmtree
+
+
+def _build(newroot, openat2_supported):
+    os.symlink('/etc', os.path.join(newroot, 'escape'))
+    with features.overridden(features.OPENAT2, openat2_supported):
+        with RootfsBuilder(newroot) as builder:
+            created = builder.make_mountpoints([
+                ('/usr/lib', True),
+                ('/usr/bin', True),
+                ('/etc/resolv.conf', False),
+                ('/usr', True),
+            ])
+            assert created == 4
+            assert not builder.mkfile('etc/resolv.conf')
+            assert builder.mkdir('/usr/share')
+            with pytest.raises(OSError):
+                builder.mkdir('/escape/foo')
+            with pytest.raises(OSError):
+                builder.mkfile('/escape')
+            with pytest.raises(ValueError):
+                builder.mkdir('/usr/../..')
+
+    assert os.path.isdir(os.path.join(newroot, 'usr', 'lib'))
+    assert os.path.isfile(os.path.join(newroot, 'etc', 'resolv.conf'))
+    assert not os.path.exists('/etc/foo')
+
+
+def test_rootfs_builder():
+    for openat2_supported in (True, False):
+        newroot = mkdtemp()
+        _build(newroot, openat2_supported)
+        rmtree(newroot)
+
+
+def test_mount_bind_file():
+    newroot = mkdtemp()
+    source = os.path.join(newroot, 'source')
+    assert mkfile_safe(source)
+    assert not mkfile_safe(source)
+
+    with RootfsBuilder(newroot) as builder:
+        mount_bind(newroot, '/etc/hosts', source=source, builder=builder)
+        mount_bind(newroot, '/etc/dir', source='/proc/tty', builder=builder)
+
+    targets = [x.target for x in list_mounts()]
+    for name in ('hosts', 'dir'):
+        target = os.path.join(newroot, 'etc', name)
+        assert target in targets
+        unmount(target)
+    rmtree(newroot)
+
+
+def test_mount_bind_nested():
+    tmp_dir = mkdtemp()
+    newroot = os.path.join(tmp_dir, 'root')
+    os.makedirs(os.path.join(tmp_dir, 'src', 'usr', 'lib'))
+    os.mkdir(newroot)
+    source = os.path.join(tmp_dir, 'file')
+    assert mkfile_safe(source)
+
+    with RootfsBuilder(newroot) as builder:
+        assert builder.mkdir('/usr/lib')
+        mount_bind(newroot, '/usr', os.path.join(tmp_dir, 'src', 'usr'),
+                   read_only=False, builder=builder)
+        # Created in the bind mount, not in the directory it hides.
+        mount_bind(newroot, '/usr/lib/x', source=source, builder=builder)
+
+    assert os.path.isfile(os.path.join(tmp_dir, 'src', 'usr', 'lib', 'x'))
+    target = os.path.join(newroot, 'usr', 'lib', 'x')
+    assert target in [x.target for x in list_mounts()]
+    unmount(target)
+    unmount(os.path.join(newroot, 'usr'))
+    rmtree(tmp_dir)
@@ -0,0 +1,76 @@
+from tmsyscall.backend import use_backend
+from tmsyscall.mount import MountSpec, cleanup_mounts, list_mounts, mount
+from tmsyscall.mount import mount_bind, unmount
+from tmsyscall.mount import MS_BIND, MS_PRIVATE, MS_REC, MNT_DETACH
+from tmsyscall.pivot_root import pivot_root
+from tmsyscall.reconcile import plan_mounts
+from tmsyscall.simulate import SimulatedBackend, measure
+from tmsyscall.unshare import unshare, CLONE_NEWNS
+import errno
+import os
+import pytest
+
+
+def _targets():
+    return [x.target for x in list_mounts()]
+
+
+def test_simulated_setup():
+    sim = SimulatedBackend()
+    with use_backend(sim):
+        unshare(CLONE_NEWNS)
+        mount('none', '/', None, MS_REC | MS_PRIVATE)
+        mount('/srv/rootfs', '/srv/rootfs', None, MS_BIND | MS_REC)
+        mount('tmpfs', '/srv/rootfs/tmp', 'tmpfs', 0, 'size=1m')
+        with pytest.raises(OSError) as err:
+            unmount('/srv/rootfs')
+        assert err.value.errno == errno.EBUSY
+
+        pivot_root('/srv/rootfs', '/srv/rootfs/.old_root')
+        unmount('/.old_root', MNT_DETACH)
+        mount('proc', '/proc', 'proc')
+
+        assert _targets() == ['/', '/tmp', '/proc']
+        tmp = [x for x in list_mounts() if x.target == '/tmp'][0]
+        assert tmp.fs_type == 'tmpfs'
+        assert 'size=1m' in tmp.mnt_opts
+        assert [x for x in list_mounts() if x.target == '/'][0].root == \
+            '/srv/rootfs'
+
+    assert sim.syscalls['mount'] == 4
+    assert sim.syscalls['umount2'] == 1
+    assert sim.path_lookups > 0
+    assert '/srv/rootfs' not in _targets()
+
+
+def test_simulated_cost():
+    sim = SimulatedBackend()
+    with use_backend(sim):
+        for idx in range(100):
+            mount('tmpfs', '/c/%d' % idx, 'tmpfs')
+    desired = [MountSpec('tmpfs', '/c/%d' % idx, 'tmpfs') for idx in range(50)]
+
+    plan, stats = measure(plan_mounts, sim, desired, root='/c')
+    assert len(plan.unmounts) == 50 and not plan.mounts
+    assert stats['total_syscalls'] == 0
+
+    _, stats = measure(lambda: plan.execute(), sim)
+    assert stats['syscalls'] == {'umount': 50}
+    _, stats = measure(cleanup_mounts, sim, ['/'])
+    assert stats['syscalls'] == {'umount': 100}
+    assert len(sim.mounts) == 101
+
+
+def test_simulated_mount_bind():
+    sim = SimulatedBackend()
+    with use_backend(sim):
+        mount_bind('/nonexistent-root', '/etc', '/srv/etc')
+        mount_bind('/nonexistent-root', '/usr', read_only=False)
+
+    assert not os.path.exists('/nonexistent-root')
+    assert sim.syscalls == {'mount': 3, 'mkdirat': 2}
+    with use_backend(sim):
+        etc = [x for x in list_mounts()
+               if x.target == '/nonexistent-root/etc'][0]
+    assert etc.root == '/srv/etc'
+    assert 'ro' in etc.mnt_opts
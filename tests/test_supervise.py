@@ -0,0 +1,49 @@
+from tmsyscall.supervise import Supervisor
+import asyncio
+import os
+import signal
+import time
+
+
+def _child(supervisor, code=None):
+    child = supervisor.fork()
+    if child == 0:
+        if code is None:
+            time.sleep(60)
+        os._exit(code or 0)
+    return child
+
+
+def test_supervisor():
+    with Supervisor() as supervisor:
+        children = [_child(supervisor, code) for code in (1, 2, 3)]
+        sleeper = _child(supervisor)
+        assert len(supervisor) == 4
+
+        exited = []
+        while len(exited) < 3:
+            exited.extend(supervisor.poll(5))
+        assert sorted(x.returncode for x in exited) == [1, 2, 3]
+        assert all(x.pidfd is None for x in children)
+        assert not supervisor.kill(children[0])
+
+        assert supervisor.kill(sleeper, signal.SIGKILL)
+        assert supervisor.wait(sleeper, 5) == -signal.SIGKILL
+        assert not len(supervisor)
+
+
+def test_supervisor_asyncio():
+    loop = asyncio.new_event_loop()
+    exited = []
+    with Supervisor() as supervisor:
+        def _exited(child):
+            exited.append(child.returncode)
+            if not len(supervisor):
+                loop.stop()
+
+        supervisor.attach(loop, _exited)
+        for code in range(4):
+            _child(supervisor, code)
+        loop.run_forever()
+    loop.close()
+    assert sorted(exited) == [0, 1, 2, 3]
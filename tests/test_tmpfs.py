@@ -0,0 +1,65 @@
+from tmsyscall.mount import list_mounts, mount_tmpfs, unmount
+from tmsyscall.tmpfs import TmpfsInstance, TmpfsPool
+import errno
+import os
+import pytest
+from tempfile import mkdtemp
+from shutil import rmtree
+from six.moves import queue
+
+
+def _mount_opts(target):
+    mount_info = [x for x in list_mounts() if x.target == target]
+    return mount_info[-1].mnt_opts if mount_info else None
+
+
+def test_mount_tmpfs():
+    tmp_dir = mkdtemp()
+    mount_tmpfs(tmp_dir, '/', size=1 << 20, mode=0o700)
+    mnt_opts = _mount_opts(tmp_dir)
+    assert set(['size=1024k', 'mode=700', 'nodev', 'noexec']) <= mnt_opts
+    unmount(tmp_dir)
+    rmtree(tmp_dir)
+
+    with pytest.raises(ValueError):
+        mount_tmpfs(tmp_dir, '/', huge='sometimes')
+
+
+def test_tmpfs_pool():
+    tmp_dir = mkdtemp()
+    with TmpfsPool(tmp_dir, 1, size='1m') as pool:
+        with pool.acquire(size='2m') as scratch:
+            assert 'size=2048k' in _mount_opts(scratch.path)
+            open(os.path.join(scratch.path, 'data'), 'w').close()
+            with pytest.raises(queue.Empty):
+                pool.acquire(timeout=0)
+
+        scratch = pool.acquire()
+        assert os.listdir(scratch.path) == []
+        assert 'size=1024k' in _mount_opts(scratch.path)
+        pool.release(scratch)
+
+    assert _mount_opts(os.path.join(tmp_dir, '0')) is None
+    rmtree(tmp_dir)
+
+
+def test_tmpfs_pool_reset_failure(monkeypatch):
+    tmp_dir = mkdtemp()
+    with TmpfsPool(tmp_dir, 1, size='1m') as pool:
+        scratch = pool.acquire()
+
+        mount = TmpfsInstance.mount
+
+        def _fail(instance):
+            # Mounted, but failing afterwards.
+            mount(instance)
+            raise OSError(errno.ENOMEM, 'No memory')
+
+        monkeypatch.setattr(TmpfsInstance, 'mount', _fail)
+        with pytest.raises(OSError):
+            pool.release(scratch)
+        assert _mount_opts(scratch.path) is None
+        with pytest.raises(queue.Empty):
+            pool.acquire(timeout=0)
+
+    rmtree(tmp_dir)
@@ -0,0 +1,37 @@
+import json
+import tmsyscall
+from tmsyscall.mount import mount, unmount
+from tempfile import mkdtemp
+from shutil import rmtree
+
+
+def test_trace():
+    tmp_dir = mkdtemp()
+    with tmsyscall.trace() as trace:
+        mount("tmpfs", tmp_dir, "tmpfs", 0, "size=1m")
+        unmount(tmp_dir)
+        try:
+            unmount(tmp_dir)
+        except OSError:
+            pass
+    rmtree(tmp_dir)
+
+    assert [x.name for x in trace] == ['mount', 'umount', 'umount']
+    assert trace.records[0].args[1] == tmp_dir.encode()
+    assert trace.records[0].errno == 0
+    assert trace.records[2].errno != 0
+
+    events = json.loads(json.dumps(trace.to_chrome_trace()))['traceEvents']
+    assert events[0]['ph'] == 'X'
+    assert events[0]['args']['args'][1] == tmp_dir
+    assert 'error' in events[2]['args']
+
+
+def test_trace_inactive():
+    with tmsyscall.trace() as trace:
+        pass
+    tmp_dir = mkdtemp()
+    mount("tmpfs", tmp_dir, "tmpfs")
+    unmount(tmp_dir)
+    rmtree(tmp_dir)
+    assert not trace.records
@@ -1,10 +1,78 @@
 from __future__ import print_function
+from tmsyscall import features
 from tmsyscall.unshare import unshare, CLONE_NEWPID, CLONE_NEWNS
-from tmsyscall.mount import mount, list_mounts
+from tmsyscall.unshare import CLONE_NEWNET, CLONE_NEWUTS, NamespaceExecutor
+from tmsyscall.mount import mount, list_mounts, MS_PRIVATE, MS_REC
+from tmsyscall.net import link_flags, loopback_up, IFF_UP
+from tmsyscall.uts import sethostname
 import os
+import pytest
+import socket
 from tempfile import mkdtemp
 
-def test_unshare():
+
+def _mount_targets():
+    return [x.target for x in list_mounts()]
+
+
+def test_namespace_bootstrap():
+    child_pid = os.fork()
+    if child_pid == 0:
+        code = 1
+        try:
+            unshare(CLONE_NEWNET | CLONE_NEWUTS)
+            assert not link_flags('lo') & IFF_UP
+            loopback_up()
+            assert link_flags('lo') & IFF_UP
+            sethostname('bootstrap')
+            assert socket.gethostname() == 'bootstrap'
+            code = 0
+        finally:
+            os._exit(code)
+
+    _, status = os.waitpid(child_pid, 0)
+    assert status == 0
+    assert socket.gethostname() != 'bootstrap'
+
+
+def _namespace_executor():
+    tmp_dir = mkdtemp()
+    ready_r, ready_w = os.pipe()
+    done_r, done_w = os.pipe()
+    child_pid = os.fork()
+    if child_pid == 0:
+        try:
+            unshare(CLONE_NEWNS | CLONE_NEWNET | CLONE_NEWUTS)
+            mount('none', '/', None, MS_REC | MS_PRIVATE)
+            mount("tmpfs", tmp_dir, "tmpfs")
+            socket.sethostname('nsexec')
+            os.write(ready_w, b'x')
+            os.read(done_r, 1)
+        finally:
+            os._exit(0)
+
+    os.read(ready_r, 1)
+    try:
+        with NamespaceExecutor(child_pid) as executor:
+            assert executor.submit(socket.gethostname).result() == 'nsexec'
+            assert tmp_dir in executor.submit_mount(_mount_targets).result()
+            with pytest.raises(OSError):
+                executor.submit_mount(os.listdir, '/nonexistent').result()
+        assert socket.gethostname() != 'nsexec'
+        assert tmp_dir not in _mount_targets()
+    finally:
+        os.write(done_w, b'x')
+        os.waitpid(child_pid, 0)
+        os.rmdir(tmp_dir)
+
+
+def test_namespace_executor():
+    for setns_pidfd in (True, False):
+        with features.overridden(features.SETNS_PIDFD, setns_pidfd):
+            _namespace_executor()
+
+
+def _unshare_pid():
 
     unshare(CLONE_NEWPID)
     child_pid = os.fork()
@@ -15,7 +83,24 @@ def test_unshare():
         mount("tmpfs", tmp_dir, "tmpfs", 0, "size=16m")
         mount_info = [x for x in list_mounts() if x.target == tmp_dir]
         assert mount_info
+        os._exit(0)
     else:
-        _, _ = os.waitpid(child_pid, 0)
+        _, status = os.waitpid(child_pid, 0)
+        assert status == 0
         mount_info = [x for x in list_mounts() if x.target == tmp_dir]
         assert not mount_info
+
+
+def test_unshare():
+    # The PID namespace is unshared in a child: a process whose children go
+    # into another PID namespace can no longer start threads.
+    child_pid = os.fork()
+    if child_pid == 0:
+        code = 1
+        try:
+            _unshare_pid()
+            code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(child_pid, 0)
+    assert status == 0
@@ -0,0 +1,70 @@
+from tmsyscall.mount import mount, mount_tmpfs, unmount, MS_BIND
+from tmsyscall.utils import rmtree_safe
+import errno
+import os
+import pytest
+import threading
+from tempfile import mkdtemp
+
+
+def _make_tree(path, width, depth):
+    for idx in range(width):
+        open(os.path.join(path, 'file%d' % idx), 'w').close()
+    os.symlink('/etc/hosts', os.path.join(path, 'link'))
+    if depth:
+        for idx in range(width):
+            subdir = os.path.join(path, 'dir%d' % idx)
+            os.mkdir(subdir)
+            _make_tree(subdir, width, depth - 1)
+
+
+def test_rmtree_safe():
+    tmp_dir = mkdtemp()
+    _make_tree(tmp_dir, 4, 3)
+    rmtree_safe(tmp_dir, workers=4)
+    assert not os.path.exists(tmp_dir)
+    assert os.path.exists('/etc/hosts')
+
+
+def test_rmtree_safe_mounts():
+    tmp_dir = mkdtemp()
+    _make_tree(tmp_dir, 2, 2)
+    tmpfs = os.path.join(tmp_dir, 'dir0', 'tmpfs')
+    bind = os.path.join(tmp_dir, 'dir1', 'bind')
+    os.mkdir(tmpfs)
+    os.mkdir(bind)
+    mount_tmpfs(tmpfs, '/')
+    open(os.path.join(tmpfs, 'keep'), 'w').close()
+    mount(os.path.join(tmp_dir, 'dir0', 'dir0'), bind, None, MS_BIND)
+
+    with pytest.raises(OSError) as err:
+        rmtree_safe(tmp_dir)
+    assert err.value.errno == errno.EBUSY
+    assert os.path.exists(os.path.join(tmpfs, 'keep'))
+    assert not os.path.exists(os.path.join(tmp_dir, 'file0'))
+    assert not os.path.exists(os.path.join(tmp_dir, 'dir1', 'dir0'))
+
+    with pytest.raises(OSError) as err:
+        rmtree_safe(tmpfs)
+    assert err.value.errno == errno.EBUSY
+
+    unmount(tmpfs)
+    unmount(bind)
+    rmtree_safe(tmp_dir)
+    assert not os.path.exists(tmp_dir)
+
+
+def test_rmtree_safe_serial(monkeypatch):
+    tmp_dir = mkdtemp()
+    _make_tree(tmp_dir, 3, 2)
+    rmtree_safe(tmp_dir, workers=1)
+    assert not os.path.exists(tmp_dir)
+
+    def _start(_thread):
+        raise RuntimeError("can't start new thread")
+
+    tmp_dir = mkdtemp()
+    _make_tree(tmp_dir, 3, 2)
+    monkeypatch.setattr(threading.Thread, 'start', _start)
+    rmtree_safe(tmp_dir, workers=4)
+    assert not os.path.exists(tmp_dir)
@@ -1,2 +1,8 @@
 """Linux direct system call interface.
 """
+
+from tmsyscall.tracing import trace
+
+__all__ = [
+    'trace',
+]
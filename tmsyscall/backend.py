@@ -0,0 +1,142 @@
+"""Pluggable system call backend.
+
+By default the mount, umount, umount2, unshare, setns and pivot_root
+wrappers call libc directly. A backend object installed with
+:func:`set_backend` or :func:`use_backend` receives those calls instead
+(e.g. :class:`tmsyscall.simulate.SimulatedBackend`).
+
+Backend methods follow the libc convention: they return ``-1`` and set
+errno (with :func:`ctypes.set_errno`) on failure.
+
+The ``exists``, ``isdir`` and ``make_mountpoint`` filesystem helpers used by
+:func:`tmsyscall.mount.mount_bind` go through the backend as well (see
+:func:`fs_call`), so that a simulated backend has no side effect on the real
+filesystem. They return their result and raise ``OSError`` on failure.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import contextlib
+import ctypes
+import errno
+import logging
+
+from tmsyscall import tracing
+
+_LOGGER = logging.getLogger(__name__)
+
+# Installed backend, None for libc.
+_CURRENT = None
+
+
+class Backend(object):
+    """Base class of system call backends, all calls fail with ENOSYS.
+    """
+    # pylint: disable=unused-argument
+
+    @staticmethod
+    def _enosys():
+        ctypes.set_errno(errno.ENOSYS)
+        return -1
+
+    def mount(self, source, target, fs_type, mnt_flags, data):
+        return self._enosys()
+
+    def umount(self, target):
+        return self._enosys()
+
+    def umount2(self, target, flags):
+        return self._enosys()
+
+    def unshare(self, flags):
+        return self._enosys()
+
+    def setns(self, fd, flags):
+        return self._enosys()
+
+    def pivot_root(self, new_root, put_old):
+        return self._enosys()
+
+    def mountinfo(self):
+        """Return the lines of the backend /proc/self/mountinfo.
+        """
+        raise OSError(errno.ENOSYS, 'mountinfo not supported by backend')
+
+    def exists(self, path):
+        """Check whether ``path`` exists.
+        """
+        raise OSError(errno.ENOSYS, 'exists not supported by backend')
+
+    def isdir(self, path):
+        """Check whether ``path`` is a directory.
+        """
+        raise OSError(errno.ENOSYS, 'isdir not supported by backend')
+
+    def make_mountpoint(self, newroot, relpath, is_dir, builder=None):
+        """Create the mount point ``relpath`` beneath ``newroot``, see
+        :class:`tmsyscall.rootfs.RootfsBuilder`.
+        """
+        raise OSError(
+            errno.ENOSYS, 'make_mountpoint not supported by backend'
+        )
+
+
+def get_backend():
+    """Return the installed backend, ``None`` for libc.
+    """
+    return _CURRENT
+
+
+def set_backend(backend):
+    """Install ``backend``, ``None`` to go back to libc.
+
+    :returns:
+        The previously installed backend.
+    """
+    global _CURRENT  # pylint: disable=global-statement
+
+    previous, _CURRENT = _CURRENT, backend
+    return previous
+
+
+@contextlib.contextmanager
+def use_backend(backend):
+    """Install ``backend`` for the duration of the context.
+    """
+    previous = set_backend(backend)
+    try:
+        yield backend
+    finally:
+        set_backend(previous)
+
+
+def syscall(name, func, args, flags=None):
+    """Call the system call ``name``, through the installed backend if any,
+    else through the libc function ``func``, tracing it if needed.
+    """
+    if _CURRENT is not None:
+        func = getattr(_CURRENT, name)
+    if tracing._ACTIVE:
+        return tracing.syscall(name, func, args, flags)
+    return func(*args)
+
+
+def fs_call(name, func, *args):
+    """Call the filesystem helper ``name`` of the installed backend if any,
+    else ``func``.
+    """
+    if _CURRENT is not None:
+        func = getattr(_CURRENT, name)
+    return func(*args)
+
+
+__all__ = [
+    'Backend',
+    'fs_call',
+    'get_backend',
+    'set_backend',
+    'use_backend',
+]
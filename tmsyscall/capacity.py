@@ -0,0 +1,349 @@
+"""Bulk filesystem capacity collection.
+
+:class:`CapacityCollector` runs ``statvfs(2)`` on all the mounts of the
+mount table from a bounded pool of threads. A ``statvfs`` call that does not
+return in time (e.g. on an NFS mount whose server died) is abandoned and its
+mount quarantined, so that a single dead mount cannot stall collections.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import logging
+import os
+import threading
+import time
+
+from six.moves import queue
+
+from tmsyscall import mount as mount_mod
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Filesystem types without meaningful capacity, skipped by default.
+PSEUDO_FS_TYPES = frozenset([
+    'autofs',
+    'binfmt_misc',
+    'bpf',
+    'cgroup',
+    'cgroup2',
+    'configfs',
+    'debugfs',
+    'devpts',
+    'efivarfs',
+    'fusectl',
+    'hugetlbfs',
+    'mqueue',
+    'nsfs',
+    'proc',
+    'pstore',
+    'rpc_pipefs',
+    'securityfs',
+    'selinuxfs',
+    'sysfs',
+    'tracefs',
+])
+
+#: The ``statvfs`` returned.
+STATUS_OK = 'ok'
+#: The ``statvfs`` failed, see ``error``.
+STATUS_ERROR = 'error'
+#: The ``statvfs`` did not return in time, the mount got quarantined.
+STATUS_TIMEOUT = 'timeout'
+#: The mount is quarantined, it was not queried.
+STATUS_QUARANTINED = 'quarantined'
+
+
+class Capacity(object):
+    """Capacity of one mount. Sizes are in bytes, all figures are ``None``
+    unless ``status`` is :data:`STATUS_OK`.
+    """
+
+    __slots__ = (
+        'entry',
+        'status',
+        'error',
+        'total',
+        'free',
+        'available',
+        'files',
+        'files_free',
+        'files_available',
+    )
+
+    def __init__(self, entry, status, error=None, stats=None):
+        #: The :class:`~tmsyscall.mount.MountEntry`.
+        self.entry = entry
+        self.status = status
+        #: ``OSError`` of a failed ``statvfs``.
+        self.error = error
+        if stats is None:
+            self.total = self.free = self.available = None
+            self.files = self.files_free = self.files_available = None
+        else:
+            self.total = stats.f_blocks * stats.f_frsize
+            self.free = stats.f_bfree * stats.f_frsize
+            self.available = stats.f_bavail * stats.f_frsize
+            self.files = stats.f_files
+            self.files_free = stats.f_ffree
+            self.files_available = stats.f_favail
+
+    @property
+    def used(self):
+        """Used bytes.
+        """
+        if self.total is None:
+            return None
+        return self.total - self.free
+
+    def __repr__(self):
+        return (
+            '{name}(target={target!r}, status={status!r}, '
+            'total={total!r}, available={available!r})'
+        ).format(
+            name=self.__class__.__name__,
+            target=self.entry.target,
+            status=self.status,
+            total=self.total,
+            available=self.available,
+        )
+
+
+class _Task(object):
+    """One ``statvfs`` call.
+    """
+
+    __slots__ = (
+        'entry',
+        'started',
+        'done',
+        'cancelled',
+        'stats',
+        'error',
+    )
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.started = None
+        self.done = False
+        self.cancelled = False
+        self.stats = None
+        self.error = None
+
+
+def _key(entry):
+    return (entry.source, entry.target)
+
+
+class CapacityCollector(object):
+    """Collect the capacity of all mounts, in parallel.
+
+    Worker threads stuck in a hanging ``statvfs`` are replaced, up to
+    ``max_hung`` of them, and exit when their call eventually returns, which
+    also lifts the quarantine of the mount.
+
+    :params ``int`` workers:
+        Number of ``statvfs`` threads.
+    :params ``float`` timeout:
+        Seconds a ``statvfs`` call may take.
+    :params ``set`` skip_fs_types:
+        Filesystem types to skip.
+    :params ``int`` max_hung:
+        Maximum number of threads left stuck in ``statvfs``.
+    """
+
+    def __init__(self, workers=8, timeout=2.0,
+                 skip_fs_types=PSEUDO_FS_TYPES, max_hung=16):
+        self.timeout = timeout
+        self.skip_fs_types = frozenset(skip_fs_types)
+        self.max_hung = max_hung
+        self._tasks = queue.Queue()
+        self._cond = threading.Condition()
+        # Quarantine start time by (source, target).
+        self._quarantine = {}
+        self._workers = workers
+        self._live = 0
+        self._hung = 0
+        for _ in range(workers):
+            self._spawn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    @property
+    def quarantined(self):
+        """``(source, target)`` of the quarantined mounts.
+        """
+        with self._cond:
+            return set(self._quarantine)
+
+    def release(self, entry):
+        """Lift the quarantine of ``entry``.
+        """
+        with self._cond:
+            self._quarantine.pop(_key(entry), None)
+
+    def _spawn(self):
+        self._live += 1
+        worker = threading.Thread(target=self._run, name='capacity')
+        worker.daemon = True
+        worker.start()
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            with self._cond:
+                if task.cancelled:
+                    continue
+                task.started = time.time()
+                self._cond.notify_all()
+            try:
+                stats, error = os.statvfs(task.entry.target), None
+            except OSError as err:
+                stats, error = None, err
+            with self._cond:
+                task.stats, task.error = stats, error
+                task.done = True
+                if task.cancelled:
+                    # Abandoned: the mount is back.
+                    _LOGGER.info('statvfs(%r) returned after %.1fs',
+                                 task.entry.target,
+                                 time.time() - task.started)
+                    self._quarantine.pop(_key(task.entry), None)
+                    self._hung -= 1
+                    if self._live >= self._workers:
+                        # Replaced already.
+                        return
+                    self._live += 1
+                self._cond.notify_all()
+
+    def _abandon(self, task, now):
+        """Give up on a hanging ``task``, replacing its worker.
+        """
+        _LOGGER.warning('statvfs(%r) timed out, quarantining the mount',
+                        task.entry.target)
+        task.cancelled = True
+        self._quarantine[_key(task.entry)] = now
+        self._live -= 1
+        self._hung += 1
+        if self._hung <= self.max_hung:
+            self._spawn()
+
+    def _submit(self, entries, results):
+        """Queue a task per non-quarantined entry, reporting the others.
+
+        :returns:
+            ``list`` of the queued :class:`_Task`.
+        """
+        pending = []
+        with self._cond:
+            for entry in entries:
+                if _key(entry) in self._quarantine:
+                    results[entry.target] = Capacity(entry, STATUS_QUARANTINED)
+                else:
+                    pending.append(_Task(entry))
+        for task in pending:
+            self._tasks.put(task)
+        return pending
+
+    def _settle(self, pending, results, now):
+        """Report the finished and timed out tasks (called with the lock
+        held).
+
+        :returns:
+            ``list`` of the tasks still to wait for.
+        """
+        waiting = []
+        for task in pending:
+            if task.done:
+                status = STATUS_OK if task.error is None else STATUS_ERROR
+                results[task.entry.target] = Capacity(
+                    task.entry, status, task.error, task.stats
+                )
+            elif task.started is not None and \
+                    now - task.started >= self.timeout:
+                self._abandon(task, now)
+                results[task.entry.target] = Capacity(
+                    task.entry, STATUS_TIMEOUT
+                )
+            else:
+                waiting.append(task)
+        return waiting
+
+    def _delay(self, pending, now):
+        """Seconds until the first of the ``pending`` tasks times out.
+        """
+        started = [
+            task.started for task in pending if task.started is not None
+        ]
+        if not started:
+            return self.timeout
+        return max(min(started) + self.timeout - now, 0)
+
+    def collect(self, entries=None):
+        """Collect the capacity of ``entries``.
+
+        Mounts of :attr:`skip_fs_types` are left out, as are all but the top
+        mount of stacked mounts.
+
+        :params ``list`` entries:
+            Mount entries, defaults to :func:`~tmsyscall.mount.list_mounts`.
+        :returns:
+            ``list`` of :class:`Capacity`, in mount table order.
+        """
+        if entries is None:
+            entries = mount_mod.list_mounts()
+        top = collections.OrderedDict()
+        for entry in entries:
+            if entry.fs_type not in self.skip_fs_types:
+                top[entry.target] = entry
+
+        results = {}
+        pending = self._submit(top.values(), results)
+        with self._cond:
+            while pending:
+                now = time.time()
+                pending = self._settle(pending, results, now)
+                if pending and not self._live:
+                    # All the workers are stuck, give up on the rest.
+                    for task in pending:
+                        task.cancelled = True
+                        results[task.entry.target] = Capacity(
+                            task.entry, STATUS_TIMEOUT
+                        )
+                    pending = []
+                if pending:
+                    self._cond.wait(self._delay(pending, now))
+
+        return [
+            results[entry.target] for entry in top.values()
+            if entry.target in results
+        ]
+
+    def close(self):
+        """Stop the worker threads (stuck ones exit when they return).
+        """
+        with self._cond:
+            live, self._live = self._live, 0
+            self._workers = 0
+        for _ in range(live):
+            self._tasks.put(None)
+
+
+__all__ = [
+    'Capacity',
+    'CapacityCollector',
+    'PSEUDO_FS_TYPES',
+    'STATUS_ERROR',
+    'STATUS_OK',
+    'STATUS_QUARANTINED',
+    'STATUS_TIMEOUT',
+]
@@ -0,0 +1,276 @@
+"""Kernel feature probing.
+
+Newer system calls are faster or safer than the legacy ones, but depend on
+the kernel version (and on seccomp policies). Each feature is probed on
+first use, with a call which has no side effect, and the result cached.
+Results can be overridden, e.g. to exercise fallback paths::
+
+    with features.overridden(features.STATMOUNT, False):
+        mount_of('/')
+
+Probes consider a system call available unless it fails with ``ENOSYS``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import contextlib
+import errno
+import logging
+import os
+import threading
+
+import ctypes
+from ctypes import (
+    c_int,
+    c_long,
+    c_uint,
+    c_void_p,
+)
+from ctypes.util import find_library
+
+from tmsyscall import statx
+
+_LOGGER = logging.getLogger(__name__)
+
+#: clone3(2) (Linux 5.3+).
+CLONE3 = 'clone3'
+#: setns(2) with a pidfd, joining several namespaces at once (Linux 5.8+).
+SETNS_PIDFD = 'setns_pidfd'
+#: pidfd_open(2) (Linux 5.3+).
+PIDFD_OPEN = 'pidfd_open'
+#: fsopen(2) (Linux 5.2+).
+FSOPEN = 'fsopen'
+#: open_tree(2) (Linux 5.2+).
+OPEN_TREE = 'open_tree'
+#: mount_setattr(2) (Linux 5.12+).
+MOUNT_SETATTR = 'mount_setattr'
+#: statmount(2) (Linux 6.8+).
+STATMOUNT = 'statmount'
+#: listmount(2) (Linux 6.8+).
+LISTMOUNT = 'listmount'
+#: statx(2) reporting ``STATX_MNT_ID`` (Linux 5.8+).
+STATX_MNT_ID = 'statx_mnt_id'
+#: openat2(2) (Linux 5.6+).
+OPENAT2 = 'openat2'
+
+# Syscall numbers, the same on all architectures.
+_NR_CLONE3 = 435
+_NR_PIDFD_OPEN = 434
+_NR_FSOPEN = 430
+_NR_OPEN_TREE = 428
+_NR_MOUNT_SETATTR = 442
+_NR_STATMOUNT = 457
+_NR_LISTMOUNT = 458
+_NR_OPENAT2 = 437
+
+_CLONE_NEWUTS = 0x04000000
+
+_LIBC_PATH = find_library('c')
+_LIBC = ctypes.CDLL(_LIBC_PATH, use_errno=True)
+
+# long syscall(long number, ...);
+_SYSCALL = _LIBC.syscall
+_SYSCALL.restype = c_long
+
+# int setns(int fd, int nstype);
+_SETNS_DECL = ctypes.CFUNCTYPE(c_int, c_int, c_int, use_errno=True)
+_SETNS = _SETNS_DECL(('setns', _LIBC))
+
+
+def _syscall_exists(number, *args):
+    """Call syscall ``number`` with invalid ``args``, check it exists.
+    """
+    res = _SYSCALL(c_long(number), *args)
+    if res >= 0:
+        os.close(res)
+        return True
+    return ctypes.get_errno() != errno.ENOSYS
+
+
+def _probe_clone3():
+    # A zero sized struct clone_args is rejected with EINVAL.
+    return _syscall_exists(_NR_CLONE3, c_void_p(None), c_long(0))
+
+
+def _probe_pidfd_open():
+    return _syscall_exists(_NR_PIDFD_OPEN, c_int(os.getpid()), c_uint(0))
+
+
+def _probe_setns_pidfd():
+    if not supported(PIDFD_OPEN):
+        return False
+    pidfd = _SYSCALL(c_long(_NR_PIDFD_OPEN), c_int(os.getpid()), c_uint(0))
+    if pidfd < 0:
+        return False
+    try:
+        # Joining our own uts namespace again is a no-op. Kernels without
+        # pidfd support in setns reject the fd with EINVAL.
+        if _SETNS(pidfd, _CLONE_NEWUTS) == 0:
+            return True
+        return ctypes.get_errno() == errno.EPERM
+    finally:
+        os.close(pidfd)
+
+
+def _probe_fsopen():
+    return _syscall_exists(_NR_FSOPEN, c_void_p(None), c_uint(0xffffffff))
+
+
+def _probe_open_tree():
+    return _syscall_exists(
+        _NR_OPEN_TREE, c_int(-1), c_void_p(None), c_uint(0xffffffff)
+    )
+
+
+def _probe_mount_setattr():
+    return _syscall_exists(
+        _NR_MOUNT_SETATTR, c_int(-1), c_void_p(None), c_uint(0xffffffff),
+        c_void_p(None), c_long(0)
+    )
+
+
+def _probe_statmount():
+    return _syscall_exists(
+        _NR_STATMOUNT, c_void_p(None), c_void_p(None), c_long(0), c_uint(0)
+    )
+
+
+def _probe_listmount():
+    return _syscall_exists(
+        _NR_LISTMOUNT, c_void_p(None), c_void_p(None), c_long(0), c_uint(0)
+    )
+
+
+def _probe_statx_mnt_id():
+    try:
+        stx = statx.statx('/', statx.STATX_MNT_ID)
+    except OSError as err:
+        # Seccomp policies may reject statx(2) with EPERM, and some
+        # sandboxes with EINVAL.
+        if err.errno not in (errno.ENOSYS, errno.EPERM, errno.EINVAL):
+            raise
+        return False
+    return bool(stx.stx_mask & statx.STATX_MNT_ID)
+
+
+def _probe_openat2():
+    # A NULL struct open_how of size 0 is rejected with EINVAL.
+    return _syscall_exists(
+        _NR_OPENAT2, c_int(statx.AT_FDCWD), c_void_p(None), c_void_p(None),
+        c_long(0)
+    )
+
+
+_PROBES = {
+    CLONE3: _probe_clone3,
+    SETNS_PIDFD: _probe_setns_pidfd,
+    PIDFD_OPEN: _probe_pidfd_open,
+    FSOPEN: _probe_fsopen,
+    OPEN_TREE: _probe_open_tree,
+    MOUNT_SETATTR: _probe_mount_setattr,
+    STATMOUNT: _probe_statmount,
+    LISTMOUNT: _probe_listmount,
+    STATX_MNT_ID: _probe_statx_mnt_id,
+    OPENAT2: _probe_openat2,
+}
+
+#: All the probed features.
+FEATURES = tuple(sorted(_PROBES))
+
+_LOCK = threading.RLock()
+# Probe results and overrides, by feature name.
+_PROBED = {}
+_OVERRIDES = {}
+
+
+def supported(feature):
+    """Check whether ``feature`` is available, probing it on first use.
+    """
+    override = _OVERRIDES.get(feature)
+    if override is not None:
+        return override
+    res = _PROBED.get(feature)
+    if res is None:
+        with _LOCK:
+            res = _PROBED.get(feature)
+            if res is None:
+                res = _PROBED[feature] = bool(_PROBES[feature]())
+                _LOGGER.debug('Kernel feature %s: %s', feature, res)
+    return res
+
+
+def mark_unsupported(feature):
+    """Record that ``feature`` turned out to be unavailable (e.g. a call
+    failed with ``ENOSYS``).
+    """
+    if feature not in _PROBES:
+        raise ValueError('Unknown feature: %r' % feature)
+    with _LOCK:
+        _PROBED[feature] = False
+
+
+def set_supported(feature, value):
+    """Override the probe result of ``feature``, ``None`` to remove the
+    override.
+    """
+    if feature not in _PROBES:
+        raise ValueError('Unknown feature: %r' % feature)
+    with _LOCK:
+        if value is None:
+            _OVERRIDES.pop(feature, None)
+        else:
+            _OVERRIDES[feature] = bool(value)
+
+
+@contextlib.contextmanager
+def overridden(feature, value):
+    """Override the probe result of ``feature`` for the duration of the
+    context.
+    """
+    previous = _OVERRIDES.get(feature)
+    set_supported(feature, value)
+    try:
+        yield
+    finally:
+        set_supported(feature, previous)
+
+
+def probe_all():
+    """Probe all the features.
+
+    :returns:
+        ``dict`` - Availability of each feature.
+    """
+    return dict((feature, supported(feature)) for feature in FEATURES)
+
+
+def reset():
+    """Forget all probe results and overrides.
+    """
+    with _LOCK:
+        _PROBED.clear()
+        _OVERRIDES.clear()
+
+
+__all__ = [
+    'CLONE3',
+    'FEATURES',
+    'FSOPEN',
+    'LISTMOUNT',
+    'MOUNT_SETATTR',
+    'OPENAT2',
+    'OPEN_TREE',
+    'PIDFD_OPEN',
+    'SETNS_PIDFD',
+    'STATMOUNT',
+    'STATX_MNT_ID',
+    'mark_unsupported',
+    'overridden',
+    'probe_all',
+    'reset',
+    'set_supported',
+    'supported',
+]
@@ -0,0 +1,183 @@
+"""Wrappers for the file descriptor based mount API (Linux 5.2+):
+open_tree(2), move_mount(2) and mount_setattr(2) (Linux 5.12+).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+
+import ctypes
+from ctypes import (
+    c_char_p,
+    c_int,
+    c_long,
+    c_size_t,
+    c_uint,
+    c_uint64,
+)
+from ctypes.util import find_library
+
+from tmsyscall import features
+from tmsyscall import statmount
+from tmsyscall import statx
+
+_LOGGER = logging.getLogger(__name__)
+
+
+###############################################################################
+# Constants copied from linux/mount.h and linux/fcntl.h
+
+#: Clone the mount tree instead of opening it (open_tree).
+OPEN_TREE_CLONE = 0x1
+#: Close the tree file descriptor on exec (open_tree).
+OPEN_TREE_CLOEXEC = os.O_CLOEXEC
+
+#: Apply to the entire subtree (open_tree, mount_setattr).
+AT_RECURSIVE = 0x8000
+
+#: from_path is empty, move from_dfd itself (move_mount).
+MOVE_MOUNT_F_EMPTY_PATH = 0x00000004
+#: to_path is empty, move onto to_dfd itself (move_mount).
+MOVE_MOUNT_T_EMPTY_PATH = 0x00000040
+
+# Syscall numbers, the same on all architectures.
+_NR_OPEN_TREE = 428
+_NR_MOVE_MOUNT = 429
+_NR_MOUNT_SETATTR = 442
+
+
+###############################################################################
+# Map the C interface
+
+class MountAttr(ctypes.Structure):
+    """struct mount_attr
+    """
+    _fields_ = [
+        ('attr_set', c_uint64),
+        ('attr_clr', c_uint64),
+        ('propagation', c_uint64),
+        ('userns_fd', c_uint64),
+    ]
+
+
+_LIBC_PATH = find_library('c')
+_LIBC = ctypes.CDLL(_LIBC_PATH, use_errno=True)
+
+# long syscall(long number, ...);
+_SYSCALL = _LIBC.syscall
+_SYSCALL.restype = c_long
+
+
+def _check(res, name, path):
+    if res < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), '%s(%r)' % (name, path))
+    return res
+
+
+def _encode(path):
+    if not isinstance(path, bytes):
+        path = path.encode()
+    return path
+
+
+def open_tree(path, flags=OPEN_TREE_CLONE | OPEN_TREE_CLOEXEC,
+              dirfd=statx.AT_FDCWD):
+    """Open (or, with :data:`OPEN_TREE_CLONE`, clone into a detached mount)
+    the mount tree at ``path``.
+
+    :returns:
+        ``int`` - Mount file descriptor, to be closed by the caller.
+    """
+    return _check(
+        _SYSCALL(c_long(_NR_OPEN_TREE), c_int(dirfd), c_char_p(_encode(path)),
+                 c_uint(flags)),
+        'open_tree', path
+    )
+
+
+def move_mount(from_dfd, from_path, to_dfd, to_path, flags=0):
+    """Move the mount at ``from_dfd``/``from_path`` onto
+    ``to_dfd``/``to_path``, attaching it if it is detached.
+    """
+    _check(
+        _SYSCALL(c_long(_NR_MOVE_MOUNT),
+                 c_int(from_dfd), c_char_p(_encode(from_path)),
+                 c_int(to_dfd), c_char_p(_encode(to_path)),
+                 c_uint(flags)),
+        'move_mount', to_path
+    )
+
+
+def mount_setattr(path, attr_set=0, attr_clr=0, propagation=0,
+                  userns_fd=0, flags=0, dirfd=statx.AT_FDCWD):
+    """Change the properties of the mount at ``dirfd``/``path``.
+
+    :params ``int`` attr_set:
+        ``MOUNT_ATTR_*`` attributes to set.
+    :params ``int`` attr_clr:
+        ``MOUNT_ATTR_*`` attributes to clear.
+    :params ``int`` propagation:
+        ``MS_SHARED``, ``MS_SLAVE``, ``MS_PRIVATE`` or ``MS_UNBINDABLE``.
+    :params ``int`` userns_fd:
+        User namespace file descriptor, with ``MOUNT_ATTR_IDMAP``.
+    :params ``int`` flags:
+        ``AT_*`` flags, e.g. :data:`AT_RECURSIVE`.
+    """
+    attr = MountAttr(attr_set, attr_clr, propagation, userns_fd)
+    _check(
+        _SYSCALL(c_long(_NR_MOUNT_SETATTR), c_int(dirfd),
+                 c_char_p(_encode(path)), c_uint(flags),
+                 ctypes.byref(attr), c_size_t(ctypes.sizeof(attr))),
+        'mount_setattr', path
+    )
+
+
+def idmapped_bind(source, target, userns_fd, recursive=True):
+    """Bind mount ``source`` on ``target`` with its file ownership shifted
+    through the ID mappings of the user namespace ``userns_fd``.
+
+    Unlike a recursive chown of ``source``, this takes a constant time
+    whatever the size of the tree. The filesystem of ``source`` must support
+    ID-mapped mounts.
+
+    :params ``int`` userns_fd:
+        User namespace file descriptor, see
+        :func:`tmsyscall.unshare.userns_fd`.
+    :params ``bool`` recursive:
+        Also bind (and ID-map) the mounts below ``source``.
+    """
+    for feature in (features.OPEN_TREE, features.MOUNT_SETATTR):
+        if not features.supported(feature):
+            raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS), feature)
+
+    flags = AT_RECURSIVE if recursive else 0
+    tree_fd = open_tree(source, OPEN_TREE_CLONE | OPEN_TREE_CLOEXEC | flags)
+    try:
+        mount_setattr(
+            '', attr_set=statmount.MOUNT_ATTR_IDMAP, userns_fd=userns_fd,
+            flags=statx.AT_EMPTY_PATH | flags, dirfd=tree_fd
+        )
+        move_mount(tree_fd, '', statx.AT_FDCWD, target,
+                   MOVE_MOUNT_F_EMPTY_PATH)
+    finally:
+        os.close(tree_fd)
+
+
+__all__ = [
+    'AT_RECURSIVE',
+    'MOVE_MOUNT_F_EMPTY_PATH',
+    'MOVE_MOUNT_T_EMPTY_PATH',
+    'MountAttr',
+    'OPEN_TREE_CLOEXEC',
+    'OPEN_TREE_CLONE',
+    'idmapped_bind',
+    'mount_setattr',
+    'move_mount',
+    'open_tree',
+]
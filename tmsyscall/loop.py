@@ -0,0 +1,369 @@
+"""Loop devices, to mount filesystem images (squashfs, ext4, ...).
+
+Devices are allocated with ``LOOP_CTL_GET_FREE`` on /dev/loop-control and
+configured in a single ``LOOP_CONFIGURE`` ioctl (Linux 5.8+), falling back
+to ``LOOP_SET_FD`` and ``LOOP_SET_STATUS64`` on older kernels.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import fcntl
+import logging
+import os
+import threading
+
+import ctypes
+from ctypes import (
+    c_char,
+    c_uint32,
+    c_uint64,
+)
+
+from tmsyscall import mount as mount_mod
+
+_LOGGER = logging.getLogger(__name__)
+
+
+###############################################################################
+# Constants copied from linux/loop.h
+
+LOOP_SET_FD = 0x4C00
+LOOP_CLR_FD = 0x4C01
+LOOP_SET_STATUS64 = 0x4C04
+LOOP_GET_STATUS64 = 0x4C05
+LOOP_SET_DIRECT_IO = 0x4C08
+LOOP_SET_BLOCK_SIZE = 0x4C09
+LOOP_CONFIGURE = 0x4C0A
+LOOP_CTL_GET_FREE = 0x4C82
+
+#: Read-only device.
+LO_FLAGS_READ_ONLY = 1
+#: Detach the device when its last user goes away.
+LO_FLAGS_AUTOCLEAR = 4
+#: Scan the device for partitions.
+LO_FLAGS_PARTSCAN = 8
+#: Bypass the page cache of the backing file.
+LO_FLAGS_DIRECT_IO = 16
+
+_LOOP_CONTROL = '/dev/loop-control'
+
+# Attempts at grabbing a free device before giving up.
+_ATTACH_RETRIES = 16
+
+
+###############################################################################
+# Map the C interface
+
+class LoopInfo64(ctypes.Structure):
+    """struct loop_info64
+    """
+    _fields_ = [
+        ('lo_device', c_uint64),
+        ('lo_inode', c_uint64),
+        ('lo_rdevice', c_uint64),
+        ('lo_offset', c_uint64),
+        ('lo_sizelimit', c_uint64),
+        ('lo_number', c_uint32),
+        ('lo_encrypt_type', c_uint32),
+        ('lo_encrypt_key_size', c_uint32),
+        ('lo_flags', c_uint32),
+        ('lo_file_name', c_char * 64),
+        ('lo_crypt_name', c_char * 64),
+        ('lo_encrypt_key', c_char * 32),
+        ('lo_init', c_uint64 * 2),
+    ]
+
+
+class LoopConfig(ctypes.Structure):
+    """struct loop_config
+    """
+    _fields_ = [
+        ('fd', c_uint32),
+        ('block_size', c_uint32),
+        ('info', LoopInfo64),
+        ('reserved', c_uint64 * 8),
+    ]
+
+
+class LoopDevice(object):
+    """Attached loop device.
+
+    The device stays attached while the instance is open. Devices attached
+    with autoclear go away on :meth:`close` once no longer mounted.
+    """
+
+    __slots__ = (
+        'path',
+        'number',
+        'backing_file',
+        'read_only',
+        '_fd',
+    )
+
+    def __init__(self, number, fd, backing_file, read_only):
+        self.path = '/dev/loop%d' % number
+        self.number = number
+        self.backing_file = backing_file
+        self.read_only = read_only
+        self._fd = fd
+
+    def __repr__(self):
+        return '{name}(path={path!r}, backing_file={backing_file!r})'.format(
+            name=self.__class__.__name__,
+            path=self.path,
+            backing_file=self.backing_file,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def fileno(self):
+        """Device file descriptor.
+        """
+        return self._fd
+
+    def status(self):
+        """Return the device :class:`LoopInfo64`.
+        """
+        info = LoopInfo64()
+        fcntl.ioctl(self._fd, LOOP_GET_STATUS64, info)
+        return info
+
+    def detach(self):
+        """Detach the backing file (fails with ``EBUSY`` while mounted,
+        unless autoclear is set) and close the device.
+        """
+        fcntl.ioctl(self._fd, LOOP_CLR_FD, 0)
+        self.close()
+
+    def close(self):
+        """Close the device.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _is_bound(dev_fd):
+    """Check whether the loop device has a backing file.
+    """
+    try:
+        fcntl.ioctl(dev_fd, LOOP_GET_STATUS64, LoopInfo64())
+    except (IOError, OSError) as err:
+        if err.errno == errno.ENXIO:
+            return False
+        raise
+    return True
+
+
+def _configure(dev_fd, file_fd, flags, offset, sizelimit, block_size):
+    """Configure the loop device, return False if LOOP_CONFIGURE is not
+    supported.
+    """
+    config = LoopConfig(
+        fd=file_fd,
+        block_size=block_size,
+        info=LoopInfo64(
+            lo_flags=flags, lo_offset=offset, lo_sizelimit=sizelimit
+        ),
+    )
+    try:
+        fcntl.ioctl(dev_fd, LOOP_CONFIGURE, config)
+    except (IOError, OSError) as err:
+        # Older kernels reject the unknown ioctl with ENOTTY or EINVAL. An
+        # EINVAL once the device got bound is a genuine error.
+        if err.errno == errno.ENOTTY or \
+                (err.errno == errno.EINVAL and not _is_bound(dev_fd)):
+            _LOGGER.info('LOOP_CONFIGURE failed (%s), '
+                         'falling back to LOOP_SET_FD', err)
+            return False
+        raise
+    return True
+
+
+def _set_fd(dev_fd, file_fd, flags, offset, sizelimit, block_size):
+    """Configure the loop device the pre-LOOP_CONFIGURE way.
+    """
+    fcntl.ioctl(dev_fd, LOOP_SET_FD, file_fd)
+    try:
+        info = LoopInfo64(
+            lo_flags=flags & ~(LO_FLAGS_READ_ONLY | LO_FLAGS_DIRECT_IO),
+            lo_offset=offset,
+            lo_sizelimit=sizelimit,
+        )
+        fcntl.ioctl(dev_fd, LOOP_SET_STATUS64, info)
+        if flags & LO_FLAGS_DIRECT_IO:
+            fcntl.ioctl(dev_fd, LOOP_SET_DIRECT_IO, 1)
+        # Also rejects the block sizes LOOP_CONFIGURE may have refused.
+        if block_size:
+            fcntl.ioctl(dev_fd, LOOP_SET_BLOCK_SIZE, block_size)
+    except (IOError, OSError):
+        fcntl.ioctl(dev_fd, LOOP_CLR_FD, 0)
+        raise
+
+
+def attach(backing_file, read_only=True, direct_io=False, autoclear=True,
+           offset=0, sizelimit=0, block_size=0):
+    """Attach ``backing_file`` to a free loop device.
+
+    :params ``bool`` direct_io:
+        Bypass the page cache of the backing file (avoids double caching).
+    :params ``bool`` autoclear:
+        Detach the device once closed and unmounted.
+    :params ``int`` block_size:
+        Logical block size of the device, 0 for the default.
+    :returns:
+        :class:`LoopDevice`
+    """
+    flags = 0
+    if read_only:
+        flags |= LO_FLAGS_READ_ONLY
+    if direct_io:
+        flags |= LO_FLAGS_DIRECT_IO
+    if autoclear:
+        flags |= LO_FLAGS_AUTOCLEAR
+
+    mode = os.O_RDONLY if read_only else os.O_RDWR
+    file_fd = os.open(backing_file, mode | os.O_CLOEXEC)
+    ctl_fd = os.open(_LOOP_CONTROL, os.O_RDWR | os.O_CLOEXEC)
+    try:
+        for _ in range(_ATTACH_RETRIES):
+            number = fcntl.ioctl(ctl_fd, LOOP_CTL_GET_FREE)
+            dev_fd = os.open('/dev/loop%d' % number, mode | os.O_CLOEXEC)
+            try:
+                if not _configure(dev_fd, file_fd, flags,
+                                  offset, sizelimit, block_size):
+                    _set_fd(dev_fd, file_fd, flags, offset, sizelimit,
+                            block_size)
+            except (IOError, OSError) as err:
+                os.close(dev_fd)
+                # Grabbed by someone else in the meantime.
+                if err.errno == errno.EBUSY:
+                    continue
+                raise
+            _LOGGER.debug('Attached %r to /dev/loop%d', backing_file, number)
+            return LoopDevice(number, dev_fd, backing_file, read_only)
+
+        raise OSError(errno.EBUSY, 'No free loop device', backing_file)
+
+    finally:
+        os.close(ctl_fd)
+        os.close(file_fd)
+
+
+def mount_image(image, target, fs_type, read_only=True, direct_io=False, # pylint: disable=W1113
+                mnt_flags=0, *mnt_opts_args, **mnt_opts_kwargs):
+    """Mount the filesystem image ``image`` on ``target`` through an
+    autoclear loop device, which goes away when ``target`` is unmounted.
+
+    :returns:
+        ``str`` - Path of the loop device.
+    """
+    if read_only:
+        mnt_flags |= mount_mod.MS_RDONLY
+    with attach(image, read_only=read_only, direct_io=direct_io) as device:
+        mount_mod.mount(device.path, target, fs_type, mnt_flags,
+                        *mnt_opts_args, **mnt_opts_kwargs)
+        return device.path
+
+
+class SharedLoopDevices(object):
+    """Read-only loop devices shared between consumers of the same image.
+
+    The first mount of an image attaches a device, later ones reuse it. The
+    device goes away once the last consumer unmounted it.
+
+    :params ``bool`` direct_io:
+        Attach the devices with direct I/O.
+    """
+
+    def __init__(self, direct_io=True):
+        self.direct_io = direct_io
+        self._lock = threading.Lock()
+        # [device, refcount] by image (st_dev, st_ino).
+        self._devices = {}
+        # Image key by mount target.
+        self._targets = {}
+
+    def __len__(self):
+        return len(self._devices)
+
+    def acquire(self, image):
+        """Get a device for ``image``, attaching one if needed.
+
+        :returns:
+            :class:`LoopDevice`
+        """
+        info = os.stat(image)
+        key = (info.st_dev, info.st_ino)
+        with self._lock:
+            slot = self._devices.get(key)
+            if slot is None:
+                device = attach(image, read_only=True,
+                                direct_io=self.direct_io)
+                slot = self._devices[key] = [device, 0]
+            slot[1] += 1
+            return slot[0]
+
+    def release(self, device):
+        """Drop a reference to ``device``.
+        """
+        with self._lock:
+            for key, slot in self._devices.items():
+                if slot[0] is device:
+                    slot[1] -= 1
+                    if not slot[1]:
+                        del self._devices[key]
+                        device.close()
+                    return
+        raise ValueError('Unknown device %r' % device)
+
+    def mount(self, image, target, fs_type, mnt_flags=0, *mnt_opts_args, # pylint: disable=W1113
+              **mnt_opts_kwargs):
+        """Mount ``image`` read-only on ``target``.
+
+        :returns:
+            :class:`LoopDevice`
+        """
+        device = self.acquire(image)
+        try:
+            mount_mod.mount(device.path, target, fs_type,
+                            mnt_flags | mount_mod.MS_RDONLY,
+                            *mnt_opts_args, **mnt_opts_kwargs)
+        except OSError:
+            self.release(device)
+            raise
+        with self._lock:
+            self._targets[target] = device
+        return device
+
+    def unmount(self, target, flags=0):
+        """Unmount ``target`` and release its device.
+        """
+        with self._lock:
+            device = self._targets[target]
+        mount_mod.unmount(target, flags)
+        with self._lock:
+            del self._targets[target]
+        self.release(device)
+
+
+__all__ = [
+    'LO_FLAGS_AUTOCLEAR',
+    'LO_FLAGS_DIRECT_IO',
+    'LO_FLAGS_PARTSCAN',
+    'LO_FLAGS_READ_ONLY',
+    'LoopConfig',
+    'LoopDevice',
+    'LoopInfo64',
+    'SharedLoopDevices',
+    'attach',
+    'mount_image',
+]
@@ -25,6 +25,8 @@ from ctypes.util import find_library
 import enum
 import six
 
+from tmsyscall import backend
+from tmsyscall import rootfs
 from tmsyscall import utils
 
 _LOGGER = logging.getLogger(__name__)
@@ -57,23 +59,32 @@ _MOUNT = _MOUNT_DECL(('mount', _LIBC))
 
 
 def _mount(source, target, fs_type, mnt_flags, data):
-    res = _MOUNT(source, target, fs_type, mnt_flags, data)
+    res = backend.syscall(
+        'mount', _MOUNT, (source, target, fs_type, mnt_flags, data),
+        (mnt_flags, MSFlags)
+    )
     if res < 0:
-        errno = ctypes.get_errno()
-        raise OSError(
-            errno, os.strerror(errno),
-            'mount(%r, %r, %r, 0x%x, %r)' % (
-                source,
-                target,
-                fs_type,
-                mnt_flags,
-                data
-            )
-        )
+        _mount_error(source, target, fs_type, mnt_flags, data)
 
     return res
 
 
+def _mount_error(source, target, fs_type, mnt_flags, data):
+    """Raise the :class:`OSError` of a failed mount(2) call.
+    """
+    errno = ctypes.get_errno()
+    raise OSError(
+        errno, os.strerror(errno),
+        'mount(%r, %r, %r, 0x%x, %r)' % (
+            source,
+            target,
+            fs_type,
+            mnt_flags,
+            data
+        )
+    )
+
+
 # int umount(const char *target);
 _UMOUNT_DECL = ctypes.CFUNCTYPE(
     c_int,
@@ -95,7 +106,7 @@ _UMOUNT2 = _UMOUNT2_DECL(('umount2', _LIBC))
 def _umount(target):
     """Umount ``target``.
     """
-    res = _UMOUNT(target)
+    res = backend.syscall('umount', _UMOUNT, (target, ))
     if res < 0:
         errno = ctypes.get_errno()
         raise OSError(
@@ -105,7 +116,9 @@ def _umount(target):
 
 
 def _umount2(target, flags=None):
-    res = _UMOUNT2(target, flags)
+    res = backend.syscall(
+        'umount2', _UMOUNT2, (target, flags), (flags, MNTFlags)
+    )
     if res < 0:
         errno = ctypes.get_errno()
         raise OSError(
@@ -250,7 +263,18 @@ def mount(source, target, fs_type, mnt_flags=0, *mnt_opts_args, # pylint: disabl
     if fs_type is not None:
         fs_type = fs_type.encode()
 
-    # Fix up mount options
+    options = _mount_options(mnt_opts_args, mnt_opts_kwargs)
+
+    _LOGGER.debug('mount(%r, %r, %r, %r, %r)',
+                  source, target, fs_type,
+                  utils.parse_mask(mnt_flags, MSFlags), options)
+
+    return _mount(source, target, fs_type, mnt_flags, options)
+
+
+def _mount_options(mnt_opts_args, mnt_opts_kwargs):
+    """Build the encoded mount(2) data argument from mount options.
+    """
     options = ','.join(
         itertools.chain(
             mnt_opts_args,
@@ -261,16 +285,139 @@ def mount(source, target, fs_type, mnt_flags=0, *mnt_opts_args, # pylint: disabl
         )
     )
     if options:
-        options = options.encode()
-    else:
-        options = None
+        return options.encode()
+    return None
 
-    _LOGGER.debug('mount(%r, %r, %r, %r, %r)',
-                  source, target, fs_type,
-                  utils.parse_mask(mnt_flags, MSFlags), options)
 
+class MountSpec(object):
+    """Immutable, pre-encoded :func:`mount` call.
 
-    return _mount(source, target, fs_type, mnt_flags, options)
+    Arguments are the same as :func:`mount`, but they are encoded, the mount
+    options are joined and the flag mask is computed only once, when the spec
+    is built. :meth:`apply` then goes straight to mount(2).
+
+    The target is remembered relative to ``/`` so that the same spec can be
+    cheaply rebased onto a different root with :meth:`rebase`.
+    """
+
+    __slots__ = (
+        'source',
+        'target',
+        'fs_type',
+        'mnt_flags',
+        'data',
+        '_relpath',
+        '_args',
+    )
+
+    def __init__(self, source, target, fs_type=None, mnt_flags=0, # pylint: disable=W1113
+                 *mnt_opts_args, **mnt_opts_kwargs):
+        if source is not None:
+            source = _encode(source)
+        if target is not None:
+            target = _encode(target)
+        else:
+            target = source
+        if fs_type is not None:
+            fs_type = _encode(fs_type)
+
+        self._init(
+            source, target, fs_type, int(mnt_flags),
+            _mount_options(mnt_opts_args, mnt_opts_kwargs),
+            target.lstrip(b'/') if target is not None else None
+        )
+
+    def _init(self, source, target, fs_type, mnt_flags, data, relpath):
+        """Set all (otherwise read-only) slots.
+        """
+        setter = super(MountSpec, self).__setattr__
+        setter('source', source)
+        setter('target', target)
+        setter('fs_type', fs_type)
+        setter('mnt_flags', mnt_flags)
+        setter('data', data)
+        setter('_relpath', relpath)
+        setter('_args', (source, target, fs_type, c_ulong(mnt_flags), data))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable' % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError('%s is immutable' % self.__class__.__name__)
+
+    def __repr__(self):
+        return (
+            '{name}(source={src!r}, target={target!r}, '
+            'fs_type={fs_type!r}, mnt_flags={mnt_flags!r}, data={data!r})'
+        ).format(
+            name=self.__class__.__name__,
+            src=self.source,
+            target=self.target,
+            fs_type=self.fs_type,
+            mnt_flags=utils.parse_mask(self.mnt_flags, MSFlags),
+            data=self.data
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, MountSpec):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        if res is NotImplemented:
+            return res
+        return not res
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def _key(self):
+        return (
+            self.source, self.target, self.fs_type, self.mnt_flags, self.data
+        )
+
+    def rebase(self, newroot):
+        """Return a copy of this spec with its target under ``newroot``.
+
+        The source is left untouched.
+
+        :params `str` newroot:
+            New root directory, the spec target is taken relative to it.
+        """
+        newroot = _encode(newroot).rstrip(b'/')
+        if self._relpath:
+            target = newroot + b'/' + self._relpath
+        else:
+            target = newroot or b'/'
+
+        spec = object.__new__(self.__class__)
+        spec._init(
+            self.source, target, self.fs_type, self.mnt_flags, self.data,
+            self._relpath
+        )
+        return spec
+
+    def apply(self):
+        """Perform the mount(2) call.
+        """
+        res = backend.syscall(
+            'mount', _MOUNT, self._args, (self.mnt_flags, MSFlags)
+        )
+        if res < 0:
+            _mount_error(
+                self.source, self.target, self.fs_type, self.mnt_flags,
+                self.data
+            )
+        return 0
+
+
+def _encode(value):
+    """Encode ``value`` to bytes, unless it already is.
+    """
+    if isinstance(value, bytes):
+        return value
+    return value.encode()
 
 
 def unmount(target, mnt_flags=0):
@@ -291,14 +438,37 @@ def mount_move(target, source):
     return mount(source=source, target=target, fs_type=None, mnt_flags=[MS_MOVE])
 
 
-def mount_bind(newroot, target, source=None, recursive=True, read_only=True):
+def _make_mountpoint(newroot, relpath, is_dir, builder=None):
+    """Create the mount point ``relpath`` beneath ``newroot``.
+
+    :returns:
+        ``bool`` - True if the mount point was created.
+    """
+    own_builder = builder is None
+    if own_builder:
+        builder = rootfs.RootfsBuilder(newroot)
+    try:
+        if is_dir:
+            return builder.mkdir(relpath)
+        return builder.mkfile(relpath)
+    finally:
+        if own_builder:
+            builder.close()
+
+
+def mount_bind(newroot, target, source=None, recursive=True, read_only=True,
+               builder=None):
     """Bind mounts `source` to `newroot/target` so that `source` is accessed
     when reaching `newroot/target`.
 
     If a directory, the source will be mounted using --rbind.
+
+    :params builder:
+        :class:`~tmsyscall.rootfs.RootfsBuilder` of ``newroot``, to reuse
+        its cached directories when binding many targets.
     """
     # Ensure root directory exists
-    if not os.path.exists(newroot):
+    if not backend.fs_call('exists', os.path.exists, newroot):
         raise Exception('Path %r does not exist' % newroot)
 
     if source is None:
@@ -308,27 +478,30 @@ def mount_bind(newroot, target, source=None, recursive=True, read_only=True):
     source = utils.norm_safe(source)
 
     # Make sure target directory exists.
-    if not os.path.exists(source):
+    if not backend.fs_call('exists', os.path.exists, source):
         raise Exception('Source path %r does not exist' % source)
 
-    mnt_flags = [MS_BIND]
+    is_dir = backend.fs_call('isdir', os.path.isdir, source)
+    mnt_flags = MS_BIND
 
     # Use --rbind for directories and --bind for files.
-    if recursive and os.path.isdir(source):
-        mnt_flags.append(MS_REC)
+    if recursive and is_dir:
+        mnt_flags |= MS_REC
 
     # Strip leading /, ensure that mount is relative path.
     while target.startswith('/'):
         target = target[1:]
 
-    # Create mount directory, make sure it does not exists.
+    # Create mount point beneath newroot, it may already exist.
+    backend.fs_call(
+        'make_mountpoint', _make_mountpoint, newroot, target, is_dir, builder
+    )
     target_fp = os.path.join(newroot, target)
-    if os.path.isdir(source):
-        utils.mkdir_safe(target_fp)
-    else:
-        utils.mkfile_safe(target_fp)
 
     res = mount(source=source, target=target_fp, fs_type=None, mnt_flags=mnt_flags)
+    if builder is not None:
+        # The cached directories below target are now hidden by the mount.
+        builder.invalidate(target)
 
     if res == 0 and read_only:
         res = mount(
@@ -371,13 +544,55 @@ def mount_sysfs(newroot, target='/sys'):
     )
 
 
-def mount_tmpfs(newroot, target, **mnt_opts):
+#: Valid values of the tmpfs ``huge`` option.
+TMPFS_HUGE = ('never', 'always', 'within_size', 'advise', 'deny', 'force')
+
+#: Default tmpfs mount flags.
+TMPFS_FLAGS = MS_NODEV | MS_NOEXEC | MS_NOSUID | MS_RELATIME
+
+
+def tmpfs_options(size=None, nr_inodes=None, mode=None, huge=None):
+    """Build the tmpfs specific mount options.
+
+    :params size:
+        Size limit, ``int`` in bytes or ``str`` with a k/m/g/% suffix.
+    :params nr_inodes:
+        Maximum number of inodes, ``int`` or ``str`` with a k/m/g suffix.
+    :params ``int`` mode:
+        Permissions of the tmpfs root directory.
+    :params ``str`` huge:
+        Huge pages policy, one of :data:`TMPFS_HUGE`.
+    :returns:
+        ``dict`` of mount options.
+    """
+    mnt_opts = {}
+    if size is not None:
+        mnt_opts['size'] = size
+    if nr_inodes is not None:
+        mnt_opts['nr_inodes'] = nr_inodes
+    if mode is not None:
+        mnt_opts['mode'] = '%o' % mode
+    if huge is not None:
+        if huge not in TMPFS_HUGE:
+            raise ValueError('Invalid tmpfs huge option: %r' % huge)
+        mnt_opts['huge'] = huge
+
+    return mnt_opts
+
+
+def mount_tmpfs(newroot, target, size=None, nr_inodes=None, mode=None,
+                huge=None, mnt_flags=TMPFS_FLAGS, **mnt_opts):
     """Mounts directory on tmpfs.
+
+    See :func:`tmpfs_options` for the tmpfs specific options, any other
+    keyword argument is passed as is.
     """
     while target.startswith('/'):
         target = target[1:]
 
-    mnt_flags = MS_NODEV | MS_NOEXEC | MS_NOSUID, MS_RELATIME
+    mnt_opts.update(
+        tmpfs_options(size=size, nr_inodes=nr_inodes, mode=mode, huge=huge)
+    )
 
     return mount(
         source='tmpfs',
@@ -387,6 +602,7 @@ def mount_tmpfs(newroot, target, **mnt_opts):
         **mnt_opts
     )
 
+
 class MountEntry(object):
     """Mount table entry data.
     """
@@ -397,16 +613,57 @@ class MountEntry(object):
         'fs_type',
         'mnt_opts',
         'mount_id',
-        'parent_id'
+        'parent_id',
+        'major',
+        'minor',
+        'root',
+        'shared_id',
+        'master_id',
+        'propagate_from',
+        'unbindable',
     )
 
-    def __init__(self, source, target, fs_type, mnt_opts, mount_id, parent_id):
+    def __init__(self, source, target, fs_type, mnt_opts, mount_id, parent_id, # pylint: disable=R0913
+                 major=None, minor=None, root=None, shared_id=None,
+                 master_id=None, propagate_from=None, unbindable=False):
         self.source = source
         self.target = target
         self.fs_type = fs_type
         self.mnt_opts = mnt_opts
         self.mount_id = int(mount_id)
         self.parent_id = int(parent_id)
+        self.major = major if major is None else int(major)
+        self.minor = minor if minor is None else int(minor)
+        self.root = root
+        #: Peer group of a shared mount.
+        self.shared_id = shared_id
+        #: Peer group a slave mount receives propagation from.
+        self.master_id = master_id
+        #: Closest dominant peer group, when the master is not reachable.
+        self.propagate_from = propagate_from
+        self.unbindable = unbindable
+
+    @property
+    def propagation(self):
+        """Propagation type: ``'private'``, ``'shared'``, ``'slave'``,
+        ``'shared,slave'`` or ``'unbindable'``.
+        """
+        if self.unbindable:
+            return 'unbindable'
+        types = []
+        if self.shared_id is not None:
+            types.append('shared')
+        if self.master_id is not None:
+            types.append('slave')
+        return ','.join(types) or 'private'
+
+    @property
+    def dev(self):
+        """Device number (``st_dev``) of files on this mount, if known.
+        """
+        if self.major is None or self.minor is None:
+            return None
+        return os.makedev(self.major, self.minor)
 
     def __repr__(self):
         return (
@@ -434,7 +691,14 @@ class MountEntry(object):
             (self.source == other.source) and
             (self.target == other.target) and
             (self.fs_type == other.fs_type) and
-            (self.mnt_opts == other.mnt_opts)
+            (self.mnt_opts == other.mnt_opts) and
+            (self.major == other.major) and
+            (self.minor == other.minor) and
+            (self.root == other.root) and
+            (self.shared_id == other.shared_id) and
+            (self.master_id == other.master_id) and
+            (self.propagate_from == other.propagate_from) and
+            (self.unbindable == other.unbindable)
         )
         return res
 
@@ -500,15 +764,17 @@ class MountEntry(object):
         (
             mount_id,
             parent_id,
-            _major_minor,
-            _parent_path,
+            major_minor,
+            root,
             target,
             mnt_opts
         ), data = mount_entry_line[:6], mount_entry_line[6:]
+        major, minor = major_minor.split(':')
 
-        fields = []
+        propagation = {'unbindable': False}
         while data[0] != '-':
-            fields.append(data.pop(0))
+            name, _, value = data.pop(0).partition(':')
+            propagation[name] = int(value) if value else True
 
         (
             _,
@@ -519,13 +785,25 @@ class MountEntry(object):
 
         mnt_opts = set(mnt_opts.split(',') + mnt_opts2.split(','))
 
-        return cls(source, target, fs_type, mnt_opts, mount_id, parent_id)
+        return cls(source, target, fs_type, mnt_opts, mount_id, parent_id,
+                   major=major, minor=minor, root=root,
+                   shared_id=propagation.get('shared'),
+                   master_id=propagation.get('master'),
+                   propagate_from=propagation.get('propagate_from'),
+                   unbindable=propagation['unbindable'])
 
 def list_mounts():
     """Read the current process' mounts.
     """
     mounts = []
 
+    current = backend.get_backend()
+    if current is not None:
+        return [
+            MountEntry.mount_entry_parse(mounts_line)
+            for mounts_line in current.mountinfo()
+        ]
+
     try:
         with open('/proc/self/mountinfo', 'r') as mf:
             mounts_lines = mf.readlines()
@@ -542,6 +820,32 @@ def list_mounts():
 
     return mounts
 
+
+###############################################################################
+# Single path lookups, implemented in tmsyscall.mount_lookup (which imports
+# this module).
+
+def mount_of(path, follow_symlinks=True):
+    """Return the mount ``path`` is on.
+
+    See :func:`tmsyscall.mount_lookup.mount_of`.
+
+    :returns:
+        :class:`MountEntry`
+    """
+    from tmsyscall import mount_lookup  # pylint: disable=import-outside-toplevel
+    return mount_lookup.mount_of(path, follow_symlinks)
+
+
+def is_mountpoint(path, follow_symlinks=True):
+    """Check if ``path`` is the root of a mount.
+
+    See :func:`tmsyscall.mount_lookup.is_mountpoint`.
+    """
+    from tmsyscall import mount_lookup  # pylint: disable=import-outside-toplevel
+    return mount_lookup.is_mountpoint(path, follow_symlinks)
+
+
 ###############################################################################
 def cleanup_mounts(whitelist_patterns, ignore_exc=False):
     """Prune all mount points except whitelisted ones.
@@ -609,9 +913,17 @@ __all__ = [
     'MS_SLAVE',
     'MS_SYNCHRONOUS',
     'MS_UNBINDABLE',
+    'TMPFS_FLAGS',
+    'TMPFS_HUGE',
     'MountEntry',
+    'MountSpec',
     'cleanup_mounts',
+    'is_mountpoint',
+    'list_mounts',
     'mount',
+    'mount_of',
     'mount_procfs',
+    'mount_tmpfs',
+    'tmpfs_options',
     'unmount'
 ]
@@ -0,0 +1,233 @@
+"""Path to mount resolution index.
+
+A trie keyed by path components over the mount table, answering "which
+mount contains this path" style queries in O(path depth).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import os
+
+from tmsyscall import mount as mount_mod
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _components(path):
+    """Split an absolute path into its components.
+    """
+    path = os.path.normpath(path)
+    if not path.startswith('/'):
+        raise ValueError('Not absolute path: %r' % path)
+    return [name for name in path.split('/') if name]
+
+
+class _Node(object):
+    """Trie node, one per path component.
+    """
+
+    __slots__ = (
+        'children',
+        'mounts',
+    )
+
+    def __init__(self):
+        self.children = {}
+        # Mounts stacked on this path, in the order they were added.
+        self.mounts = []
+
+    def top(self):
+        """Return the visible mount of the stack, if any.
+        """
+        if not self.mounts:
+            return None
+        below = set(entry.parent_id for entry in self.mounts)
+        for entry in reversed(self.mounts):
+            if entry.mount_id not in below:
+                return entry
+        return self.mounts[-1]
+
+
+class MountIndex(object):
+    """Index of :class:`~tmsyscall.mount.MountEntry` by mount point.
+
+    Paths are matched lexically, symlinks are not resolved.
+
+    :params entries:
+        Initial mount entries, defaults to
+        :func:`~tmsyscall.mount.list_mounts`.
+    """
+
+    __slots__ = (
+        '_root',
+        '_by_id',
+    )
+
+    def __init__(self, entries=None):
+        self._root = _Node()
+        self._by_id = {}
+        if entries is None:
+            entries = mount_mod.list_mounts()
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __contains__(self, mount_id):
+        return mount_id in self._by_id
+
+    def add(self, entry):
+        """Add a mount entry to the index.
+        """
+        if entry.mount_id in self._by_id:
+            self.remove(entry.mount_id)
+        node = self._root
+        for name in _components(entry.target):
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = _Node()
+            node = child
+        node.mounts.append(entry)
+        self._by_id[entry.mount_id] = entry
+
+    def remove(self, mount_id):
+        """Remove a mount entry, by mount ID, from the index.
+
+        :returns:
+            The removed :class:`~tmsyscall.mount.MountEntry`.
+        """
+        entry = self._by_id.pop(mount_id)
+        path = [self._root]
+        for name in _components(entry.target):
+            path.append(path[-1].children[name])
+        node = path[-1]
+        node.mounts = [
+            other for other in node.mounts if other.mount_id != mount_id
+        ]
+        # Prune nodes left without mounts or children.
+        names = _components(entry.target)
+        while len(path) > 1 and not path[-1].mounts and \
+                not path[-1].children:
+            path.pop()
+            del path[-1].children[names.pop()]
+        return entry
+
+    def update(self, entries=None):
+        """Apply the changes between the indexed and the given mount table.
+
+        :params entries:
+            Current mount entries, defaults to
+            :func:`~tmsyscall.mount.list_mounts`.
+        :returns:
+            ``tuple`` of the added and removed entries.
+        """
+        if entries is None:
+            entries = mount_mod.list_mounts()
+        current = dict((entry.mount_id, entry) for entry in entries)
+        removed = [
+            self.remove(mount_id)
+            for mount_id in list(self._by_id)
+            if mount_id not in current or
+            current[mount_id] != self._by_id[mount_id]
+        ]
+        added = [
+            entry for mount_id, entry in current.items()
+            if mount_id not in self._by_id
+        ]
+        for entry in added:
+            self.add(entry)
+        return added, removed
+
+    def get(self, mount_id, default=None):
+        """Return the entry of mount ``mount_id``.
+        """
+        return self._by_id.get(mount_id, default)
+
+    def _find(self, path):
+        """Return the deepest node with mounts on the way to ``path``, and the
+        remaining path components below it.
+        """
+        names = _components(path)
+        node = self._root
+        found, depth = (node if node.mounts else None), 0
+        for idx, name in enumerate(names):
+            node = node.children.get(name)
+            if node is None:
+                break
+            if node.mounts:
+                found, depth = node, idx + 1
+        return found, names[depth:]
+
+    def containing(self, path):
+        """Return the mount that ``path`` is on.
+
+        :returns:
+            :class:`~tmsyscall.mount.MountEntry` or ``None``.
+        """
+        node, _rest = self._find(path)
+        if node is None:
+            return None
+        return node.top()
+
+    def resolve(self, path):
+        """Return the mount ``path`` is on and the path inside that mount's
+        filesystem.
+
+        The latter takes the mount root into account, i.e. for a bind mount
+        it is the path in the filesystem the bind mount was made from.
+
+        :returns:
+            ``tuple`` of :class:`~tmsyscall.mount.MountEntry` and ``str``, or
+            ``(None, None)``.
+        """
+        node, rest = self._find(path)
+        if node is None:
+            return None, None
+        entry = node.top()
+        return entry, os.path.join(entry.root or '/', *rest)
+
+    def is_mountpoint(self, path):
+        """Check if a mount is mounted on ``path``.
+        """
+        node = self._root
+        for name in _components(path):
+            node = node.children.get(name)
+            if node is None:
+                return False
+        return bool(node.mounts)
+
+    def submounts(self, path):
+        """Return all the mounts on or below ``path``.
+
+        :returns:
+            ``list`` of :class:`~tmsyscall.mount.MountEntry`, parents first.
+        """
+        node = self._root
+        for name in _components(path):
+            node = node.children.get(name)
+            if node is None:
+                return []
+
+        res = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            res.extend(node.mounts)
+            stack.extend(
+                node.children[name] for name in sorted(node.children,
+                                                       reverse=True)
+            )
+        return res
+
+
+__all__ = [
+    'MountIndex',
+]
@@ -0,0 +1,229 @@
+"""Single path mount lookups.
+
+Find the mount of a path without reading and parsing the whole mount table:
+statx(2) gives the mount ID of the path, and statmount(2) describes that
+mount. The implementation is picked from the probed
+:mod:`~tmsyscall.features`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+
+from tmsyscall import features
+from tmsyscall import mount as mount_mod
+from tmsyscall import mount_index
+from tmsyscall import statmount
+from tmsyscall import statx
+
+_LOGGER = logging.getLogger(__name__)
+
+# Mount entries by (legacy) mount ID, refreshed from list_mounts() on miss
+# or mismatch.
+_MOUNT_IDS = {}
+
+_STATMOUNT_MASK = (
+    statmount.STATMOUNT_SB_BASIC |
+    statmount.STATMOUNT_MNT_BASIC |
+    statmount.STATMOUNT_MNT_ROOT |
+    statmount.STATMOUNT_MNT_POINT |
+    statmount.STATMOUNT_FS_TYPE |
+    statmount.STATMOUNT_MNT_OPTS |
+    statmount.STATMOUNT_SB_SOURCE |
+    statmount.STATMOUNT_PROPAGATE_FROM
+)
+
+# Per-mount attributes, as reported in mountinfo.
+_MOUNT_ATTR_OPTS = (
+    (statmount.MOUNT_ATTR_NOSUID, 'nosuid'),
+    (statmount.MOUNT_ATTR_NODEV, 'nodev'),
+    (statmount.MOUNT_ATTR_NOEXEC, 'noexec'),
+    (statmount.MOUNT_ATTR_NODIRATIME, 'nodiratime'),
+    (statmount.MOUNT_ATTR_NOSYMFOLLOW, 'nosymfollow'),
+)
+
+
+def _statmount_entry(mnt_id):
+    """Build the :class:`~tmsyscall.mount.MountEntry` of unique mount ID ``mnt_id`` with
+    statmount(2).
+
+    :returns:
+        :class:`~tmsyscall.mount.MountEntry` or ``None`` if statmount(2) is not supported or
+        does not return all the needed fields.
+    """
+    try:
+        stm = statmount.statmount(mnt_id, _STATMOUNT_MASK)
+    except OSError as err:
+        if err.errno != errno.ENOSYS:
+            raise
+        features.mark_unsupported(features.STATMOUNT)
+        return None
+
+    needed = _STATMOUNT_MASK & ~statmount.STATMOUNT_MNT_OPTS
+    if stm.mask & needed != needed:
+        return None
+
+    mnt_opts = set(stm.mnt_opts.split(',') if stm.mnt_opts else [])
+    mnt_opts.add('ro' if stm.mnt_attr & statmount.MOUNT_ATTR_RDONLY else 'rw')
+    mnt_opts.add('ro' if stm.sb_flags & statmount.SB_RDONLY else 'rw')
+    for attr, option in _MOUNT_ATTR_OPTS:
+        if stm.mnt_attr & attr:
+            mnt_opts.add(option)
+    atime = stm.mnt_attr & statmount.MOUNT_ATTR__ATIME
+    if atime == statmount.MOUNT_ATTR_RELATIME:
+        mnt_opts.add('relatime')
+    elif atime == statmount.MOUNT_ATTR_NOATIME:
+        mnt_opts.add('noatime')
+
+    fs_type = stm.fs_type
+    if stm.fs_subtype:
+        fs_type = '%s.%s' % (fs_type, stm.fs_subtype)
+
+    return mount_mod.MountEntry(
+        stm.sb_source, stm.mnt_point, fs_type, mnt_opts,
+        stm.mnt_id_old, stm.mnt_parent_id_old,
+        major=stm.sb_dev_major, minor=stm.sb_dev_minor, root=stm.mnt_root,
+        shared_id=stm.mnt_peer_group or None,
+        master_id=stm.mnt_master or None,
+        propagate_from=stm.propagate_from or None,
+        unbindable=bool(stm.mnt_propagation & mount_mod.MS_UNBINDABLE)
+    )
+
+
+def _real_path(path, follow_symlinks):
+    """Resolve ``path``, leaving its last component alone unless
+    ``follow_symlinks``.
+    """
+    if follow_symlinks:
+        return os.path.realpath(path)
+    return os.path.join(
+        os.path.realpath(os.path.dirname(path) or '.'),
+        os.path.basename(path)
+    )
+
+
+def _covers(entry, real_path):
+    """Check that mount ``entry`` is still the mount of ``real_path``: the
+    path is below its target, and its target is still the root of a mount of
+    the same device.
+    """
+    target = entry.target.rstrip('/') + '/'
+    if not (real_path + '/').startswith(target):
+        return False
+    try:
+        stx = statx.statx(entry.target, 0, statx.AT_NO_AUTOMOUNT)
+    except OSError as err:
+        if err.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+            raise
+        return False
+    return stx.dev == entry.dev
+
+
+def _mount_by_id(mount_id, path, follow_symlinks):
+    """Return the :class:`~tmsyscall.mount.MountEntry` of (legacy) mount ID
+    ``mount_id``, the mount of ``path``.
+
+    Legacy mount IDs are reused once a mount is gone, so the cached entry is
+    checked against ``path`` and the cached mount table is read again if it
+    does not match.
+    """
+    global _MOUNT_IDS  # pylint: disable=global-statement
+
+    entry = _MOUNT_IDS.get(mount_id)
+    if entry is None or not _covers(entry, _real_path(path, follow_symlinks)):
+        _MOUNT_IDS = dict(
+            (mount_entry.mount_id, mount_entry)
+            for mount_entry in mount_mod.list_mounts()
+        )
+        entry = _MOUNT_IDS.get(mount_id)
+    if entry is None:
+        raise OSError(
+            errno.ENOENT, os.strerror(errno.ENOENT),
+            'mount ID %d' % mount_id
+        )
+    return entry
+
+
+def _mount_by_path(path, follow_symlinks):
+    """Find the mount of ``path`` in :func:`~tmsyscall.mount.list_mounts`,
+    by path and device, for kernels without ``STATX_MNT_ID``.
+    """
+    real_path = _real_path(path, follow_symlinks)
+    if follow_symlinks:
+        dev = os.stat(path).st_dev
+    else:
+        dev = os.lstat(path).st_dev
+
+    entries = mount_mod.list_mounts()
+    entry = mount_index.MountIndex(entries).containing(real_path)
+    if entry is None:
+        raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    # Of the mounts stacked on the same target, the topmost one is visible,
+    # unless the device says otherwise (it is not conclusive on its own:
+    # btrfs subvolumes or overlayfs report another device).
+    for other in entries:
+        if other.target == entry.target and other.dev == dev:
+            entry = other
+    return entry
+
+
+def mount_of(path, follow_symlinks=True):
+    """Return the mount ``path`` is on.
+
+    Uses statx(2) to get the mount ID of ``path`` and then statmount(2)
+    (Linux 6.8+) to describe that single mount. On older kernels the mount
+    is looked up by ID in a cached copy of
+    :func:`~tmsyscall.mount.list_mounts`, and without ``STATX_MNT_ID``
+    (before Linux 5.8) by path in the mount table.
+
+    :returns:
+        :class:`~tmsyscall.mount.MountEntry`
+    """
+    if not features.supported(features.STATX_MNT_ID):
+        return _mount_by_path(path, follow_symlinks)
+
+    flags = statx.AT_NO_AUTOMOUNT
+    if not follow_symlinks:
+        flags |= statx.AT_SYMLINK_NOFOLLOW
+
+    mask = statx.STATX_MNT_ID
+    if features.supported(features.STATMOUNT):
+        mask |= statx.STATX_MNT_ID_UNIQUE
+    stx = statx.statx(path, mask, flags)
+
+    if stx.stx_mask & statx.STATX_MNT_ID_UNIQUE:
+        entry = _statmount_entry(stx.stx_mnt_id)
+        if entry is not None:
+            return entry
+        stx = statx.statx(path, statx.STATX_MNT_ID, flags)
+
+    if not stx.stx_mask & statx.STATX_MNT_ID:
+        features.mark_unsupported(features.STATX_MNT_ID)
+        return _mount_by_path(path, follow_symlinks)
+    return _mount_by_id(stx.stx_mnt_id, path, follow_symlinks)
+
+
+def is_mountpoint(path, follow_symlinks=True):
+    """Check if ``path`` is the root of a mount, with a single statx(2).
+    """
+    flags = statx.AT_NO_AUTOMOUNT
+    if not follow_symlinks:
+        flags |= statx.AT_SYMLINK_NOFOLLOW
+
+    stx = statx.statx(path, 0, flags)
+    if stx.stx_attributes_mask & statx.STATX_ATTR_MOUNT_ROOT:
+        return bool(stx.stx_attributes & statx.STATX_ATTR_MOUNT_ROOT)
+
+    # Kernels before 5.8 do not report the mount root attribute.
+    return os.path.ismount(path)
+
+
+__all__ = [
+    'is_mountpoint',
+    'mount_of',
+]
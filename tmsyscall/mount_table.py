@@ -0,0 +1,409 @@
+"""Mount table shared between processes through a memory-mapped file.
+
+One :class:`MountTablePublisher` watches the mount table and writes a
+compact snapshot of it, tagged with a generation number, to a file
+(ideally on tmpfs, e.g. under ``/run`` or ``/dev/shm``). Any number of
+:class:`MountTable` readers map that file and read entries straight from
+the mapping, instead of each parsing ``/proc/self/mountinfo``.
+
+Snapshots are replaced atomically (written aside then renamed), a reader
+only remaps the file when a new generation was published.
+
+File layout (little endian)::
+
+    header:  magic "TMMT", version (u32), generation (u64), count (u32),
+             reserved (u32)
+    records: count x (mount_id, parent_id, major, minor, source, target,
+             fs_type, mnt_opts, root, shared_id, master_id,
+             propagate_from, unbindable) as u32, strings are offsets of
+             NUL terminated UTF-8 strings
+    strings: de-duplicated string pool
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import mmap
+import os
+import select
+import struct
+import tempfile
+import threading
+
+import six
+
+from tmsyscall import mount as mount_mod
+
+_LOGGER = logging.getLogger(__name__)
+
+_MAGIC = b'TMMT'
+_VERSION = 2
+
+_HEADER = struct.Struct('<4sIQII')
+_RECORD = struct.Struct('<13I')
+
+# Stored in place of unknown (None) integers.
+_NONE = 0xffffffff
+
+
+def _encode(value):
+    return six.ensure_binary(value, 'utf-8', 'surrogateescape')
+
+
+def _decode(value):
+    return six.ensure_str(value, 'utf-8', 'surrogateescape')
+
+
+def _int(value):
+    return _NONE if value is None else value
+
+
+def serialize(entries, generation):
+    """Serialize mount ``entries`` into a snapshot.
+
+    :params ``list`` entries:
+        :class:`~tmsyscall.mount.MountEntry` instances.
+    :params ``int`` generation:
+        Generation number of the snapshot.
+    :returns:
+        ``bytes``
+    """
+    entries = list(entries)
+    strings = {}
+    pool = []
+    pool_start = _HEADER.size + _RECORD.size * len(entries)
+    pool_size = [pool_start]
+
+    def _intern(value):
+        data = _encode(value or '')
+        offset = strings.get(data)
+        if offset is None:
+            offset = strings[data] = pool_size[0]
+            pool.append(data + b'\0')
+            pool_size[0] += len(data) + 1
+        return offset
+
+    records = []
+    for entry in entries:
+        records.append(_RECORD.pack(
+            entry.mount_id,
+            entry.parent_id,
+            _int(entry.major),
+            _int(entry.minor),
+            _intern(entry.source),
+            _intern(entry.target),
+            _intern(entry.fs_type),
+            _intern(','.join(sorted(entry.mnt_opts))),
+            _intern(entry.root),
+            _int(entry.shared_id),
+            _int(entry.master_id),
+            _int(entry.propagate_from),
+            int(entry.unbindable),
+        ))
+
+    header = _HEADER.pack(_MAGIC, _VERSION, generation, len(entries), 0)
+    return b''.join([header] + records + pool)
+
+
+class MountEntryView(mount_mod.MountEntry):
+    """Read-only :class:`~tmsyscall.mount.MountEntry` backed by a snapshot.
+
+    Fields are decoded from the mapping on access.
+    """
+
+    __slots__ = (
+        '_buf',
+        '_offset',
+    )
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, buf, offset):
+        self._buf = buf
+        self._offset = offset
+
+    def _field(self, idx):
+        return _RECORD.unpack_from(self._buf, self._offset)[idx]
+
+    def _string(self, idx):
+        start = self._field(idx)
+        end = self._buf.find(b'\0', start)
+        return _decode(self._buf[start:end])
+
+    def _optional(self, idx):
+        value = self._field(idx)
+        return None if value == _NONE else value
+
+    mount_id = property(lambda self: self._field(0))
+    parent_id = property(lambda self: self._field(1))
+    major = property(lambda self: self._optional(2))
+    minor = property(lambda self: self._optional(3))
+    source = property(lambda self: self._string(4))
+    target = property(lambda self: self._string(5))
+    fs_type = property(lambda self: self._string(6))
+    root = property(lambda self: self._string(8) or None)
+    shared_id = property(lambda self: self._optional(9))
+    master_id = property(lambda self: self._optional(10))
+    propagate_from = property(lambda self: self._optional(11))
+    unbindable = property(lambda self: bool(self._field(12)))
+
+    @property
+    def mnt_opts(self):
+        """Mount options, as a ``set``.
+        """
+        opts = self._string(7)
+        return set(opts.split(',')) if opts else set()
+
+    def copy(self):
+        """Return a plain :class:`~tmsyscall.mount.MountEntry` of the view.
+        """
+        return mount_mod.MountEntry(
+            self.source, self.target, self.fs_type, self.mnt_opts,
+            self.mount_id, self.parent_id,
+            major=self.major, minor=self.minor, root=self.root,
+            shared_id=self.shared_id, master_id=self.master_id,
+            propagate_from=self.propagate_from, unbindable=self.unbindable
+        )
+
+
+def _read_generation(path):
+    """Return the generation of the snapshot at ``path``, ``None`` if there
+    is no valid snapshot there.
+    """
+    try:
+        with open(path, 'rb') as snapshot:
+            data = snapshot.read(_HEADER.size)
+    except EnvironmentError as err:
+        if err.errno == errno.ENOENT:
+            return None
+        raise
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, generation, _, _ = _HEADER.unpack(data)
+    if magic != _MAGIC or version != _VERSION:
+        return None
+    return generation
+
+
+class MountTable(object):
+    """Reader of a mount table snapshot published by
+    :class:`MountTablePublisher`.
+
+    :params ``str`` path:
+        Snapshot file.
+    :raises ``OSError``:
+        If there is no snapshot at ``path``.
+    :raises ``ValueError``:
+        If ``path`` is not a valid snapshot.
+    """
+
+    __slots__ = (
+        'path',
+        'generation',
+        '_buf',
+        '_count',
+        '_ident',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        #: Generation of the mapped snapshot.
+        self.generation = None
+        self._buf = None
+        self._count = 0
+        self._ident = None
+        self.refresh()
+
+    def __repr__(self):
+        return '{name}(path={path!r}, generation={generation!r})'.format(
+            name=self.__class__.__name__,
+            path=self.path,
+            generation=self.generation,
+        )
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        buf = self._buf
+        for idx in six.moves.range(self._count):
+            yield MountEntryView(buf, _HEADER.size + idx * _RECORD.size)
+
+    def entries(self):
+        """Return the entries of the snapshot, as :class:`MountEntryView`.
+        """
+        return list(self)
+
+    def refresh(self):
+        """Map the latest published snapshot, if it changed.
+
+        Checking is a single ``stat(2)`` unless a new snapshot was published.
+
+        :returns:
+            ``bool`` - True if a new generation was mapped.
+        """
+        info = os.stat(self.path)
+        ident = (info.st_dev, info.st_ino)
+        if ident == self._ident:
+            return False
+
+        with open(self.path, 'rb') as snapshot:
+            info = os.fstat(snapshot.fileno())
+            buf = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, generation, count, _ = _HEADER.unpack_from(buf)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('Invalid mount table snapshot: %r' % self.path)
+
+        self._ident = (info.st_dev, info.st_ino)
+        if generation == self.generation:
+            return False
+        # Views of the previous snapshot keep their mapping alive.
+        self._buf = buf
+        self._count = count
+        self.generation = generation
+        return True
+
+
+class MountTablePublisher(object):
+    """Publish the mount table of the current process to ``path``.
+
+    :params ``str`` path:
+        Snapshot file, its directory must exist.
+    :params ``int`` mode:
+        Permissions of the snapshot file.
+    """
+
+    def __init__(self, path, mode=0o644):
+        self.path = path
+        self.mode = mode
+        #: Generation of the last published snapshot, continues from the
+        #: one found in ``path``.
+        self.generation = _read_generation(path) or 0
+        self._last = None
+        self._mountinfo = None
+        self._poll = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def publish(self, entries=None):
+        """Publish a snapshot of ``entries`` (default: the current mounts).
+
+        Nothing is written if the table did not change since the last call.
+
+        :returns:
+            ``bool`` - True if a new generation was published.
+        """
+        # Arm the change notification before reading the table, so that no
+        # change goes unnoticed by wait().
+        self._arm()
+        if entries is None:
+            entries = mount_mod.list_mounts()
+        entries = list(entries)
+        # Everything but the header, which holds the generation.
+        payload = serialize(entries, 0)[_HEADER.size:]
+        if payload == self._last:
+            return False
+
+        generation = self.generation + 1
+        header = _HEADER.pack(_MAGIC, _VERSION, generation, len(entries), 0)
+
+        dirname, basename = os.path.split(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.' + basename)
+        try:
+            with os.fdopen(fd, 'wb') as snapshot:
+                snapshot.write(header)
+                snapshot.write(payload)
+                os.fchmod(snapshot.fileno(), self.mode)
+            os.rename(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self._last = payload
+        self.generation = generation
+        return True
+
+    def _arm(self):
+        """(Re)arm the mount table change notification.
+        """
+        if self._mountinfo is None:
+            # Kept open across calls, closed by close().
+            mountinfo = open(  # pylint: disable=consider-using-with
+                '/proc/self/mountinfo', 'rb'
+            )
+            try:
+                poller = select.poll()
+                poller.register(
+                    mountinfo.fileno(), select.POLLPRI | select.POLLERR
+                )
+            except BaseException:
+                mountinfo.close()
+                raise
+            self._mountinfo, self._poll = mountinfo, poller
+        self._mountinfo.seek(0)
+        self._mountinfo.read()
+
+    def wait(self, timeout=None):
+        """Wait for a change of the mount table since the last
+        :meth:`publish`.
+
+        The kernel flags ``/proc/self/mountinfo`` with ``POLLPRI`` on every
+        mount table change.
+
+        :params ``float`` timeout:
+            Seconds to wait, ``None`` for ever.
+        :returns:
+            ``bool`` - True if the mount table changed.
+        """
+        if self._mountinfo is None:
+            self._arm()
+        events = self._poll.poll(None if timeout is None else timeout * 1000)
+        return bool(events)
+
+    def run(self, poll_interval=0.5):
+        """Publish the mount table until :meth:`close` is called.
+        """
+        self.publish()
+        while not self._stop.is_set():
+            if self.wait(poll_interval):
+                self.publish()
+
+    def start(self):
+        """Publish the mount table from a background thread.
+        """
+        self.publish()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run,
+                                        name='mount-table-publisher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stop publishing.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._mountinfo is not None:
+            self._mountinfo.close()
+            self._mountinfo = None
+            self._poll = None
+
+
+__all__ = [
+    'MountEntryView',
+    'MountTable',
+    'MountTablePublisher',
+    'serialize',
+]
@@ -0,0 +1,364 @@
+"""Per-mount I/O statistics from /proc/<pid>/mountstats.
+
+The kernel reports, for NFS mounts, event and byte counters as well as
+per-operation counts, round trip and execution times. :func:`iter_mountstats`
+parses the file as a stream, :func:`sample` takes a timestamped snapshot and
+:func:`diff` turns two snapshots into rates.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import logging
+import re
+import time
+
+from tmsyscall import mount as mount_mod
+
+_LOGGER = logging.getLogger(__name__)
+
+_DEVICE_RE = re.compile(
+    r'^device (?P<device>\S+) mounted on (?P<mount_point>\S+) '
+    r'with fstype (?P<fs_type>\S+)(?: statvers=(?P<statvers>\S+))?'
+)
+
+#: Counters of the ``bytes:`` line, in order.
+BYTES_COUNTERS = (
+    'normal_read',
+    'normal_write',
+    'direct_read',
+    'direct_write',
+    'server_read',
+    'server_write',
+    'read_pages',
+    'write_pages',
+)
+
+
+class OpStats(object):
+    """Statistics of one RPC operation of a mount.
+
+    Times are cumulated milliseconds.
+    """
+
+    __slots__ = (
+        'ops',
+        'transmissions',
+        'timeouts',
+        'bytes_sent',
+        'bytes_recv',
+        'queue_ms',
+        'rtt_ms',
+        'execute_ms',
+        'errors',
+    )
+
+    def __init__(self, *values):
+        values = list(values) + [0] * (len(self.__slots__) - len(values))
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, int(value))
+
+    def __repr__(self):
+        return '{name}(ops={ops!r}, rtt_ms={rtt_ms!r})'.format(
+            name=self.__class__.__name__,
+            ops=self.ops,
+            rtt_ms=self.rtt_ms,
+        )
+
+
+class MountStats(object):
+    """Statistics of one mount.
+
+    Mounts without statistics (anything but NFS) only have the fields of
+    the ``device`` line set.
+    """
+
+    __slots__ = (
+        'device',
+        'mount_point',
+        'fs_type',
+        'statvers',
+        'opts',
+        'age',
+        'events',
+        'bytes',
+        'xprt',
+        'ops',
+        'entry',
+    )
+
+    def __init__(self, device, mount_point, fs_type, statvers=None):
+        self.device = device
+        self.mount_point = mount_point
+        self.fs_type = fs_type
+        self.statvers = statvers
+        #: Mount options, as a ``dict`` (``None`` for flag options).
+        self.opts = {}
+        #: Seconds since the mount was made.
+        self.age = None
+        #: Event counters, as a ``list``.
+        self.events = []
+        #: ``bytes:`` counters, by :data:`BYTES_COUNTERS` name.
+        self.bytes = {}
+        #: Transport statistics, as the raw ``list`` of fields.
+        self.xprt = []
+        #: :class:`OpStats` by operation name.
+        self.ops = collections.OrderedDict()
+        #: Matching :class:`~tmsyscall.mount.MountEntry`, if joined.
+        self.entry = None
+
+    @property
+    def key(self):
+        """``(device, mount_point)`` identifying the mount.
+        """
+        return (self.device, self.mount_point)
+
+    def __repr__(self):
+        return (
+            '{name}(device={device!r}, mount_point={mount_point!r}, '
+            'fs_type={fs_type!r})'
+        ).format(
+            name=self.__class__.__name__,
+            device=self.device,
+            mount_point=self.mount_point,
+            fs_type=self.fs_type,
+        )
+
+    def _parse_line(self, line):
+        """Parse one statistics line of the mount.
+        """
+        tag, _, value = line.strip().partition(':')
+        value = value.strip()
+        if tag == 'opts':
+            for opt in value.split(','):
+                name, sep, opt_value = opt.partition('=')
+                self.opts[name] = opt_value if sep else None
+        elif tag == 'age':
+            self.age = int(value)
+        elif tag == 'events':
+            self.events = [int(x) for x in value.split()]
+        elif tag == 'bytes':
+            self.bytes = dict(
+                zip(BYTES_COUNTERS, (int(x) for x in value.split()))
+            )
+        elif tag == 'xprt':
+            self.xprt = value.split()
+
+    def _parse_op(self, line):
+        """Parse one line of the per-op statistics of the mount.
+        """
+        name, sep, value = line.strip().partition(':')
+        if sep and value.strip():
+            self.ops[name] = OpStats(*value.split())
+
+
+def _parse(lines):
+    """Parse mountstats ``lines``, one mount at a time.
+    """
+    # pylint: disable=protected-access
+    current = None
+    in_ops = False
+    for line in lines:
+        match = _DEVICE_RE.match(line)
+        if match:
+            if current is not None:
+                yield current
+            current = MountStats(**match.groupdict())
+            in_ops = False
+        elif current is None or not line.strip():
+            continue
+        elif in_ops:
+            current._parse_op(line)
+        elif line.strip() == 'per-op statistics':
+            in_ops = True
+        else:
+            current._parse_line(line)
+    if current is not None:
+        yield current
+
+
+def iter_mountstats(pid='self', stream=None):
+    """Parse a mountstats file, one mount at a time.
+
+    :params pid:
+        Process whose mounts to read.
+    :params stream:
+        Already open mountstats file (or any iterable of lines), instead of
+        ``/proc/<pid>/mountstats``.
+    :returns:
+        Generator of :class:`MountStats`.
+    """
+    if stream is not None:
+        for mount_stats in _parse(stream):
+            yield mount_stats
+        return
+
+    with open('/proc/%s/mountstats' % pid, 'r') as mountstats:
+        for mount_stats in _parse(mountstats):
+            yield mount_stats
+
+
+def join(stats, entries=None):
+    """Set the ``entry`` of ``stats`` to the matching mount entries.
+
+    Mounts are matched by source device and mount point, the last (top)
+    mount wins for stacked mounts.
+
+    :params ``list`` entries:
+        Mount entries, defaults to :func:`~tmsyscall.mount.list_mounts`.
+    :returns:
+        ``list`` of :class:`MountStats`.
+    """
+    if entries is None:
+        entries = mount_mod.list_mounts()
+    by_key = dict(((entry.source, entry.target), entry) for entry in entries)
+    stats = list(stats)
+    for mount_stats in stats:
+        mount_stats.entry = by_key.get(mount_stats.key)
+    return stats
+
+
+class Sample(object):
+    """Timestamped mountstats snapshot.
+    """
+
+    __slots__ = (
+        'time',
+        'mounts',
+    )
+
+    def __init__(self, timestamp, mounts):
+        #: Time of the sample.
+        self.time = timestamp
+        #: :class:`MountStats` by ``(device, mount_point)``.
+        self.mounts = mounts
+
+
+def sample(pid='self', only_stats=True):
+    """Take a :class:`Sample` of the mount statistics of ``pid``.
+
+    :params ``bool`` only_stats:
+        Skip the mounts without statistics.
+    """
+    timestamp = time.time()
+    mounts = collections.OrderedDict()
+    for stats in join(iter_mountstats(pid)):
+        if only_stats and stats.statvers is None:
+            continue
+        mounts[stats.key] = stats
+    return Sample(timestamp, mounts)
+
+
+class OpRates(object):
+    """Rates of one RPC operation over a sampling interval.
+
+    ``ops``, ``bytes_sent``, ``bytes_recv`` and ``errors`` are per second,
+    ``rtt_ms`` and ``execute_ms`` are averages per operation.
+    """
+
+    __slots__ = (
+        'ops',
+        'bytes_sent',
+        'bytes_recv',
+        'errors',
+        'rtt_ms',
+        'execute_ms',
+    )
+
+    def __init__(self, before, after, interval):
+        ops = after.ops - before.ops
+        self.ops = ops / interval
+        self.bytes_sent = (after.bytes_sent - before.bytes_sent) / interval
+        self.bytes_recv = (after.bytes_recv - before.bytes_recv) / interval
+        self.errors = (after.errors - before.errors) / interval
+        self.rtt_ms = (after.rtt_ms - before.rtt_ms) / ops if ops else 0.0
+        self.execute_ms = (
+            (after.execute_ms - before.execute_ms) / ops if ops else 0.0
+        )
+
+    def __repr__(self):
+        return '{name}(ops={ops!r}, rtt_ms={rtt_ms!r})'.format(
+            name=self.__class__.__name__,
+            ops=self.ops,
+            rtt_ms=self.rtt_ms,
+        )
+
+
+class MountRates(object):
+    """Rates of one mount between two samples.
+    """
+
+    __slots__ = (
+        'stats',
+        'interval',
+        'bytes',
+        'ops',
+    )
+
+    def __init__(self, before, after, interval):
+        #: Latest :class:`MountStats` of the mount.
+        self.stats = after
+        #: Seconds between the samples.
+        self.interval = interval
+        #: ``bytes:`` counters per second.
+        self.bytes = dict(
+            (name, (value - before.bytes.get(name, 0)) / interval)
+            for name, value in after.bytes.items()
+        )
+        #: :class:`OpRates` by operation name, idle operations skipped.
+        self.ops = collections.OrderedDict(
+            (name, OpRates(before.ops.get(name, OpStats()), stats, interval))
+            for name, stats in after.ops.items()
+            if stats.ops != before.ops.get(name, OpStats()).ops
+        )
+
+    def __repr__(self):
+        return '{name}(mount_point={mount_point!r}, ops={ops!r})'.format(
+            name=self.__class__.__name__,
+            mount_point=self.stats.mount_point,
+            ops=list(self.ops),
+        )
+
+
+def diff(before, after):
+    """Compute the rates of the mounts present in both samples.
+
+    Mounts remounted between the samples (their age went down) are skipped.
+
+    :params before:
+        Older :class:`Sample`.
+    :params after:
+        Newer :class:`Sample`.
+    :returns:
+        ``dict`` of :class:`MountRates` by ``(device, mount_point)``.
+    """
+    interval = after.time - before.time
+    if interval <= 0:
+        raise ValueError('Samples must be taken in order')
+    res = collections.OrderedDict()
+    for key, stats in after.mounts.items():
+        old = before.mounts.get(key)
+        if old is None:
+            continue
+        if old.age is not None and stats.age is not None and \
+                stats.age < old.age:
+            continue
+        res[key] = MountRates(old, stats, interval)
+    return res
+
+
+__all__ = [
+    'BYTES_COUNTERS',
+    'MountRates',
+    'MountStats',
+    'OpRates',
+    'OpStats',
+    'Sample',
+    'diff',
+    'iter_mountstats',
+    'join',
+    'sample',
+]
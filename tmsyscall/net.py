@@ -0,0 +1,87 @@
+"""Minimal network interface configuration via ioctl(2).
+
+Used to bring up the loopback interface of a new network namespace
+without spawning ``ip``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import fcntl
+import logging
+import socket
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+
+###############################################################################
+# Constants copied from linux/sockios.h and net/if.h
+
+#: Get interface flags.
+SIOCGIFFLAGS = 0x8913
+#: Set interface flags.
+SIOCSIFFLAGS = 0x8914
+
+#: Interface is up.
+IFF_UP = 0x1
+#: Interface is a loopback.
+IFF_LOOPBACK = 0x8
+#: Resources allocated.
+IFF_RUNNING = 0x40
+
+# struct ifreq: interface name and the (short) ifr_flags member of the union.
+_IFREQ_FLAGS = struct.Struct(str('16sH22x'))
+
+
+def _ioctl_flags(sock, request, ifname, flags=0):
+    if not isinstance(ifname, bytes):
+        ifname = ifname.encode()
+    ifreq = _IFREQ_FLAGS.pack(ifname, flags)
+    res = fcntl.ioctl(sock.fileno(), request, ifreq)
+    return _IFREQ_FLAGS.unpack(res)[1]
+
+
+def link_flags(ifname):
+    """Return the ``IFF_*`` flags of interface ``ifname``.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        return _ioctl_flags(sock, SIOCGIFFLAGS, ifname)
+    finally:
+        sock.close()
+
+
+def set_link_up(ifname, up=True):
+    """Bring interface ``ifname`` up (or down) in the current network
+    namespace.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        flags = _ioctl_flags(sock, SIOCGIFFLAGS, ifname)
+        if up:
+            new_flags = flags | IFF_UP
+        else:
+            new_flags = flags & ~IFF_UP
+        if new_flags != flags:
+            _ioctl_flags(sock, SIOCSIFFLAGS, ifname, new_flags)
+    finally:
+        sock.close()
+
+
+def loopback_up():
+    """Bring up the ``lo`` interface of the current network namespace.
+    """
+    set_link_up('lo')
+
+
+__all__ = [
+    'IFF_LOOPBACK',
+    'IFF_RUNNING',
+    'IFF_UP',
+    'link_flags',
+    'loopback_up',
+    'set_link_up',
+]
@@ -16,6 +16,8 @@ from ctypes import (
 )
 from ctypes.util import find_library
 
+from tmsyscall import backend
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -42,7 +44,9 @@ def pivot_root(new_root, put_old):
     if put_old is not None:
         put_old = put_old.encode()
 
-    retcode = _PIVOT_ROOT(new_root, put_old)
+    retcode = backend.syscall(
+        'pivot_root', _PIVOT_ROOT, (new_root, put_old)
+    )
     if retcode != 0:
         errno = ctypes.get_errno()
         msg = '{} => {}'.format(put_old, new_root)
@@ -0,0 +1,122 @@
+"""Mount propagation inspection and changes.
+
+See https://www.kernel.org/doc/Documentation/filesystems/sharedsubtree.txt
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import errno
+import logging
+
+from tmsyscall import features
+from tmsyscall import fsmount
+from tmsyscall import mount as mount_mod
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Propagation type names and their mount flag.
+PROPAGATION_FLAGS = {
+    'private': mount_mod.MS_PRIVATE,
+    'shared': mount_mod.MS_SHARED,
+    'slave': mount_mod.MS_SLAVE,
+    'unbindable': mount_mod.MS_UNBINDABLE,
+}
+
+def peer_groups(entries=None):
+    """Group the shared mounts by peer group.
+
+    :params ``list`` entries:
+        Mount entries, defaults to :func:`~tmsyscall.mount.list_mounts`.
+    :returns:
+        ``dict`` of ``list`` of :class:`~tmsyscall.mount.MountEntry` by peer
+        group ID.
+    """
+    if entries is None:
+        entries = mount_mod.list_mounts()
+    groups = collections.OrderedDict()
+    for entry in entries:
+        if entry.shared_id is not None:
+            groups.setdefault(entry.shared_id, []).append(entry)
+    return groups
+
+
+def propagation_targets(entry, entries=None):
+    """Find where mount events below ``entry`` propagate to.
+
+    Events propagate to the peers of a shared mount and to the slaves of
+    its peer group, then on from those slaves which are shared themselves.
+
+    :params entry:
+        Origin :class:`~tmsyscall.mount.MountEntry`.
+    :params ``list`` entries:
+        Mount entries, defaults to :func:`~tmsyscall.mount.list_mounts`.
+    :returns:
+        ``list`` of the receiving :class:`~tmsyscall.mount.MountEntry`.
+    """
+    if entries is None:
+        entries = mount_mod.list_mounts()
+    entries = list(entries)
+    if entry.shared_id is None:
+        return []
+
+    slaves = collections.defaultdict(list)
+    for other in entries:
+        if other.master_id is not None:
+            slaves[other.master_id].append(other)
+    groups = peer_groups(entries)
+
+    targets = collections.OrderedDict()
+    seen = set([entry.shared_id])
+    pending = [entry.shared_id]
+    while pending:
+        group = pending.pop(0)
+        for receiver in groups.get(group, []) + slaves.get(group, []):
+            if receiver.mount_id == entry.mount_id:
+                continue
+            targets[receiver.mount_id] = receiver
+            if receiver.shared_id is not None and \
+                    receiver.shared_id not in seen:
+                seen.add(receiver.shared_id)
+                pending.append(receiver.shared_id)
+    return list(targets.values())
+
+
+def set_propagation(target, propagation, recursive=True):
+    """Change the propagation type of the mount at ``target``.
+
+    The whole subtree is changed in a single mount_setattr(2) call when
+    supported, falling back to mount(2) with ``MS_REC``.
+
+    :params ``str`` propagation:
+        ``'private'``, ``'shared'``, ``'slave'`` or ``'unbindable'``.
+    :params ``bool`` recursive:
+        Also change the mounts below ``target``.
+    """
+    mnt_flags = PROPAGATION_FLAGS[propagation]
+    if features.supported(features.MOUNT_SETATTR):
+        try:
+            fsmount.mount_setattr(
+                target, propagation=mnt_flags,
+                flags=fsmount.AT_RECURSIVE if recursive else 0
+            )
+            return
+        except OSError as err:
+            if err.errno != errno.ENOSYS:
+                raise
+            features.mark_unsupported(features.MOUNT_SETATTR)
+
+    if recursive:
+        mnt_flags |= mount_mod.MS_REC
+    mount_mod.mount(None, target, None, mnt_flags)
+
+
+__all__ = [
+    'PROPAGATION_FLAGS',
+    'peer_groups',
+    'propagation_targets',
+    'set_propagation',
+]
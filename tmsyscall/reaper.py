@@ -0,0 +1,182 @@
+"""Asynchronous container teardown.
+
+:class:`MountReaper` lazily detaches a sandbox mount subtree, which is fast,
+and leaves the slow part (waiting for busy filesystems and removing the
+mount point directories) to background workers.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+import threading
+import time
+
+from six.moves import queue
+
+from tmsyscall import mount as mount_mod
+from tmsyscall import mount_index
+from tmsyscall import utils
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def detach_tree(root):
+    """Lazily unmount (``MNT_DETACH``) every mount on or below ``root``.
+
+    Only the topmost mounts of the subtree are detached, the kernel takes
+    their submounts along.
+
+    :returns:
+        ``int`` - Number of detached mounts.
+    """
+    entries = mount_index.MountIndex().submounts(root)
+    ids = set(entry.mount_id for entry in entries)
+    count = 0
+    for entry in entries:
+        if entry.parent_id in ids:
+            continue
+        try:
+            mount_mod.unmount(entry.target, mount_mod.MNT_DETACH)
+            count += 1
+        except OSError as err:
+            # Already gone (e.g. detached along with a stacked mount).
+            if err.errno not in (errno.EINVAL, errno.ENOENT):
+                raise
+    return count
+
+
+class MountReaper(object):
+    """Background remover of detached sandbox trees.
+
+    :meth:`reap` detaches the mounts synchronously and queues the directory
+    removal. The queue is bounded: when ``max_backlog`` removals are pending
+    :meth:`reap` blocks (up to its ``timeout``), pushing back on the caller.
+    Removal never crosses mount points (see
+    :func:`~tmsyscall.utils.rmtree_safe`), removals failing with ``EBUSY``
+    are retried, with exponential backoff and after detaching again anything
+    found mounted below.
+
+    :params ``int`` workers:
+        Number of removal threads.
+    :params ``int`` max_backlog:
+        Maximum number of queued removals.
+    :params ``int`` retries:
+        Attempts on ``EBUSY`` before giving up on a directory.
+    :params ``float`` retry_delay:
+        First retry delay, in seconds, doubled after each attempt.
+    :params ``int`` rm_workers:
+        Threads removing the subdirectories of one tree in parallel.
+    """
+
+    def __init__(self, workers=1, max_backlog=64, retries=8,
+                 retry_delay=0.05, rm_workers=4):
+        self.retries = retries
+        self.rm_workers = rm_workers
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_backlog)
+        self._lock = threading.Lock()
+        self._counters = {
+            'detached': 0,
+            'queued': 0,
+            'removed': 0,
+            'retries': 0,
+            'failed': 0,
+        }
+        self._workers = []
+        for _ in range(workers):
+            worker = threading.Thread(target=self._run, name='mount-reaper')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def metrics(self):
+        """Return the reaper counters and current backlog size.
+        """
+        with self._lock:
+            res = dict(self._counters)
+        res['backlog'] = self._queue.qsize()
+        return res
+
+    def reap(self, root, remove=True, timeout=None):
+        """Detach all the mounts under ``root`` and queue its removal.
+
+        :params ``bool`` remove:
+            Also remove the ``root`` directory tree, in the background.
+        :params ``float`` timeout:
+            How long to wait for room in the backlog, ``None`` for ever.
+        :raises ``queue.Full``:
+            If the backlog stayed full for ``timeout`` seconds. The mounts
+            are detached nonetheless.
+        """
+        self._count('detached', detach_tree(root))
+        if remove:
+            self._queue.put(root, timeout=timeout)
+            self._count('queued')
+
+    def join(self):
+        """Wait for all the queued removals to be processed.
+        """
+        self._queue.join()
+
+    def close(self):
+        """Process the backlog and stop the workers.
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if path is None:
+                    return
+                self._remove(path)
+            finally:
+                self._queue.task_done()
+
+    def _remove(self, path):
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                utils.rmtree_safe(path, self.rm_workers)
+                self._count('removed')
+                return
+            except OSError as err:
+                if err.errno == errno.ENOENT and not os.path.lexists(path):
+                    self._count('removed')
+                    return
+                if err.errno != errno.EBUSY or attempt == self.retries:
+                    _LOGGER.warning('Failed to remove %r: %s', path, err)
+                    self._count('failed')
+                    return
+            self._count('retries')
+            time.sleep(delay)
+            delay *= 2
+            try:
+                detach_tree(path)
+            except OSError as err:
+                _LOGGER.warning('Failed to detach %r: %s', path, err)
+
+
+__all__ = [
+    'MountReaper',
+    'detach_tree',
+]
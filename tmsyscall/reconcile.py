@@ -0,0 +1,351 @@
+"""Idempotent mount table reconciliation.
+
+Compare a desired set of :class:`~tmsyscall.mount.MountSpec` against the
+current mount table and only apply the difference.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import os
+import re
+
+from tmsyscall import mount as mount_mod
+from tmsyscall import mount_index
+
+_LOGGER = logging.getLogger(__name__)
+
+
+#: Mount flags which are reported as per-mount options in mountinfo.
+_FLAG_OPTIONS = (
+    (mount_mod.MS_NOSUID, 'nosuid'),
+    (mount_mod.MS_NODEV, 'nodev'),
+    (mount_mod.MS_NOEXEC, 'noexec'),
+    (mount_mod.MS_SYNCHRONOUS, 'sync'),
+    (mount_mod.MS_MANDLOCK, 'mand'),
+    (mount_mod.MS_DIRSYNC, 'dirsync'),
+    (mount_mod.MS_NOATIME, 'noatime'),
+    (mount_mod.MS_NODIRATIME, 'nodiratime'),
+    (mount_mod.MS_RELATIME, 'relatime'),
+)
+
+#: Access time modes, the kernel reports one of them on every mount.
+_ATIME_OPTIONS = frozenset(['noatime', 'relatime'])
+
+#: Flags which do not describe a mount, but an operation on one.
+_OPERATION_FLAGS = (
+    mount_mod.MS_REMOUNT | mount_mod.MS_MOVE |
+    mount_mod.MS_UNBINDABLE | mount_mod.MS_PRIVATE |
+    mount_mod.MS_SLAVE | mount_mod.MS_SHARED
+)
+
+_SIZE_RE = re.compile(r'^(\d+)([kmgtKMGT]?)$')
+_SIZE_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+
+def _decode(value):
+    if value is None:
+        return None
+    return value.decode()
+
+
+def _normalize_option(option):
+    """Normalize a ``key=value`` mount option the way the kernel reports it.
+
+    Numeric values are compared as integers, with size suffixes expanded
+    (``size=16m`` is reported as ``size=16384k``).
+    """
+    key, sep, value = option.partition('=')
+    if not sep:
+        return option
+    match = _SIZE_RE.match(value)
+    if match is None:
+        return option
+    number, unit = match.groups()
+    return '%s=%d' % (key, int(number) * _SIZE_UNITS[unit.lower()])
+
+
+def _is_under(path, root):
+    return path == root or path.startswith(root.rstrip('/') + '/')
+
+
+def _depth(path):
+    return path.rstrip('/').count('/')
+
+
+class MountPlan(object):
+    """Minimal list of operations turning the current mount table into the
+    desired one.
+    """
+
+    __slots__ = (
+        'unmounts',
+        'remounts',
+        'mounts',
+    )
+
+    def __init__(self, unmounts=None, remounts=None, mounts=None):
+        #: ``list`` of :class:`~tmsyscall.mount.MountEntry` to unmount.
+        self.unmounts = unmounts or []
+        #: ``list`` of remount :class:`~tmsyscall.mount.MountSpec`.
+        self.remounts = remounts or []
+        #: ``list`` of :class:`~tmsyscall.mount.MountSpec` to mount.
+        self.mounts = mounts or []
+
+    def __repr__(self):
+        return (
+            '{name}(unmounts={unmounts!r}, remounts={remounts!r}, '
+            'mounts={mounts!r})'
+        ).format(
+            name=self.__class__.__name__,
+            unmounts=[entry.target for entry in self.unmounts],
+            remounts=self.remounts,
+            mounts=self.mounts,
+        )
+
+    def __len__(self):
+        return len(self.unmounts) + len(self.remounts) + len(self.mounts)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    def execute(self):
+        """Apply the plan: unmounts (deepest first), remounts, then mounts
+        (shallowest first).
+        """
+        for entry in self.unmounts:
+            _LOGGER.info('Reconcile unmount: %r', entry)
+            mount_mod.unmount(entry.target)
+        for spec in self.remounts:
+            _LOGGER.info('Reconcile remount: %r', spec)
+            spec.apply()
+        for spec in self.mounts:
+            _LOGGER.info('Reconcile mount: %r', spec)
+            spec.apply()
+
+
+def _matches_source(spec, entry, index):
+    """Check that ``entry`` mounts the same thing as ``spec``.
+
+    Bind mounts are reported with the device of the bound filesystem as
+    source, so the spec source is resolved through the mount ``index`` and
+    compared with the device and root of ``entry``.
+    """
+    if spec.mnt_flags & mount_mod.MS_BIND:
+        if spec.source is None or entry.root is None:
+            return True
+        source_entry, fs_path = index.resolve(_decode(spec.source))
+        return (
+            source_entry is not None and
+            source_entry.dev == entry.dev and
+            fs_path == entry.root
+        )
+    if spec.fs_type is not None and _decode(spec.fs_type) != entry.fs_type:
+        return False
+    if spec.source is not None and _decode(spec.source) != entry.source:
+        return False
+    return True
+
+
+def _flag_options(mnt_flags, mnt_opts=None):
+    """Per-mount options set by ``mnt_flags``, or among ``mnt_opts``.
+    """
+    if mnt_opts is None:
+        return set(
+            option for flag, option in _FLAG_OPTIONS if mnt_flags & flag
+        )
+    return set(option for _flag, option in _FLAG_OPTIONS) & set(mnt_opts)
+
+
+def _matches_options(spec, entry, index):
+    """Check that ``entry`` has exactly the options requested by ``spec``.
+
+    Flags the spec does not ask for are drift too, except for the atime
+    mode when the spec sets none (the kernel keeps it on remount) and, for
+    bind mounts, the flags inherited from the bound mount.
+    """
+    read_only = 'ro' if spec.mnt_flags & mount_mod.MS_RDONLY else 'rw'
+    if read_only not in entry.mnt_opts:
+        return False
+
+    wanted = _flag_options(spec.mnt_flags)
+    current = _flag_options(0, entry.mnt_opts)
+    if not wanted & _ATIME_OPTIONS:
+        current -= _ATIME_OPTIONS
+    if wanted - current:
+        return False
+    extra = current - wanted
+    if spec.mnt_flags & mount_mod.MS_BIND:
+        if extra and spec.source is not None:
+            source_entry, _fs_path = index.resolve(_decode(spec.source))
+            if source_entry is not None:
+                extra -= _flag_options(0, source_entry.mnt_opts)
+        return not extra
+    if extra:
+        return False
+
+    if spec.data is None:
+        return True
+
+    current = set(_normalize_option(opt) for opt in entry.mnt_opts)
+    return all(
+        _normalize_option(opt) in current
+        for opt in _decode(spec.data).split(',')
+        if opt
+    )
+
+
+def _remount_spec(spec):
+    """Build the spec updating the options of an already mounted ``spec``.
+    """
+    if spec.mnt_flags & mount_mod.MS_BIND:
+        return mount_mod.MountSpec(
+            None, spec.target, None,
+            spec.mnt_flags | mount_mod.MS_REMOUNT
+        )
+    return mount_mod.MountSpec(
+        spec.source, spec.target, spec.fs_type,
+        spec.mnt_flags | mount_mod.MS_REMOUNT,
+        *([_decode(spec.data)] if spec.data is not None else [])
+    )
+
+
+# Actions of _classify().
+_MOUNT = 'mount'
+_REPLACE = 'replace'
+_REMOUNT = 'remount'
+
+
+def _classify(spec, stack, index):
+    """Decide what to do to reach ``spec``, given the ``stack`` of mounts
+    currently on its target (topmost last).
+
+    :returns:
+        ``_MOUNT``, ``_REPLACE``, ``_REMOUNT`` or ``None`` if up to date.
+    """
+    if not stack:
+        return _MOUNT
+    if not _matches_source(spec, stack[-1], index):
+        return _REPLACE
+    if not _matches_options(spec, stack[-1], index):
+        return _REMOUNT
+    return None
+
+
+def _wanted_targets(desired):
+    """Index the ``desired`` specs by normalized target, validating them.
+    """
+    wanted = {}
+    for spec in desired:
+        if spec.target is None:
+            raise ValueError('Mount spec without target: %r' % (spec, ))
+        if spec.mnt_flags & _OPERATION_FLAGS:
+            raise ValueError('Not a mount: %r' % (spec, ))
+        target = os.path.normpath(_decode(spec.target))
+        if target in wanted:
+            raise ValueError('Duplicate mount target: %r' % target)
+        wanted[target] = spec
+    return wanted
+
+
+def plan_mounts(desired, root=None, current=None):
+    """Compute the operations needed to reach the ``desired`` mounts.
+
+    Mounts are matched by target, then by source, filesystem type and
+    options. A matching mount is left alone, a mount with different options
+    is remounted and a mount of something else is replaced.
+
+    :params desired:
+        Iterable of :class:`~tmsyscall.mount.MountSpec`, at most one per
+        target.
+    :params `str` root:
+        If set, mounts strictly below ``root`` which are not desired are
+        unmounted. Otherwise mounts outside of ``desired`` are never touched.
+    :params current:
+        List of :class:`~tmsyscall.mount.MountEntry`, defaults to
+        :func:`~tmsyscall.mount.list_mounts`.
+    :returns:
+        :class:`MountPlan`
+    """
+    if current is None:
+        current = mount_mod.list_mounts()
+
+    # All mounts stacked on a target, topmost last.
+    stacks = {}
+    for entry in current:
+        stacks.setdefault(entry.target, []).append(entry)
+
+    wanted = _wanted_targets(desired)
+
+    index = mount_index.MountIndex(current)
+    plan = MountPlan()
+    removed = set()
+    for target, spec in sorted(wanted.items()):
+        action = _classify(spec, stacks.get(target), index)
+        if action == _REPLACE:
+            removed.add(target)
+        if action in (_MOUNT, _REPLACE):
+            plan.mounts.append(spec)
+        elif action == _REMOUNT:
+            plan.remounts.append(_remount_spec(spec))
+
+    if root is not None:
+        root = os.path.normpath(root)
+        removed.update(
+            target for target in stacks
+            if target != root and _is_under(target, root) and
+            target not in wanted
+        )
+
+    # Anything on top of a removed mount has to go first, and desired
+    # mounts in there have to be mounted again.
+    if removed:
+        for target in stacks:
+            if target in removed:
+                continue
+            if any(_is_under(target, parent) for parent in removed):
+                removed.add(target)
+                spec = wanted.get(target)
+                if spec is not None and spec not in plan.mounts:
+                    plan.mounts.append(spec)
+        plan.remounts = [
+            spec for spec in plan.remounts
+            if not any(
+                _is_under(_decode(spec.target), parent) for parent in removed
+            )
+        ]
+
+    order = dict((entry.mount_id, idx) for idx, entry in enumerate(current))
+    plan.unmounts = sorted(
+        (entry for target in removed for entry in stacks[target]),
+        key=lambda entry: (_depth(entry.target), order[entry.mount_id]),
+        reverse=True
+    )
+    plan.mounts.sort(key=lambda spec: _depth(_decode(spec.target)))
+
+    return plan
+
+
+def reconcile(desired, root=None):
+    """Bring the mount table to the ``desired`` state, see
+    :func:`plan_mounts`.
+
+    :returns:
+        The executed :class:`MountPlan`.
+    """
+    plan = plan_mounts(desired, root=root)
+    _LOGGER.info('Reconciling mounts: %d operations', len(plan))
+    plan.execute()
+    return plan
+
+
+__all__ = [
+    'MountPlan',
+    'plan_mounts',
+    'reconcile',
+]
@@ -0,0 +1,270 @@
+"""Creation of mount points relative to a new root filesystem.
+
+:class:`RootfsBuilder` holds a directory file descriptor on the new root and
+caches the descriptors of the directories it walked through, so creating
+many mount points under a common prefix resolves each directory only once.
+The cache must be invalidated (:meth:`RootfsBuilder.invalidate`) below
+anything mounted in the meantime, as :func:`tmsyscall.mount.mount_bind`
+does.
+Lookups use openat2(2) with ``RESOLVE_BENEATH`` (Linux 5.6+), falling back
+to ``O_NOFOLLOW`` per path component, so symlinks in the rootfs can never
+make a creation escape it.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+import stat
+
+import ctypes
+from ctypes import (
+    c_char_p,
+    c_int,
+    c_long,
+    c_size_t,
+    c_uint64,
+)
+from ctypes.util import find_library
+
+from tmsyscall import features
+
+_LOGGER = logging.getLogger(__name__)
+
+
+###############################################################################
+# Constants copied from linux/openat2.h
+
+#: Block mount-point crossings.
+RESOLVE_NO_XDEV = 0x01
+#: Block traversal through procfs-style "magic links".
+RESOLVE_NO_MAGICLINKS = 0x02
+#: Block traversal through all symlinks.
+RESOLVE_NO_SYMLINKS = 0x04
+#: Block "lexical" trickery like "..", symlinks, and absolute paths which
+#: escape the dirfd.
+RESOLVE_BENEATH = 0x08
+#: Make all jumps to "/" and ".." be scoped inside the dirfd.
+RESOLVE_IN_ROOT = 0x10
+
+# openat2 syscall number, the same on all architectures.
+_NR_OPENAT2 = 437
+
+
+###############################################################################
+# Map the C interface
+
+class OpenHow(ctypes.Structure):
+    """struct open_how
+    """
+    _fields_ = [
+        ('flags', c_uint64),
+        ('mode', c_uint64),
+        ('resolve', c_uint64),
+    ]
+
+
+_LIBC_PATH = find_library('c')
+_LIBC = ctypes.CDLL(_LIBC_PATH, use_errno=True)
+
+# long syscall(long number, ...);
+_SYSCALL = _LIBC.syscall
+_SYSCALL.restype = c_long
+
+def openat2(dirfd, path, flags, mode=0, resolve=0):
+    """Open ``path`` relative to ``dirfd`` with path resolution restrictions.
+
+    :params ``int`` resolve:
+        ``RESOLVE_*`` flags.
+    :returns:
+        ``int`` - File descriptor.
+    """
+    if not isinstance(path, bytes):
+        path = path.encode()
+    how = OpenHow(flags, mode, resolve)
+    res = _SYSCALL(c_long(_NR_OPENAT2), c_int(dirfd), c_char_p(path),
+                   ctypes.byref(how), c_size_t(ctypes.sizeof(how)))
+    if res < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+    return res
+
+
+def _open_beneath(dirfd, name, flags, mode=0):
+    """Open the single component ``name`` of ``dirfd``, never following
+    a symlink.
+    """
+    if features.supported(features.OPENAT2):
+        try:
+            return openat2(dirfd, name, flags | os.O_CLOEXEC, mode,
+                           RESOLVE_BENEATH | RESOLVE_NO_SYMLINKS)
+        except OSError as err:
+            if err.errno != errno.ENOSYS:
+                raise
+            features.mark_unsupported(features.OPENAT2)
+
+    return os.open(name, flags | os.O_CLOEXEC | os.O_NOFOLLOW, mode,
+                   dir_fd=dirfd)
+
+
+def _split(relpath):
+    """Split ``relpath`` into components, refusing to go up.
+    """
+    parts = [part for part in relpath.split('/') if part not in ('', '.')]
+    if '..' in parts:
+        raise ValueError('Path escapes the root: %r' % relpath)
+    return parts
+
+
+class RootfsBuilder(object):
+    """Create directories and files beneath ``newroot``.
+
+    All paths are relative to ``newroot`` (a leading ``/`` is ignored).
+
+    :params ``str`` newroot:
+        Root of the tree, must exist.
+    """
+
+    def __init__(self, newroot):
+        self.newroot = newroot
+        # Directory fds by relative path (tuple of components).
+        self._dirfds = {
+            (): os.open(newroot, os.O_PATH | os.O_DIRECTORY | os.O_CLOEXEC)
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def __repr__(self):
+        return '{name}(newroot={newroot!r}, cached={cached!r})'.format(
+            name=self.__class__.__name__,
+            newroot=self.newroot,
+            cached=len(self._dirfds),
+        )
+
+    def path(self, relpath):
+        """Full path of ``relpath``.
+        """
+        return os.path.join(self.newroot, *_split(relpath))
+
+    def _dirfd(self, parts, mode):
+        """Return the (cached) fd of directory ``parts``, creating missing
+        directories.
+        """
+        dirfd = self._dirfds.get(parts)
+        if dirfd is None:
+            self._mkdirat(parts, mode)
+            dirfd = self._dirfds[parts]
+        return dirfd
+
+    def _mkdirat(self, parts, mode):
+        """Create directory ``parts`` if needed and cache its fd.
+        """
+        parent = self._dirfd(parts[:-1], mode)
+        try:
+            os.mkdir(parts[-1], mode, dir_fd=parent)
+            created = True
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+            created = False
+        # Opening with O_DIRECTORY also checks an existing entry.
+        self._dirfds[parts] = _open_beneath(
+            parent, parts[-1], os.O_PATH | os.O_DIRECTORY
+        )
+        return created
+
+    def mkdir(self, relpath, mode=0o755):
+        """Create directory ``relpath`` and its missing parents.
+
+        :returns:
+            ``bool`` - True if the directory was created.
+        """
+        parts = tuple(_split(relpath))
+        if not parts or parts in self._dirfds:
+            return False
+        return self._mkdirat(parts, mode)
+
+    def mkfile(self, relpath, mode=0o644, dir_mode=0o755):
+        """Create the empty file ``relpath`` and its missing parents.
+
+        :returns:
+            ``bool`` - True if the file was created.
+        """
+        parts = tuple(_split(relpath))
+        if not parts:
+            raise ValueError('Invalid file path: %r' % relpath)
+        parent = self._dirfd(parts[:-1], dir_mode)
+        try:
+            fd = _open_beneath(
+                parent, parts[-1], os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode
+            )
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+            info = os.stat(parts[-1], dir_fd=parent, follow_symlinks=False)
+            if not stat.S_ISREG(info.st_mode):
+                raise
+            return False
+        os.close(fd)
+        return True
+
+    def make_mountpoints(self, targets, mode=0o755, file_mode=0o644):
+        """Create many mount points in one go.
+
+        Targets are created in path order, so that each directory is
+        resolved once.
+
+        :params targets:
+            Iterable of ``(relpath, is_dir)``.
+        :returns:
+            ``int`` - Number of mount points created.
+        """
+        created = 0
+        for relpath, is_dir in sorted(targets, key=lambda x: _split(x[0])):
+            if is_dir:
+                created += self.mkdir(relpath, mode)
+            else:
+                created += self.mkfile(relpath, file_mode, mode)
+        return created
+
+    def invalidate(self, relpath):
+        """Forget the cached directories at and below ``relpath``.
+
+        To be called once something is mounted on ``relpath``: the cached
+        fds still refer to the directories it now hides.
+        """
+        parts = tuple(_split(relpath))
+        for cached in list(self._dirfds):
+            if cached[:len(parts)] == parts:
+                os.close(self._dirfds.pop(cached))
+        if not parts:
+            self._dirfds[()] = os.open(
+                self.newroot, os.O_PATH | os.O_DIRECTORY | os.O_CLOEXEC
+            )
+
+    def close(self):
+        """Close all the cached directory fds.
+        """
+        for dirfd in self._dirfds.values():
+            os.close(dirfd)
+        self._dirfds = {}
+
+
+__all__ = [
+    'OpenHow',
+    'RESOLVE_BENEATH',
+    'RESOLVE_IN_ROOT',
+    'RESOLVE_NO_MAGICLINKS',
+    'RESOLVE_NO_SYMLINKS',
+    'RESOLVE_NO_XDEV',
+    'RootfsBuilder',
+    'openat2',
+]
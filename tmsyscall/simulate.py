@@ -0,0 +1,486 @@
+"""In-memory simulated mount backend.
+
+:class:`SimulatedBackend` keeps a mount tree in memory, updates it on every
+mount, umount, unshare and pivot_root call and renders it as a synthetic
+``/proc/self/mountinfo`` (so :func:`tmsyscall.mount.list_mounts` and
+everything built on it work unchanged). It counts system calls and path
+lookups, so mount planning logic can be profiled and regression tested
+without root and without side effects::
+
+    sim = SimulatedBackend()
+    with use_backend(sim):
+        reconcile(desired, root='/containers/c1')
+    print(sim.stats())
+
+Only the mount table is simulated: directories are not, every path exists
+and is a directory (mount point creation is only counted), and mount events
+are not propagated between peer groups (propagation types are only
+recorded).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import copy
+import ctypes
+import errno
+import logging
+import os
+
+from tmsyscall import backend
+from tmsyscall import mount as mount_mod
+from tmsyscall import mount_index
+
+_LOGGER = logging.getLogger(__name__)
+
+# Flags describing the mount itself (kept on remount).
+_MOUNT_FLAGS = (
+    mount_mod.MS_RDONLY | mount_mod.MS_NOSUID | mount_mod.MS_NODEV |
+    mount_mod.MS_NOEXEC | mount_mod.MS_SYNCHRONOUS | mount_mod.MS_MANDLOCK |
+    mount_mod.MS_DIRSYNC | mount_mod.MS_NOATIME | mount_mod.MS_NODIRATIME |
+    mount_mod.MS_RELATIME
+)
+
+_PROPAGATION_FLAGS = (
+    mount_mod.MS_SHARED | mount_mod.MS_PRIVATE |
+    mount_mod.MS_SLAVE | mount_mod.MS_UNBINDABLE
+)
+
+# Magic number marker mask, see MS_MGC_VAL.
+_MGC_MSK = 0xffff0000
+
+# Per-mount options rendered in mountinfo.
+_FLAG_OPTIONS = (
+    (mount_mod.MS_NOSUID, 'nosuid'),
+    (mount_mod.MS_NODEV, 'nodev'),
+    (mount_mod.MS_NOEXEC, 'noexec'),
+    (mount_mod.MS_SYNCHRONOUS, 'sync'),
+    (mount_mod.MS_MANDLOCK, 'mand'),
+    (mount_mod.MS_DIRSYNC, 'dirsync'),
+    (mount_mod.MS_NOATIME, 'noatime'),
+    (mount_mod.MS_NODIRATIME, 'nodiratime'),
+    (mount_mod.MS_RELATIME, 'relatime'),
+)
+
+
+def _decode(value):
+    if value is None:
+        return None
+    value = getattr(value, 'value', value)
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+def _rebase(path, old, new):
+    """Move ``path`` from under ``old`` to under ``new``.
+    """
+    rel = os.path.relpath(path, old)
+    if rel == '.':
+        return new
+    return os.path.join(new, rel)
+
+
+class SimulatedMount(object):
+    """Simulated mount, exposes the :class:`~tmsyscall.mount.MountEntry`
+    attributes used by :class:`~tmsyscall.mount_index.MountIndex`.
+    """
+
+    __slots__ = (
+        'mount_id',
+        'parent_id',
+        'major',
+        'minor',
+        'root',
+        'target',
+        'fs_type',
+        'source',
+        'mnt_flags',
+        'data',
+        'propagation',
+    )
+
+    def __init__(self, mount_id, parent_id, major, minor, root, target,
+                 fs_type, source, mnt_flags, data):
+        self.mount_id = mount_id
+        self.parent_id = parent_id
+        self.major = major
+        self.minor = minor
+        self.root = root
+        self.target = target
+        self.fs_type = fs_type
+        self.source = source
+        self.mnt_flags = mnt_flags
+        self.data = data
+        #: ``None`` (private), ``'shared'``, ``'slave'`` or ``'unbindable'``.
+        self.propagation = None
+
+    def __repr__(self):
+        return '{name}({mount_id!r}, target={target!r})'.format(
+            name=self.__class__.__name__,
+            mount_id=self.mount_id,
+            target=self.target,
+        )
+
+    def mountinfo(self):
+        """Render the mount as a mountinfo line.
+        """
+        mnt_opts = ['ro' if self.mnt_flags & mount_mod.MS_RDONLY else 'rw']
+        mnt_opts.extend(
+            option for flag, option in _FLAG_OPTIONS
+            if self.mnt_flags & flag
+        )
+        if not self.mnt_flags & (mount_mod.MS_NOATIME | mount_mod.MS_RELATIME):
+            mnt_opts.append('relatime')
+        super_opts = ['rw']
+        if self.data:
+            super_opts.append(self.data)
+
+        fields = []
+        if self.propagation == 'shared':
+            fields.append('shared:%d' % self.mount_id)
+        elif self.propagation == 'slave':
+            fields.append('master:%d' % self.mount_id)
+        elif self.propagation == 'unbindable':
+            fields.append('unbindable')
+
+        return ' '.join(
+            [
+                str(self.mount_id), str(self.parent_id),
+                '%d:%d' % (self.major, self.minor), self.root, self.target,
+                ','.join(mnt_opts),
+            ] + fields + [
+                '-', self.fs_type, self.source or 'none', ','.join(super_opts)
+            ]
+        ) + '\n'
+
+
+class SimulatedBackend(backend.Backend):
+    """Backend simulating a mount namespace in memory.
+
+    :params mountinfo:
+        Optional mountinfo lines to start from (e.g. the host
+        ``/proc/self/mountinfo``), otherwise the namespace starts with a
+        single ext4 root mount.
+    """
+
+    def __init__(self, mountinfo=None):
+        self.mounts = collections.OrderedDict()
+        #: ``collections.Counter`` of system calls, by name.
+        self.syscalls = collections.Counter()
+        #: Number of path components resolved.
+        self.path_lookups = 0
+        self._index = mount_index.MountIndex([])
+        self._next_id = 1
+        self._devices = {}
+
+        if mountinfo is None:
+            mountinfo = ['1 1 8:1 / / rw,relatime - ext4 /dev/root rw\n']
+        for line in mountinfo:
+            entry = mount_mod.MountEntry.mount_entry_parse(line)
+            mnt_flags = 0
+            for flag, option in _FLAG_OPTIONS:
+                if option in entry.mnt_opts:
+                    mnt_flags |= flag
+            if 'ro' in entry.mnt_opts:
+                mnt_flags |= mount_mod.MS_RDONLY
+            self._add(SimulatedMount(
+                entry.mount_id, entry.parent_id, entry.major, entry.minor,
+                entry.root, entry.target, entry.fs_type, entry.source,
+                mnt_flags, None
+            ))
+            self._devices[(entry.major, entry.minor)] = entry.source
+            self._next_id = max(self._next_id, entry.mount_id + 1)
+
+    def copy(self):
+        """Return an independent copy of the simulated namespace, with
+        fresh counters.
+        """
+        res = copy.deepcopy(self)
+        res.reset_stats()
+        return res
+
+    def reset_stats(self):
+        """Reset the system call and path lookup counters.
+        """
+        self.syscalls = collections.Counter()
+        self.path_lookups = 0
+
+    def stats(self):
+        """Return the counters as a ``dict``.
+        """
+        return {
+            'syscalls': dict(self.syscalls),
+            'total_syscalls': sum(self.syscalls.values()),
+            'path_lookups': self.path_lookups,
+            'mounts': len(self.mounts),
+        }
+
+    ###########################################################################
+    # Mount tree helpers
+
+    def _add(self, mnt):
+        self.mounts[mnt.mount_id] = mnt
+        self._index.add(mnt)
+
+    def _remove(self, mnt):
+        del self.mounts[mnt.mount_id]
+        self._index.remove(mnt.mount_id)
+
+    def _new_id(self):
+        mount_id = self._next_id
+        self._next_id += 1
+        return mount_id
+
+    def _device(self, source, fs_type):
+        """Return the (major, minor) of a new filesystem.
+
+        Block devices keep the same number, others get an anonymous one.
+        """
+        if source and source.startswith('/dev/'):
+            for dev, dev_source in self._devices.items():
+                if dev_source == source:
+                    return dev
+            dev = (8, len(self._devices) + 1)
+        else:
+            dev = (0, 1000 + len(self._devices))
+        self._devices[dev] = source or fs_type
+        return dev
+
+    def _normpath(self, path):
+        path = os.path.normpath(_decode(path))
+        self.path_lookups += path.count('/') if path != '/' else 1
+        return path
+
+    def _mountpoint(self, path):
+        """Return the visible mount on ``path``, ``None`` if not a mount
+        point.
+        """
+        if not self._index.is_mountpoint(path):
+            return None
+        return self._index.containing(path)
+
+    def _descendants(self, mnt):
+        """Return all the mounts below ``mnt``, parents first.
+        """
+        ids = set([mnt.mount_id])
+        res = []
+        for other in self._index.submounts(mnt.target):
+            if other.mount_id not in ids and other.parent_id in ids:
+                ids.add(other.mount_id)
+                res.append(other)
+        return res
+
+    @staticmethod
+    def _fail(err):
+        ctypes.set_errno(err)
+        return -1
+
+    ###########################################################################
+    # Backend interface
+
+    def mount(self, source, target, fs_type, mnt_flags, data):
+        self.syscalls['mount'] += 1
+        mnt_flags = int(_decode(mnt_flags))
+        if mnt_flags & _MGC_MSK == mount_mod.MS_MGC_VAL:
+            mnt_flags &= ~_MGC_MSK
+        target = self._normpath(target)
+        data = _decode(data)
+
+        if mnt_flags & mount_mod.MS_REMOUNT:
+            return self._remount(target, mnt_flags, data)
+        if mnt_flags & _PROPAGATION_FLAGS:
+            return self._set_propagation(target, mnt_flags)
+        if mnt_flags & mount_mod.MS_MOVE:
+            return self._move(self._normpath(source), target)
+        if mnt_flags & mount_mod.MS_BIND:
+            return self._bind(self._normpath(source), target, mnt_flags)
+        return self._new_mount(
+            _decode(source), target, _decode(fs_type), mnt_flags, data
+        )
+
+    def _remount(self, target, mnt_flags, data):
+        mnt = self._mountpoint(target)
+        if mnt is None:
+            return self._fail(errno.EINVAL)
+        mnt.mnt_flags = mnt_flags & _MOUNT_FLAGS
+        if not mnt_flags & mount_mod.MS_BIND:
+            mnt.data = data
+        return 0
+
+    def _set_propagation(self, target, mnt_flags):
+        mnt = self._mountpoint(target)
+        if mnt is None:
+            return self._fail(errno.EINVAL)
+        propagation = None
+        if mnt_flags & mount_mod.MS_SHARED:
+            propagation = 'shared'
+        elif mnt_flags & mount_mod.MS_SLAVE:
+            propagation = 'slave'
+        elif mnt_flags & mount_mod.MS_UNBINDABLE:
+            propagation = 'unbindable'
+        targets = [mnt]
+        if mnt_flags & mount_mod.MS_REC:
+            targets.extend(self._descendants(mnt))
+        for other in targets:
+            other.propagation = propagation
+        return 0
+
+    def _move(self, source, target):
+        mnt = self._mountpoint(source)
+        if mnt is None or mnt.parent_id == mnt.mount_id:
+            return self._fail(errno.EINVAL)
+        if target == source or target.startswith(source + '/'):
+            return self._fail(errno.ELOOP)
+        parent = self._index.containing(target)
+        moved = [mnt] + self._descendants(mnt)
+        for other in moved:
+            self._index.remove(other.mount_id)
+            other.target = _rebase(other.target, source, target)
+            self._index.add(other)
+        mnt.parent_id = parent.mount_id
+        return 0
+
+    def _bind(self, source, target, mnt_flags):
+        src_mnt, fs_path = self._index.resolve(source)
+        if src_mnt is None:
+            return self._fail(errno.ENOENT)
+        if src_mnt.propagation == 'unbindable':
+            return self._fail(errno.EINVAL)
+        parent = self._index.containing(target)
+        new = SimulatedMount(
+            self._new_id(), parent.mount_id, src_mnt.major,
+            src_mnt.minor, fs_path, target, src_mnt.fs_type,
+            src_mnt.source, mnt_flags & _MOUNT_FLAGS, src_mnt.data
+        )
+        clones = []
+        if mnt_flags & mount_mod.MS_REC:
+            ids = {src_mnt.mount_id: new.mount_id}
+            for other in self._descendants(src_mnt):
+                if other.propagation == 'unbindable' or \
+                        other.parent_id not in ids or \
+                        not (other.target + '/').startswith(
+                            source.rstrip('/') + '/'):
+                    continue
+                clone = SimulatedMount(
+                    self._new_id(), ids[other.parent_id], other.major,
+                    other.minor, other.root,
+                    _rebase(other.target, source, target),
+                    other.fs_type, other.source, other.mnt_flags,
+                    other.data
+                )
+                ids[other.mount_id] = clone.mount_id
+                clones.append(clone)
+        for mnt in [new] + clones:
+            self._add(mnt)
+        return 0
+
+    def _new_mount(self, source, target, fs_type, mnt_flags, data):
+        if not fs_type:
+            return self._fail(errno.ENODEV)
+        parent = self._index.containing(target)
+        major, minor = self._device(source, fs_type)
+        self._add(SimulatedMount(
+            self._new_id(), parent.mount_id, major, minor, '/', target,
+            fs_type, source, mnt_flags & _MOUNT_FLAGS, data
+        ))
+        return 0
+
+    def umount(self, target):
+        return self._umount('umount', target, 0)
+
+    def umount2(self, target, flags):
+        return self._umount('umount2', target, flags or 0)
+
+    def _umount(self, name, target, flags):
+        self.syscalls[name] += 1
+        target = self._normpath(target)
+        mnt = self._mountpoint(target)
+        if mnt is None:
+            return self._fail(errno.EINVAL)
+        descendants = self._descendants(mnt)
+        if descendants and not flags & mount_mod.MNT_DETACH:
+            return self._fail(errno.EBUSY)
+        for other in reversed(descendants):
+            self._remove(other)
+        self._remove(mnt)
+        return 0
+
+    def unshare(self, flags):
+        self.syscalls['unshare'] += 1
+        return 0
+
+    def setns(self, fd, flags):
+        self.syscalls['setns'] += 1
+        return 0
+
+    def pivot_root(self, new_root, put_old):
+        self.syscalls['pivot_root'] += 1
+        new_root = self._normpath(new_root)
+        put_old = self._normpath(put_old)
+        new_mnt = self._mountpoint(new_root)
+        if new_mnt is None or new_root == '/' or \
+                not put_old.startswith(new_root.rstrip('/') + '/'):
+            return self._fail(errno.EINVAL)
+
+        old_dir = '/' + os.path.relpath(put_old, new_root)
+        for mnt in self.mounts.values():
+            if mnt.target == new_root or \
+                    mnt.target.startswith(new_root + '/'):
+                mnt.target = _rebase(mnt.target, new_root, '/')
+            else:
+                mnt.target = _rebase(mnt.target, '/', old_dir)
+
+        # The old root now hangs below the new one.
+        old_root = [
+            mnt for mnt in self.mounts.values()
+            if mnt.parent_id == mnt.mount_id
+        ]
+        for mnt in old_root:
+            mnt.parent_id = new_mnt.mount_id
+        new_mnt.parent_id = new_mnt.mount_id
+
+        self._index = mount_index.MountIndex(list(self.mounts.values()))
+        return 0
+
+    def mountinfo(self):
+        return [mnt.mountinfo() for mnt in self.mounts.values()]
+
+    def exists(self, path):
+        self._normpath(path)
+        return True
+
+    def isdir(self, path):
+        self._normpath(path)
+        return True
+
+    def make_mountpoint(self, newroot, relpath, is_dir, builder=None):
+        self.syscalls['mkdirat' if is_dir else 'openat'] += 1
+        self._normpath(os.path.join(newroot, relpath))
+        return True
+
+
+def measure(func, sim, *args, **kwargs):
+    """Run ``func`` against a copy of ``sim`` and return its counters.
+
+    The simulated namespace ``sim`` itself is left untouched, so the cost of
+    alternative strategies can be compared from the same starting point.
+
+    :returns:
+        ``tuple`` of ``func`` return value and
+        :meth:`SimulatedBackend.stats`.
+    """
+    trial = sim.copy()
+    with backend.use_backend(trial):
+        res = func(*args, **kwargs)
+    return res, trial.stats()
+
+
+__all__ = [
+    'SimulatedBackend',
+    'SimulatedMount',
+    'measure',
+]
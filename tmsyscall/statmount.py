@@ -0,0 +1,230 @@
+"""Wrapper for the statmount(2) system call (Linux 6.8+).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+
+import ctypes
+from ctypes import (
+    c_long,
+    c_uint32,
+    c_uint64,
+    c_size_t,
+    c_uint,
+)
+from ctypes.util import find_library
+
+_LOGGER = logging.getLogger(__name__)
+
+
+###############################################################################
+# Constants copied from linux/mount.h
+
+#: Want sb_dev_*, sb_magic, sb_flags.
+STATMOUNT_SB_BASIC = 0x00000001
+#: Want mnt_id, mnt_parent_id, mnt_id_old, mnt_parent_id_old, mnt_attr, ...
+STATMOUNT_MNT_BASIC = 0x00000002
+#: Want propagate_from.
+STATMOUNT_PROPAGATE_FROM = 0x00000004
+#: Want mnt_root.
+STATMOUNT_MNT_ROOT = 0x00000008
+#: Want mnt_point.
+STATMOUNT_MNT_POINT = 0x00000010
+#: Want fs_type.
+STATMOUNT_FS_TYPE = 0x00000020
+#: Want mnt_ns_id.
+STATMOUNT_MNT_NS_ID = 0x00000040
+#: Want mnt_opts.
+STATMOUNT_MNT_OPTS = 0x00000080
+#: Want fs_subtype.
+STATMOUNT_FS_SUBTYPE = 0x00000100
+#: Want sb_source.
+STATMOUNT_SB_SOURCE = 0x00000200
+
+#: Mount attributes (struct statmount mnt_attr).
+MOUNT_ATTR_RDONLY = 0x00000001
+MOUNT_ATTR_NOSUID = 0x00000002
+MOUNT_ATTR_NODEV = 0x00000004
+MOUNT_ATTR_NOEXEC = 0x00000008
+MOUNT_ATTR__ATIME = 0x00000070
+MOUNT_ATTR_RELATIME = 0x00000000
+MOUNT_ATTR_NOATIME = 0x00000010
+MOUNT_ATTR_STRICTATIME = 0x00000020
+MOUNT_ATTR_NODIRATIME = 0x00000080
+MOUNT_ATTR_IDMAP = 0x00100000
+MOUNT_ATTR_NOSYMFOLLOW = 0x00200000
+
+#: Superblock read-only flag (struct statmount sb_flags).
+SB_RDONLY = 0x00000001
+
+# statmount syscall number, the same on all architectures.
+_NR_STATMOUNT = 457
+
+# Size of the fixed part of struct statmount, the strings follow it.
+_STATMOUNT_SIZE = 512
+# Initial buffer size, grown on EOVERFLOW.
+_STATMOUNT_BUFSIZE = 4096
+
+
+###############################################################################
+# Map the C interface
+
+class MntIdReq(ctypes.Structure):
+    """struct mnt_id_req
+    """
+    _fields_ = [
+        ('size', c_uint32),
+        ('spare', c_uint32),
+        ('mnt_id', c_uint64),
+        ('param', c_uint64),
+    ]
+
+
+class _StatMountHeader(ctypes.Structure):
+    """Fixed part of struct statmount (fields used here).
+    """
+    _fields_ = [
+        ('size', c_uint32),
+        ('mnt_opts', c_uint32),
+        ('mask', c_uint64),
+        ('sb_dev_major', c_uint32),
+        ('sb_dev_minor', c_uint32),
+        ('sb_magic', c_uint64),
+        ('sb_flags', c_uint32),
+        ('fs_type', c_uint32),
+        ('mnt_id', c_uint64),
+        ('mnt_parent_id', c_uint64),
+        ('mnt_id_old', c_uint32),
+        ('mnt_parent_id_old', c_uint32),
+        ('mnt_attr', c_uint64),
+        ('mnt_propagation', c_uint64),
+        ('mnt_peer_group', c_uint64),
+        ('mnt_master', c_uint64),
+        ('propagate_from', c_uint64),
+        ('mnt_root', c_uint32),
+        ('mnt_point', c_uint32),
+        ('mnt_ns_id', c_uint64),
+        ('fs_subtype', c_uint32),
+        ('sb_source', c_uint32),
+    ]
+
+
+_LIBC_PATH = find_library('c')
+_LIBC = ctypes.CDLL(_LIBC_PATH, use_errno=True)
+
+# long syscall(long number, ...);
+_SYSCALL = _LIBC.syscall
+_SYSCALL.restype = c_long
+
+# String fields and the mask bit they are returned with.
+_STRINGS = (
+    ('mnt_opts', STATMOUNT_MNT_OPTS),
+    ('fs_type', STATMOUNT_FS_TYPE),
+    ('mnt_root', STATMOUNT_MNT_ROOT),
+    ('mnt_point', STATMOUNT_MNT_POINT),
+    ('fs_subtype', STATMOUNT_FS_SUBTYPE),
+    ('sb_source', STATMOUNT_SB_SOURCE),
+)
+
+_INTEGERS = (
+    'mask',
+    'sb_dev_major',
+    'sb_dev_minor',
+    'sb_magic',
+    'sb_flags',
+    'mnt_id',
+    'mnt_parent_id',
+    'mnt_id_old',
+    'mnt_parent_id_old',
+    'mnt_attr',
+    'mnt_propagation',
+    'mnt_peer_group',
+    'mnt_master',
+    'propagate_from',
+    'mnt_ns_id',
+)
+
+
+class StatMount(object):
+    """Decoded struct statmount.
+
+    Integer fields keep their kernel names, string fields not returned by
+    the kernel are ``None``.
+    """
+
+    __slots__ = _INTEGERS + tuple(name for name, _ in _STRINGS)
+
+    def __init__(self, buf):
+        header = _StatMountHeader.from_buffer_copy(buf)
+        for name in _INTEGERS:
+            setattr(self, name, getattr(header, name))
+        for name, bit in _STRINGS:
+            value = None
+            if header.mask & bit:
+                start = _STATMOUNT_SIZE + getattr(header, name)
+                end = buf.raw.index(b'\0', start)
+                value = buf.raw[start:end].decode('utf-8', 'replace')
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return (
+            '{name}(mnt_id={mnt_id!r}, mnt_point={mnt_point!r}, '
+            'fs_type={fs_type!r}, sb_source={sb_source!r})'
+        ).format(
+            name=self.__class__.__name__,
+            mnt_id=self.mnt_id,
+            mnt_point=self.mnt_point,
+            fs_type=self.fs_type,
+            sb_source=self.sb_source,
+        )
+
+
+def statmount(mnt_id, mask):
+    """Get information about the mount with unique ID ``mnt_id``.
+
+    :params ``int`` mnt_id:
+        Unique mount ID, as returned by statx(2) with
+        :data:`~tmsyscall.statx.STATX_MNT_ID_UNIQUE`.
+    :params ``int`` mask:
+        ``STATMOUNT_*`` bits of the information wanted.
+    :returns:
+        :class:`StatMount`
+    """
+    req = MntIdReq(ctypes.sizeof(MntIdReq), 0, mnt_id, mask)
+    bufsize = _STATMOUNT_BUFSIZE
+    while True:
+        buf = ctypes.create_string_buffer(bufsize)
+        res = _SYSCALL(
+            c_long(_NR_STATMOUNT), ctypes.byref(req), buf,
+            c_size_t(bufsize), c_uint(0)
+        )
+        if res >= 0:
+            return StatMount(buf)
+
+        err = ctypes.get_errno()
+        if err == errno.EOVERFLOW:
+            bufsize *= 2
+            continue
+        raise OSError(err, os.strerror(err), 'statmount(%r)' % mnt_id)
+
+
+__all__ = [
+    'STATMOUNT_FS_SUBTYPE',
+    'STATMOUNT_FS_TYPE',
+    'STATMOUNT_MNT_BASIC',
+    'STATMOUNT_MNT_NS_ID',
+    'STATMOUNT_MNT_OPTS',
+    'STATMOUNT_MNT_POINT',
+    'STATMOUNT_MNT_ROOT',
+    'STATMOUNT_PROPAGATE_FROM',
+    'STATMOUNT_SB_BASIC',
+    'STATMOUNT_SB_SOURCE',
+    'StatMount',
+    'statmount',
+]
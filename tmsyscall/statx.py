@@ -0,0 +1,155 @@
+"""Wrapper for the statx(2) system call.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+
+import ctypes
+from ctypes import (
+    c_char_p,
+    c_int,
+    c_int32,
+    c_int64,
+    c_uint,
+    c_uint16,
+    c_uint32,
+    c_uint64,
+)
+from ctypes.util import find_library
+
+_LOGGER = logging.getLogger(__name__)
+
+
+###############################################################################
+# Constants copied from linux/stat.h and linux/fcntl.h
+
+#: Special ``dirfd`` value, resolve paths relative to the working directory.
+AT_FDCWD = -100
+#: Do not follow a trailing symlink.
+AT_SYMLINK_NOFOLLOW = 0x100
+#: Do not trigger automounts.
+AT_NO_AUTOMOUNT = 0x800
+#: Operate on ``dirfd`` itself when the path is empty.
+AT_EMPTY_PATH = 0x1000
+
+#: Want stx_type, stx_mode, ..., stx_blocks.
+STATX_BASIC_STATS = 0x000007ff
+#: Want stx_mnt_id.
+STATX_MNT_ID = 0x00001000
+#: Want the unique (64bit, never reused) stx_mnt_id.
+STATX_MNT_ID_UNIQUE = 0x00004000
+
+#: File is the root of a mount.
+STATX_ATTR_MOUNT_ROOT = 0x00002000
+
+
+###############################################################################
+# Map the C interface
+
+class StatxTimestamp(ctypes.Structure):
+    """struct statx_timestamp
+    """
+    _fields_ = [
+        ('tv_sec', c_int64),
+        ('tv_nsec', c_uint32),
+        ('__reserved', c_int32),
+    ]
+
+
+class Statx(ctypes.Structure):
+    """struct statx
+    """
+    _fields_ = [
+        ('stx_mask', c_uint32),
+        ('stx_blksize', c_uint32),
+        ('stx_attributes', c_uint64),
+        ('stx_nlink', c_uint32),
+        ('stx_uid', c_uint32),
+        ('stx_gid', c_uint32),
+        ('stx_mode', c_uint16),
+        ('__spare0', c_uint16),
+        ('stx_ino', c_uint64),
+        ('stx_size', c_uint64),
+        ('stx_blocks', c_uint64),
+        ('stx_attributes_mask', c_uint64),
+        ('stx_atime', StatxTimestamp),
+        ('stx_btime', StatxTimestamp),
+        ('stx_ctime', StatxTimestamp),
+        ('stx_mtime', StatxTimestamp),
+        ('stx_rdev_major', c_uint32),
+        ('stx_rdev_minor', c_uint32),
+        ('stx_dev_major', c_uint32),
+        ('stx_dev_minor', c_uint32),
+        ('stx_mnt_id', c_uint64),
+        # Newer fields are not used, only reserve the space.
+        ('__spare', c_uint64 * 13),
+    ]
+
+    @property
+    def dev(self):
+        """Device number (``st_dev``) of the file.
+        """
+        return os.makedev(self.stx_dev_major, self.stx_dev_minor)
+
+
+_LIBC_PATH = find_library('c')
+_LIBC = ctypes.CDLL(_LIBC_PATH, use_errno=True)
+
+# int statx(int dirfd, const char *pathname, int flags,
+#           unsigned int mask, struct statx *statxbuf);
+if getattr(_LIBC, 'statx', None) is not None:
+    _STATX_DECL = ctypes.CFUNCTYPE(
+        c_int,
+        c_int,                    # dirfd
+        c_char_p,                 # pathname
+        c_int,                    # flags
+        c_uint,                   # mask
+        ctypes.POINTER(Statx),    # statxbuf
+        use_errno=True
+    )
+    _STATX = _STATX_DECL(('statx', _LIBC))
+else:
+    _STATX = None
+
+
+def statx(path, mask=STATX_BASIC_STATS, flags=0, dirfd=AT_FDCWD):
+    """Get file status.
+
+    :params path:
+        Path of the file, relative to ``dirfd``. Empty, with
+        :data:`AT_EMPTY_PATH` in ``flags``, to get the status of ``dirfd``.
+    :returns:
+        :class:`Statx`, check ``stx_mask`` for the fields actually returned.
+    """
+    if _STATX is None:
+        raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS), path)
+    if not isinstance(path, bytes):
+        path = path.encode()
+
+    buf = Statx()
+    res = _STATX(dirfd, path, flags, mask, ctypes.byref(buf))
+    if res < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+    return buf
+
+
+__all__ = [
+    'AT_EMPTY_PATH',
+    'AT_FDCWD',
+    'AT_NO_AUTOMOUNT',
+    'AT_SYMLINK_NOFOLLOW',
+    'STATX_ATTR_MOUNT_ROOT',
+    'STATX_BASIC_STATS',
+    'STATX_MNT_ID',
+    'STATX_MNT_ID_UNIQUE',
+    'Statx',
+    'statx',
+]
@@ -0,0 +1,272 @@
+"""Supervision of child processes through pidfds (Linux 5.3+).
+
+A :class:`Supervisor` holds a pidfd per child, all registered in a single
+epoll set. The epoll file descriptor becomes readable when any child
+exits, so thousands of children are supervised without a thread per child
+or ``SIGCHLD`` polling, and it plugs into an asyncio loop with
+:meth:`Supervisor.attach`. Signals sent through the pidfd cannot hit a
+recycled pid.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+import select
+import signal
+
+import ctypes
+from ctypes import (
+    c_int,
+    c_long,
+    c_uint,
+    c_void_p,
+)
+from ctypes.util import find_library
+
+from tmsyscall import features
+
+_LOGGER = logging.getLogger(__name__)
+
+# Syscall numbers, the same on all architectures.
+_NR_PIDFD_SEND_SIGNAL = 424
+_NR_PIDFD_OPEN = 434
+
+# waitid(2) idtype selecting a pidfd (Linux 5.4+).
+_P_PIDFD = getattr(os, 'P_PIDFD', 3)
+
+_LIBC_PATH = find_library('c')
+_LIBC = ctypes.CDLL(_LIBC_PATH, use_errno=True)
+
+# long syscall(long number, ...);
+_SYSCALL = _LIBC.syscall
+_SYSCALL.restype = c_long
+
+
+def pidfd_open(pid, flags=0):
+    """Open a pidfd referring to process ``pid``.
+
+    :returns:
+        ``int`` - pidfd, to be closed by the caller.
+    """
+    res = _SYSCALL(c_long(_NR_PIDFD_OPEN), c_int(pid), c_uint(flags))
+    if res < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), 'pidfd_open(%r)' % pid)
+    return res
+
+
+def pidfd_send_signal(pidfd, sig, flags=0):
+    """Send signal ``sig`` to the process referred to by ``pidfd``.
+    """
+    res = _SYSCALL(c_long(_NR_PIDFD_SEND_SIGNAL), c_int(pidfd), c_int(sig),
+                   c_void_p(None), c_uint(flags))
+    if res < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), 'pidfd_send_signal(%r)' % pidfd)
+
+
+class Child(object):
+    """Supervised child process.
+    """
+
+    __slots__ = (
+        'pid',
+        'pidfd',
+        'returncode',
+        'data',
+    )
+
+    def __init__(self, pid, pidfd, data=None):
+        self.pid = pid
+        #: pidfd of the child, ``None`` once reaped.
+        self.pidfd = pidfd
+        #: Exit code, or ``-signal`` if killed, ``None`` while running.
+        self.returncode = None
+        #: Caller data.
+        self.data = data
+
+    def __repr__(self):
+        return '{name}(pid={pid!r}, returncode={returncode!r})'.format(
+            name=self.__class__.__name__,
+            pid=self.pid,
+            returncode=self.returncode,
+        )
+
+
+def _returncode(pid, pidfd):
+    """Reap the exited child, return its returncode (``None`` if it did not
+    exit yet).
+    """
+    if hasattr(os, 'waitid'):
+        res = os.waitid(_P_PIDFD, pidfd, os.WEXITED | os.WNOHANG)
+        if res is None:
+            return None
+        if res.si_code == os.CLD_EXITED:
+            return res.si_status
+        return -res.si_status
+
+    wpid, status = os.waitpid(pid, os.WNOHANG)
+    if wpid == 0:
+        return None
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class Supervisor(object):
+    """Supervise child processes through their pidfds.
+
+    Raises ``ENOSYS`` on kernels without pidfd_open(2).
+    """
+
+    def __init__(self):
+        if not features.supported(features.PIDFD_OPEN):
+            raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS),
+                          features.PIDFD_OPEN)
+        self._epoll = select.epoll()
+        # Child by pidfd.
+        self._children = {}
+        self._loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._children)
+
+    def __iter__(self):
+        return iter(list(self._children.values()))
+
+    def fileno(self):
+        """epoll file descriptor, readable when a child exited.
+        """
+        return self._epoll.fileno()
+
+    def add(self, pid, data=None):
+        """Supervise child ``pid``.
+
+        The pid cannot have been recycled as long as the child was not
+        reaped, so this is race-free for children of this process.
+
+        :returns:
+            :class:`Child`
+        """
+        pidfd = pidfd_open(pid)
+        child = Child(pid, pidfd, data)
+        self._children[pidfd] = child
+        self._epoll.register(pidfd, select.EPOLLIN)
+        return child
+
+    def fork(self, data=None):
+        """Fork a supervised child.
+
+        :returns:
+            ``0`` in the child, the :class:`Child` in the parent.
+        """
+        pid = os.fork()
+        if pid == 0:
+            return 0
+        return self.add(pid, data)
+
+    def kill(self, child, sig=signal.SIGTERM):
+        """Send ``sig`` to ``child``.
+
+        :returns:
+            ``bool`` - False if the child was already reaped.
+        """
+        if child.pidfd is None:
+            return False
+        try:
+            pidfd_send_signal(child.pidfd, sig)
+        except OSError as err:
+            if err.errno == errno.ESRCH:
+                return False
+            raise
+        return True
+
+    def _reap(self, child):
+        returncode = _returncode(child.pid, child.pidfd)
+        if returncode is None:
+            return False
+        child.returncode = returncode
+        self._epoll.unregister(child.pidfd)
+        del self._children[child.pidfd]
+        os.close(child.pidfd)
+        child.pidfd = None
+        return True
+
+    def poll(self, timeout=None):
+        """Wait for children to exit and reap them.
+
+        :params ``float`` timeout:
+            Seconds to wait, ``None`` for ever, ``0`` not to block.
+        :returns:
+            ``list`` of the exited :class:`Child`.
+        """
+        if not self._children:
+            return []
+        exited = []
+        for pidfd, _events in self._epoll.poll(
+                -1 if timeout is None else timeout):
+            child = self._children.get(pidfd)
+            if child is not None and self._reap(child):
+                exited.append(child)
+        return exited
+
+    def wait(self, child, timeout=None):
+        """Wait for ``child`` to exit and reap it.
+
+        :returns:
+            ``int`` - The child returncode, ``None`` on timeout.
+        """
+        if child.pidfd is None:
+            return child.returncode
+        poller = select.poll()
+        poller.register(child.pidfd, select.POLLIN)
+        if poller.poll(None if timeout is None else timeout * 1000):
+            self._reap(child)
+        return child.returncode
+
+    def attach(self, loop, callback):
+        """Deliver the exited children to ``callback(child)`` from the
+        asyncio event ``loop``.
+        """
+        def _ready():
+            for child in self.poll(0):
+                callback(child)
+
+        self.detach()
+        loop.add_reader(self.fileno(), _ready)
+        self._loop = loop
+
+    def detach(self):
+        """Stop delivering events to the asyncio loop.
+        """
+        if self._loop is not None:
+            self._loop.remove_reader(self.fileno())
+            self._loop = None
+
+    def close(self):
+        """Stop supervising, children are neither killed nor reaped.
+        """
+        self.detach()
+        for pidfd in list(self._children):
+            self._children.pop(pidfd).pidfd = None
+            os.close(pidfd)
+        self._epoll.close()
+
+
+__all__ = [
+    'Child',
+    'Supervisor',
+    'pidfd_open',
+    'pidfd_send_signal',
+]
@@ -0,0 +1,204 @@
+"""Pool of pre-mounted tmpfs scratch areas.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+
+from six.moves import queue
+
+from tmsyscall import mount as mount_mod
+from tmsyscall import utils
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TmpfsInstance(object):
+    """Pre-mounted tmpfs, handed out by :class:`TmpfsPool`.
+
+    Can be used as a context manager, which releases it back to its pool.
+    """
+
+    __slots__ = (
+        'path',
+        'size',
+        '_pool',
+        '_spec',
+    )
+
+    def __init__(self, pool, path, spec):
+        #: Mount point of the instance.
+        self.path = path
+        #: Current size limit of the instance, ``None`` if the default.
+        self.size = None
+        self._pool = pool
+        self._spec = spec
+
+    def __repr__(self):
+        return '{name}(path={path!r}, size={size!r})'.format(
+            name=self.__class__.__name__,
+            path=self.path,
+            size=self.size,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self._pool.release(self)
+
+    def mount(self):
+        """Mount a fresh tmpfs on the instance path.
+        """
+        self._spec.apply()
+        self.size = None
+
+    def reset(self):
+        """Drop the instance content by detaching the tmpfs and mounting a
+        fresh one in its place.
+
+        Detaching is immediate, the kernel frees the old tmpfs once it is no
+        longer in use.
+        """
+        mount_mod.unmount(self.path, mount_mod.MNT_DETACH)
+        self.mount()
+
+    def resize(self, size):
+        """Change the size limit of the mounted tmpfs in place.
+        """
+        mount_mod.mount(
+            None, self.path, None,
+            self._spec.mnt_flags | mount_mod.MS_REMOUNT,
+            **mount_mod.tmpfs_options(size=size)
+        )
+        self.size = size
+
+
+class TmpfsPool(object):
+    """Fixed set of tmpfs mounted once under ``base_dir``.
+
+    :meth:`acquire` hands out an idle instance, optionally remounted with a
+    different size. :meth:`release` resets the instance content and makes it
+    available again. Mount and unmount churn is therefore taken off the job
+    path.
+
+    Usage::
+
+        with TmpfsPool('/var/scratch', 8, size='64m') as pool:
+            with pool.acquire(size='256m') as scratch:
+                run_job(scratch.path)
+    """
+
+    __slots__ = (
+        'base_dir',
+        'count',
+        '_idle',
+        '_instances',
+        '_mnt_opts',
+    )
+
+    def __init__(self, base_dir, count, size=None, nr_inodes=None, mode=None,
+                 huge=None, mnt_flags=mount_mod.TMPFS_FLAGS):
+        self.base_dir = base_dir
+        self.count = count
+        self._idle = queue.Queue()
+        self._instances = []
+        self._mnt_opts = (
+            mnt_flags,
+            mount_mod.tmpfs_options(
+                size=size, nr_inodes=nr_inodes, mode=mode, huge=huge
+            )
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def start(self):
+        """Mount all the pool instances.
+        """
+        mnt_flags, mnt_opts = self._mnt_opts
+        for idx in range(len(self._instances), self.count):
+            path = os.path.join(self.base_dir, str(idx))
+            utils.mkdir_safe(path)
+            spec = mount_mod.MountSpec(
+                'tmpfs', path, 'tmpfs', mnt_flags, **mnt_opts
+            )
+            instance = TmpfsInstance(self, path, spec)
+            instance.mount()
+            self._instances.append(instance)
+            self._idle.put(instance)
+
+        _LOGGER.info('Started tmpfs pool %r: %d instances',
+                     self.base_dir, self.count)
+
+    def acquire(self, size=None, timeout=None):
+        """Get an idle instance, waiting up to ``timeout`` seconds for one.
+
+        :params size:
+            If set, the instance is resized, see
+            :func:`tmsyscall.mount.tmpfs_options`.
+        :raises ``queue.Empty``:
+            If no instance became available in time.
+        """
+        instance = self._idle.get(timeout=timeout)
+        if size is not None and size != instance.size:
+            try:
+                instance.resize(size)
+            except OSError:
+                self._idle.put(instance)
+                raise
+        return instance
+
+    def release(self, instance):
+        """Reset an instance and return it to the pool.
+
+        An instance which cannot be reset is unmounted and dropped from the
+        pool.
+        """
+        try:
+            instance.reset()
+        except OSError as err:
+            _LOGGER.warning('Failed to reset %r: %s', instance, err)
+            self._discard(instance)
+            raise
+        self._idle.put(instance)
+
+    def _discard(self, instance):
+        """Unmount ``instance`` and forget it.
+        """
+        try:
+            mount_mod.unmount(instance.path, mount_mod.MNT_DETACH)
+        except OSError as err:
+            # EINVAL: the reset failed after the old tmpfs was detached.
+            if err.errno != errno.EINVAL:
+                _LOGGER.warning('Failed to umount %r: %s', instance.path, err)
+        if instance in self._instances:
+            self._instances.remove(instance)
+        _LOGGER.warning('Dropped %r from tmpfs pool %r, %d instances left',
+                        instance, self.base_dir, len(self._instances))
+
+    def close(self):
+        """Unmount all the instances, in use or not.
+        """
+        for instance in self._instances:
+            try:
+                mount_mod.unmount(instance.path, mount_mod.MNT_DETACH)
+            except OSError as err:
+                _LOGGER.warning('Failed to umount %r: %s', instance.path, err)
+        self._instances = []
+        self._idle = queue.Queue()
+
+
+__all__ = [
+    'TmpfsInstance',
+    'TmpfsPool',
+]
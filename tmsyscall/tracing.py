@@ -0,0 +1,271 @@
+"""Syscall timeline tracing.
+
+Record every mount, umount, unshare, setns and pivot_root call made by
+tmsyscall while a :func:`trace` is active, and export them as Chrome
+trace-event JSON (viewable in ``chrome://tracing`` or Perfetto).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import contextlib
+import ctypes
+import json
+import logging
+import os
+import threading
+import time
+
+from tmsyscall import utils
+
+_LOGGER = logging.getLogger(__name__)
+
+# Currently active traces. Replaced (never mutated) under _LOCK so that the
+# syscall wrappers can check and iterate it without locking.
+_ACTIVE = ()
+_LOCK = threading.Lock()
+
+_gettid = getattr(  # pylint: disable=invalid-name
+    threading, 'get_native_id',
+    lambda: threading.current_thread().ident
+)
+
+
+def _jsonable(value):
+    """Convert a raw syscall argument to a JSON friendly value.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, ctypes._SimpleCData):
+        return _jsonable(value.value)
+    return value
+
+
+class TraceRecord(object):
+    """Single traced system call.
+    """
+
+    __slots__ = (
+        'name',
+        'args',
+        'flags',
+        'start',
+        'end',
+        'pid',
+        'tid',
+        'result',
+        'errno',
+    )
+
+    def __init__(self, name, args, flags, start, end, pid, tid, result,
+                 errno):
+        self.name = name
+        self.args = args
+        self.flags = flags
+        self.start = start
+        self.end = end
+        self.pid = pid
+        self.tid = tid
+        self.result = result
+        self.errno = errno
+
+    def __repr__(self):
+        return (
+            '{name}({call}{args!r}, flags={flags!r}, errno={errno!r}, '
+            'duration={duration:.6f})'
+        ).format(
+            name=self.__class__.__name__,
+            call=self.name,
+            args=self.args,
+            flags=self.flags,
+            errno=self.errno,
+            duration=self.end - self.start,
+        )
+
+    def to_dict(self):
+        """Return the record as a ``dict`` of JSON friendly values.
+        """
+        return {
+            'name': self.name,
+            'args': [_jsonable(arg) for arg in self.args],
+            'flags': self.flags,
+            'start': self.start,
+            'end': self.end,
+            'pid': self.pid,
+            'tid': self.tid,
+            'result': self.result,
+            'errno': self.errno,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a :class:`TraceRecord` from :meth:`to_dict` output.
+        """
+        return cls(
+            data['name'], tuple(data['args']), data['flags'],
+            data['start'], data['end'], data['pid'], data['tid'],
+            data['result'], data['errno']
+        )
+
+    def to_chrome_event(self):
+        """Return the record as a Chrome trace "complete" event.
+        """
+        args = {
+            'args': [_jsonable(arg) for arg in self.args],
+            'flags': self.flags,
+            'result': self.result,
+        }
+        if self.errno:
+            args['errno'] = self.errno
+            args['error'] = os.strerror(self.errno)
+        return {
+            'name': self.name,
+            'cat': 'syscall',
+            'ph': 'X',
+            'ts': self.start * 1e6,
+            'dur': (self.end - self.start) * 1e6,
+            'pid': self.pid,
+            'tid': self.tid,
+            'args': args,
+        }
+
+
+class Trace(object):
+    """Collection of :class:`TraceRecord`.
+
+    If ``path`` is set, every record is also appended to that file as a JSON
+    line, so that calls made by forked children (e.g. after ``unshare``) end
+    up in the same trace; see :meth:`load`.
+    """
+
+    __slots__ = (
+        'records',
+        'path',
+        '_fd',
+    )
+
+    def __init__(self, path=None):
+        self.records = []
+        self.path = path
+        self._fd = None
+        if path is not None:
+            self._fd = os.open(
+                path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC,
+                0o644
+            )
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def add(self, record):
+        """Add a record to the trace.
+        """
+        self.records.append(record)
+        if self._fd is not None:
+            line = json.dumps(record.to_dict()) + '\n'
+            os.write(self._fd, line.encode())
+
+    def close(self):
+        """Close the trace file, if any.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @classmethod
+    def load(cls, path):
+        """Load all the records written to ``path``, by any process.
+        """
+        res = cls()
+        with open(path) as trace_file:
+            for line in trace_file:
+                if line.strip():
+                    res.records.append(TraceRecord.from_dict(json.loads(line)))
+        res.records.sort(key=lambda record: record.start)
+        return res
+
+    def to_chrome_trace(self):
+        """Return the trace in Chrome trace-event format.
+        """
+        return {
+            'traceEvents': [
+                record.to_chrome_event() for record in self.records
+            ],
+            'displayTimeUnit': 'ms',
+        }
+
+    def dump(self, fileobj):
+        """Write the trace as Chrome trace-event JSON to ``fileobj``.
+        """
+        json.dump(self.to_chrome_trace(), fileobj)
+
+
+@contextlib.contextmanager
+def trace(path=None):
+    """Trace all tmsyscall system calls made inside the context.
+
+    Usage::
+
+        with tmsyscall.trace() as setup_trace:
+            setup_process_isolation()
+        with open('setup.json', 'w') as f:
+            setup_trace.dump(f)
+
+    :params `str` path:
+        Optional file to also stream the records to, see :class:`Trace`.
+    :returns:
+        :class:`Trace`
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+
+    res = Trace(path)
+    with _LOCK:
+        _ACTIVE = _ACTIVE + (res, )
+    try:
+        yield res
+    finally:
+        with _LOCK:
+            _ACTIVE = tuple(active for active in _ACTIVE if active is not res)
+        res.close()
+
+
+def syscall(name, func, args, flags=None):
+    """Call ``func(*args)`` and record it in all active traces.
+
+    :params `str` name:
+        System call name.
+    :params ``tuple`` flags:
+        Optional ``(value, enum)`` pair, decoded with
+        :func:`tmsyscall.utils.parse_mask`.
+    :returns:
+        The return value of ``func``.
+    """
+    start = time.time()
+    res = func(*args)
+    end = time.time()
+    errno = ctypes.get_errno() if res < 0 else 0
+
+    if flags is not None:
+        value, mask_enum = flags
+        flags = utils.parse_mask(int(value or 0), mask_enum)
+
+    record = TraceRecord(
+        name, tuple(args), flags, start, end, os.getpid(), _gettid(),
+        res, errno
+    )
+    for active in _ACTIVE:
+        active.add(record)
+
+    return res
+
+
+__all__ = [
+    'Trace',
+    'TraceRecord',
+    'trace',
+]
@@ -6,8 +6,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
+import errno
 import logging
 import os
+import threading
 
 import ctypes
 from ctypes import (
@@ -15,6 +18,16 @@ from ctypes import (
 )
 from ctypes.util import find_library
 
+from concurrent import futures
+from multiprocessing import connection
+
+import enum
+from six.moves import queue
+
+from tmsyscall import backend
+from tmsyscall import features
+from tmsyscall import supervise
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -32,20 +45,24 @@ _UNSHARE_DECL = ctypes.CFUNCTYPE(c_int, c_int, use_errno=True)
 _UNSHARE = _UNSHARE_DECL(('unshare', _LIBC))
 
 _SETNS_DECL = ctypes.CFUNCTYPE(c_int, c_int, c_int, use_errno=True)
-_SETNS = _UNSHARE_DECL(('setns', _LIBC))
+_SETNS = _SETNS_DECL(('setns', _LIBC))
 
 
 def unshare(what):
     """disassociate parts of the process execution context.
     """
-    retcode = _UNSHARE(what)
+    retcode = backend.syscall(
+        'unshare', _UNSHARE, (what, ), (what, CLONEFlags)
+    )
     if retcode != 0:
         errno = ctypes.get_errno()
         raise OSError(errno, os.strerror(errno), what)
 
 
 def setns(fd, flags):
-    retcode = _SETNS(fd, flags)
+    retcode = backend.syscall(
+        'setns', _SETNS, (fd, flags), (flags, CLONEFlags)
+    )
     if retcode != 0:
         errno = ctypes.get_errno()
         raise OSError(errno, os.strerror(errno), fd, flags)
@@ -55,31 +72,425 @@ def setns(fd, flags):
 #
 # See man unshare(2) for more details.
 #
-CLONE_VM = 0x00000100
-CLONE_FS = 0x00000200
-CLONE_FILES = 0x00000400
-CLONE_SIGHAND = 0x00000800
-CLONE_PTRACE = 0x00002000
-CLONE_VFORK = 0x00004000
-CLONE_PARENT = 0x00008000
-CLONE_THREAD = 0x00010000
-CLONE_NEWNS = 0x00020000
-CLONE_SYSVSEM = 0x00040000
-CLONE_SETTLS = 0x00080000
-CLONE_PARENT_SETTID = 0x00100000
-CLONE_CHILD_CLEARTID = 0x00200000
-CLONE_DETACHED = 0x00400000
-CLONE_UNTRACED = 0x00800000
-CLONE_CHILD_SETTID = 0x01000000
-CLONE_NEWUTS = 0x04000000
-CLONE_NEWIPC = 0x08000000
-CLONE_NEWUSER = 0x10000000
-CLONE_NEWPID = 0x20000000
-CLONE_NEWNET = 0x40000000
-CLONE_IO = 0x80000000
+class CLONEFlags(enum.IntEnum):
+    """All clone/unshare flags.
+    """
+    VM = 0x00000100
+    FS = 0x00000200
+    FILES = 0x00000400
+    SIGHAND = 0x00000800
+    PTRACE = 0x00002000
+    VFORK = 0x00004000
+    PARENT = 0x00008000
+    THREAD = 0x00010000
+    NEWNS = 0x00020000
+    SYSVSEM = 0x00040000
+    SETTLS = 0x00080000
+    PARENT_SETTID = 0x00100000
+    CHILD_CLEARTID = 0x00200000
+    DETACHED = 0x00400000
+    UNTRACED = 0x00800000
+    CHILD_SETTID = 0x01000000
+    NEWCGROUP = 0x02000000
+    NEWUTS = 0x04000000
+    NEWIPC = 0x08000000
+    NEWUSER = 0x10000000
+    NEWPID = 0x20000000
+    NEWNET = 0x40000000
+    IO = 0x80000000
+
+
+CLONE_VM = CLONEFlags.VM
+CLONE_FS = CLONEFlags.FS
+CLONE_FILES = CLONEFlags.FILES
+CLONE_SIGHAND = CLONEFlags.SIGHAND
+CLONE_PTRACE = CLONEFlags.PTRACE
+CLONE_VFORK = CLONEFlags.VFORK
+CLONE_PARENT = CLONEFlags.PARENT
+CLONE_THREAD = CLONEFlags.THREAD
+CLONE_NEWNS = CLONEFlags.NEWNS
+CLONE_SYSVSEM = CLONEFlags.SYSVSEM
+CLONE_SETTLS = CLONEFlags.SETTLS
+CLONE_PARENT_SETTID = CLONEFlags.PARENT_SETTID
+CLONE_CHILD_CLEARTID = CLONEFlags.CHILD_CLEARTID
+CLONE_DETACHED = CLONEFlags.DETACHED
+CLONE_UNTRACED = CLONEFlags.UNTRACED
+CLONE_CHILD_SETTID = CLONEFlags.CHILD_SETTID
+CLONE_NEWCGROUP = CLONEFlags.NEWCGROUP
+CLONE_NEWUTS = CLONEFlags.NEWUTS
+CLONE_NEWIPC = CLONEFlags.NEWIPC
+CLONE_NEWUSER = CLONEFlags.NEWUSER
+CLONE_NEWPID = CLONEFlags.NEWPID
+CLONE_NEWNET = CLONEFlags.NEWNET
+CLONE_IO = CLONEFlags.IO
+
+#: Namespace file name, in /proc/<pid>/ns, of each namespace flag. In the
+#: order namespaces must be joined (user namespace first).
+NS_NAMES = collections.OrderedDict([
+    (CLONE_NEWUSER, 'user'),
+    (CLONE_NEWCGROUP, 'cgroup'),
+    (CLONE_NEWIPC, 'ipc'),
+    (CLONE_NEWUTS, 'uts'),
+    (CLONE_NEWNET, 'net'),
+    (CLONE_NEWPID, 'pid'),
+    (CLONE_NEWNS, 'mnt'),
+])
+
+#: Namespaces which can be joined by a single thread of a process.
+THREAD_NAMESPACES = CLONE_NEWNET | CLONE_NEWUTS | CLONE_NEWIPC
+
+
+def open_ns(pid, nstype):
+    """Open the namespace ``nstype`` (a ``CLONE_NEW*`` flag) of process
+    ``pid``.
+
+    :returns:
+        ``int`` - Namespace file descriptor, usable with :func:`setns`.
+    """
+    return os.open(
+        '/proc/%d/ns/%s' % (pid, NS_NAMES[nstype]),
+        os.O_RDONLY | os.O_CLOEXEC
+    )
+
+
+def _write_id_map(pid, name, id_map):
+    """Write ``id_map``, a list of ``(inside, outside, count)`` ranges, to
+    /proc/<pid>/<name>.
+    """
+    data = ''.join('%d %d %d\n' % tuple(id_range) for id_range in id_map)
+    with open('/proc/%d/%s' % (pid, name), 'w') as map_file:
+        map_file.write(data)
+
+
+def userns_fd(uid_map, gid_map=None):
+    """Create a user namespace with the given ID mappings.
+
+    The namespace is created by a short-lived child process and is kept
+    alive by the returned file descriptor, e.g. to be used with
+    :func:`tmsyscall.fsmount.idmapped_bind`.
+
+    :params ``list`` uid_map:
+        ``(inside, outside, count)`` user ID ranges.
+    :params ``list`` gid_map:
+        ``(inside, outside, count)`` group ID ranges, defaults to
+        ``uid_map``.
+    :returns:
+        ``int`` - User namespace file descriptor, to be closed by the caller.
+    """
+    if gid_map is None:
+        gid_map = uid_map
+
+    ready_r, ready_w = os.pipe()
+    done_r, done_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(ready_r)
+            os.close(done_w)
+            unshare(CLONE_NEWUSER)
+            os.write(ready_w, b'.')
+            # Live until the parent got hold of the namespace.
+            os.read(done_r, 1)
+            code = 0
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+
+    os.close(ready_w)
+    os.close(done_r)
+    try:
+        if not os.read(ready_r, 1):
+            raise OSError(errno.EPERM, 'Unable to create user namespace')
+        _write_id_map(pid, 'uid_map', uid_map)
+        _write_id_map(pid, 'gid_map', gid_map)
+        return open_ns(pid, CLONE_NEWUSER)
+    finally:
+        os.close(ready_r)
+        os.close(done_w)
+        os.waitpid(pid, 0)
+
+
+def _open_namespaces(pid, namespaces):
+    """Open all the ``namespaces`` of ``pid``, in the order they must be
+    joined (user namespace first).
+
+    When setns(2) accepts pidfds (Linux 5.8+), a single pidfd joins all the
+    namespaces atomically, in one call.
+
+    :returns:
+        ``list`` of ``(nstype, fd)``, ``nstype`` possibly combining several
+        ``CLONE_NEW*`` flags.
+    """
+    if features.supported(features.SETNS_PIDFD):
+        nstypes = 0
+        for nstype in NS_NAMES:
+            nstypes |= namespaces & nstype
+        return [(nstypes, supervise.pidfd_open(pid))] if nstypes else []
+
+    nsfds = []
+    try:
+        for nstype in NS_NAMES:
+            if namespaces & nstype:
+                nsfds.append((nstype, open_ns(pid, nstype)))
+    except OSError:
+        _close_namespaces(nsfds)
+        raise
+    return nsfds
+
+
+def _close_namespaces(nsfds):
+    for _nstype, nsfd in nsfds:
+        os.close(nsfd)
+
+
+def _run(work):
+    """Run a ``(future, func, args, kwargs)`` work item in this thread.
+    """
+    future, func, args, kwargs = work
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(func(*args, **kwargs))
+    except BaseException as err:  # pylint: disable=broad-except
+        future.set_exception(err)
+
+
+class _NamespaceThread(threading.Thread):
+    """Worker thread pinned to thread-joinable namespaces.
+    """
+
+    def __init__(self, nsfds, work_queue):
+        super(_NamespaceThread, self).__init__(name='setns-worker')
+        self.daemon = True
+        self.ready = futures.Future()
+        self._nsfds = nsfds
+        self._queue = work_queue
+
+    def run(self):
+        try:
+            for nstype, nsfd in self._nsfds:
+                setns(nsfd, nstype)
+        except OSError as err:
+            self.ready.set_exception(err)
+            return
+        self.ready.set_result(self.name)
+
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            _run(work)
+
+
+class _NamespaceProcess(object):
+    """Long-lived forked helper holding namespaces that can only be joined
+    by a single-threaded process (e.g. the mount namespace).
+
+    Work is pickled to the helper over a pipe, by a dispatcher thread
+    started with :meth:`start`.
+    """
+
+    def __init__(self, nsfds, work_queue):
+        self._queue = work_queue
+        self._conn, child_conn = connection.Pipe()
+        self.pid = os.fork()
+        if self.pid == 0:
+            self._conn.close()
+            self._child(nsfds, child_conn)
+        child_conn.close()
+
+        status, value = self._conn.recv()
+        if status != 'ok':
+            os.waitpid(self.pid, 0)
+            raise value
+        self._dispatcher = None
+
+    def start(self):
+        """Start dispatching work to the helper.
+        """
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name='setns-dispatcher'
+        )
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    @staticmethod
+    def _child(nsfds, conn):
+        """Helper process main loop, never returns.
+        """
+        code = 1
+        try:
+            try:
+                for nstype, nsfd in nsfds:
+                    setns(nsfd, nstype)
+                os.chdir('/')
+            except OSError as err:
+                conn.send(('error', err))
+                return
+            conn.send(('ok', os.getpid()))
+
+            while True:
+                try:
+                    work = conn.recv()
+                except EOFError:
+                    break
+                if work is None:
+                    break
+                func, args, kwargs = work
+                try:
+                    res = ('ok', func(*args, **kwargs))
+                except BaseException as err:  # pylint: disable=broad-except
+                    res = ('error', err)
+                try:
+                    conn.send(res)
+                except Exception as err:  # pylint: disable=broad-except
+                    conn.send(('error', RuntimeError(
+                        'Unable to send result: %r' % (err, )
+                    )))
+            code = 0
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+
+    def _dispatch(self):
+        while True:
+            work = self._queue.get()
+            if work is None:
+                break
+            future, func, args, kwargs = work
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                self._conn.send((func, args, kwargs))
+                status, value = self._conn.recv()
+            except Exception as err:  # pylint: disable=broad-except
+                future.set_exception(err)
+                continue
+            if status == 'ok':
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        self._stop()
+
+    def _stop(self):
+        try:
+            self._conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self._conn.close()
+
+    def join(self):
+        if self._dispatcher is None:
+            self._stop()
+        else:
+            self._dispatcher.join()
+        os.waitpid(self.pid, 0)
+
+
+class NamespaceExecutor(object):
+    """Run callables inside the namespaces of another process.
+
+    :meth:`submit` runs in persistent threads which joined the
+    :data:`THREAD_NAMESPACES` (net, uts, ipc) of the target, so no process
+    is created per call.
+
+    :meth:`submit_mount` runs in long-lived helper processes which joined
+    all the requested namespaces, including the mount namespace (which a
+    multi-threaded process cannot join). The callable, its arguments and
+    its result must be picklable.
+
+    Both return :class:`concurrent.futures.Future`.
+
+    :params ``int`` pid:
+        Process whose namespaces to join.
+    :params ``int`` namespaces:
+        ``CLONE_NEW*`` flags of the namespaces to join.
+    :params ``int`` threads:
+        Number of worker threads.
+    :params ``int`` processes:
+        Number of helper processes, ``0`` to disable :meth:`submit_mount`.
+    """
+
+    def __init__(self, pid, namespaces=THREAD_NAMESPACES | CLONE_NEWNS,
+                 threads=1, processes=1):
+        self.pid = pid
+        self.namespaces = namespaces
+        self._thread_queue = queue.Queue()
+        self._process_queue = queue.Queue()
+        self._threads = []
+        self._processes = []
+
+        nsfds = _open_namespaces(pid, namespaces)
+        try:
+            # All the helpers are forked before any thread (dispatcher or
+            # worker) is started.
+            for _ in range(processes):
+                self._processes.append(
+                    _NamespaceProcess(nsfds, self._process_queue)
+                )
+            for helper in self._processes:
+                helper.start()
+
+            thread_nsfds = [
+                (nstype & THREAD_NAMESPACES, nsfd) for (nstype, nsfd) in nsfds
+                if nstype & THREAD_NAMESPACES
+            ]
+            for _ in range(threads if thread_nsfds else 0):
+                worker = _NamespaceThread(thread_nsfds, self._thread_queue)
+                worker.start()
+                self._threads.append(worker)
+            for worker in self._threads:
+                worker.ready.result()
+        except Exception:
+            self.shutdown()
+            raise
+        finally:
+            _close_namespaces(nsfds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.shutdown()
+
+    def submit(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` in a thread inside the target net,
+        uts and ipc namespaces.
+        """
+        if not self._threads:
+            raise ValueError('No thread-joinable namespace to run in')
+        future = futures.Future()
+        self._thread_queue.put((future, func, args, kwargs))
+        return future
+
+    def submit_mount(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` in a helper process inside all the
+        target namespaces, including the mount namespace.
+        """
+        if not self._processes:
+            raise ValueError('Executor started without helper processes')
+        future = futures.Future()
+        self._process_queue.put((future, func, args, kwargs))
+        return future
+
+    def shutdown(self):
+        """Stop all the workers, after the already submitted work is done.
+        """
+        for _ in self._threads:
+            self._thread_queue.put(None)
+        for _ in self._processes:
+            self._process_queue.put(None)
+        for worker in self._threads:
+            worker.join()
+        for worker in self._processes:
+            worker.join()
+        self._threads = []
+        self._processes = []
+
 
 ###############################################################################
 __all__ = [
+    'CLONEFlags',
     'CLONE_VM',
     'CLONE_FS',
     'CLONE_FILES',
@@ -96,12 +507,18 @@ __all__ = [
     'CLONE_DETACHED',
     'CLONE_UNTRACED',
     'CLONE_CHILD_SETTID',
+    'CLONE_NEWCGROUP',
     'CLONE_NEWUTS',
     'CLONE_NEWIPC',
     'CLONE_NEWUSER',
     'CLONE_NEWPID',
     'CLONE_NEWNET',
     'CLONE_IO',
+    'NS_NAMES',
+    'NamespaceExecutor',
+    'THREAD_NAMESPACES',
+    'open_ns',
     'setns',
-    'unshare'
+    'unshare',
+    'userns_fd',
 ]
@@ -10,7 +10,12 @@ import collections
 import logging
 import os.path
 import errno
+import threading
+
 import six
+from six.moves import queue
+
+from tmsyscall import statx
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -76,9 +81,235 @@ def mkdir_safe(path, mode=0o777):
             raise
 
 
+def mkfile_safe(path, mode=0o644):
+    """Creates an empty file (e.g. a bind mount point), if there is any
+    error, aborts the process.
+
+    :param ``str`` path:
+        Path to the file to create. All intermediary folders will be
+        created.
+    :return ``Bool``:
+        ``True`` - if the file was created.
+        ``False`` - if the file already existed.
+    """
+    mkdir_safe(os.path.dirname(path))
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW,
+                     mode)
+        os.close(fd)
+        return True
+    except OSError as err:
+        # If file already exists, no problem. Otherwise raise
+        if err.errno == errno.EEXIST and os.path.isfile(path) and \
+                not os.path.islink(path):
+            return False
+        else:
+            raise
+
+
+
+# Flags of the directories opened by rmtree_safe().
+_RM_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+
+
+def _is_mount_boundary(fd, dev):
+    """Check whether directory ``fd`` is not on device ``dev`` or is the root
+    of a mount (e.g. a bind mount of the same filesystem).
+    """
+    try:
+        stx = statx.statx('', 0, statx.AT_EMPTY_PATH, fd)
+    except OSError as err:
+        if err.errno != errno.ENOSYS:
+            raise
+        return os.fstat(fd).st_dev != dev
+    return stx.dev != dev or bool(
+        stx.stx_attributes_mask & stx.stx_attributes &
+        statx.STATX_ATTR_MOUNT_ROOT
+    )
+
+
+class _RmNode(object):
+    """Directory being removed by :class:`_RmTree`.
+    """
+
+    __slots__ = (
+        'name',
+        'parent',
+        'fd',
+        'pending',
+    )
+
+    def __init__(self, name, parent, fd=None):
+        self.name = name
+        self.parent = parent
+        self.fd = fd
+        #: Subdirectories not removed yet.
+        self.pending = 0
+
+
+class _RmTree(object):
+    """Parallel removal of a directory tree.
+
+    Workers take directories from a LIFO queue (depth first, which bounds
+    the number of open directories), unlink their files and queue their
+    subdirectories. The last removed subdirectory of a directory removes
+    the directory itself.
+    """
+
+    def __init__(self, path, dev, workers):
+        self.path = path
+        self.dev = dev
+        self.workers = workers
+        self.errors = []
+        self._queue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._open = set()
+
+    def _path(self, node):
+        parts = []
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return os.path.join(self.path, *reversed(parts))
+
+    def _push(self, node):
+        with self._lock:
+            self._active += 1
+        self._queue.put(node)
+
+    def _close(self, node):
+        with self._lock:
+            self._open.discard(node)
+        os.close(node.fd)
+        node.fd = None
+
+    def _scan(self, node):
+        if node.fd is None:
+            node.fd = os.open(node.name, _RM_DIR_FLAGS, dir_fd=node.parent.fd)
+            with self._lock:
+                self._open.add(node)
+            if _is_mount_boundary(node.fd, self.dev):
+                raise OSError(errno.EBUSY, 'Refusing to cross mount point',
+                              self._path(node))
+
+        subdirs = []
+        for entry in os.scandir(node.fd):
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+                continue
+            try:
+                os.unlink(entry.name, dir_fd=node.fd)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+
+        node.pending = len(subdirs)
+        if not subdirs:
+            self._finish(node)
+        for name in subdirs:
+            self._push(_RmNode(name, node))
+
+    def _finish(self, node):
+        """Remove the emptied ``node``, then its parents as they empty.
+        """
+        while True:
+            self._close(node)
+            parent = node.parent
+            if parent is None:
+                os.rmdir(self.path)
+                return
+            os.rmdir(node.name, dir_fd=parent.fd)
+            with self._lock:
+                parent.pending -= 1
+                if parent.pending:
+                    return
+            node = parent
+
+    def _work(self):
+        while True:
+            node = self._queue.get()
+            if node is None:
+                return
+            try:
+                self._scan(node)
+            except OSError as err:
+                _LOGGER.debug('Failed to remove %r: %s', self._path(node), err)
+                with self._lock:
+                    self.errors.append(err)
+            with self._lock:
+                self._active -= 1
+                done = not self._active
+            if done:
+                for _ in range(self.workers):
+                    self._queue.put(None)
+
+    def run(self, root):
+        """Remove the tree of ``root``.
+        """
+        with self._lock:
+            self._open.add(root)
+        self._push(root)
+        threads = []
+        for _ in range(self.workers - 1):
+            thread = threading.Thread(target=self._work, name='rmtree')
+            try:
+                thread.start()
+            except RuntimeError as err:
+                # Out of threads: carry on with the ones we have, if need be
+                # serially in this thread.
+                _LOGGER.warning('Failed to start rmtree worker: %s, '
+                                'continuing with %d', err, len(threads) + 1)
+                break
+            threads.append(thread)
+        # Only as many workers to stop as were started.
+        self.workers = len(threads) + 1
+        self._work()
+        for thread in threads:
+            thread.join()
+        # Directories left behind by errors.
+        for node in list(self._open):
+            self._close(node)
+
+
+def rmtree_safe(path, workers=4):
+    """Recursively remove the directory ``path``, in parallel.
+
+    Files are removed relative to directory fds, symlinks are never followed
+    and mount points are never crossed: a subtree which is on another
+    device, or is the root of a mount, is left in place and makes the call
+    fail with ``EBUSY`` (the rest of the tree is removed).
+
+    :param ``str`` path:
+        Directory to remove.
+    :param ``int`` workers:
+        Number of threads removing subdirectories in parallel, ``1`` (or
+        less) for a serial walk in the calling thread. Falls back to fewer
+        threads when they cannot be created.
+    :raises ``OSError``:
+        The first error met, once everything else was removed.
+    """
+    root_fd = os.open(path, _RM_DIR_FLAGS)
+    dev = os.fstat(root_fd).st_dev
+    try:
+        if _is_mount_boundary(root_fd, dev):
+            raise OSError(errno.EBUSY, 'Refusing to remove a mount point',
+                          path)
+    except OSError:
+        os.close(root_fd)
+        raise
+
+    rmtree = _RmTree(path, dev, max(workers, 1))
+    rmtree.run(_RmNode(None, None, root_fd))
+    if rmtree.errors:
+        raise rmtree.errors[0]
+
+
 __all__ = [
     'get_iterable',
     'norm_safe',
     'parse_mask',
-    'mkdir_safe'
+    'mkdir_safe',
+    'mkfile_safe',
+    'rmtree_safe',
 ]
@@ -0,0 +1,64 @@
+"""Wrappers for the sethostname(2) and setdomainname(2) system calls.
+
+Used to set up a new UTS namespace without spawning ``hostname``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import os
+
+import ctypes
+from ctypes import (
+    c_int, c_char_p, c_size_t,
+)
+from ctypes.util import find_library
+
+_LOGGER = logging.getLogger(__name__)
+
+
+###############################################################################
+# Map the C interface
+
+_LIBC_PATH = find_library('c')
+_LIBC = ctypes.CDLL(_LIBC_PATH, use_errno=True)
+
+if (getattr(_LIBC, 'sethostname', None) is None or
+        getattr(_LIBC, 'setdomainname', None) is None):
+    raise ImportError('Unsupported libc version found: %s' % _LIBC_PATH)
+
+# int sethostname(const char *name, size_t len);
+# int setdomainname(const char *name, size_t len);
+_SETNAME_DECL = ctypes.CFUNCTYPE(c_int, c_char_p, c_size_t, use_errno=True)
+_SETHOSTNAME = _SETNAME_DECL(('sethostname', _LIBC))
+_SETDOMAINNAME = _SETNAME_DECL(('setdomainname', _LIBC))
+
+
+def _setname(func, name, call):
+    if not isinstance(name, bytes):
+        name = name.encode()
+    retcode = func(name, len(name))
+    if retcode != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), '%s(%r)' % (call, name))
+
+
+def sethostname(name):
+    """Set the host name of the current UTS namespace.
+    """
+    _setname(_SETHOSTNAME, name, 'sethostname')
+
+
+def setdomainname(name):
+    """Set the NIS domain name of the current UTS namespace.
+    """
+    _setname(_SETDOMAINNAME, name, 'setdomainname')
+
+
+__all__ = [
+    'setdomainname',
+    'sethostname',
+]